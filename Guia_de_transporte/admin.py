@@ -4,7 +4,21 @@ Configura a interface de administração do Django para os modelos da aplicaçã
 incluindo customizações como campos de exibição, filtros e busca.
 """
 from django.contrib import admin
-from .models import GuiaDeTransporte, TransportItem
+from .models import Guia, GuiaDeTransporte, TransportItem
+
+class GuiaLinhaInline(admin.TabularInline):
+    model = GuiaDeTransporte
+    fields = ('ordem', 'item', 'descricao', 'quantidade', 'quantidade_total', 'peso', 'volume', 'em_falta', 'notas')
+    ordering = ('ordem', 'id')
+    extra = 0
+
+# Registro do documento (cabeçalho) com as linhas
+@admin.register(Guia)
+class GuiaAdmin(admin.ModelAdmin):
+    list_display = ('numero', 'data', 'origem', 'destino', 'peso', 'volume', 'em_falta', 'username', 'created_at')
+    search_fields = ('numero', 'origem', 'destino', 'username')
+    readonly_fields = ('peso', 'volume', 'em_falta')
+    inlines = [GuiaLinhaInline]
 
 # Registro customizado do modelo GuiaDeTransporte
 @admin.register(GuiaDeTransporte)
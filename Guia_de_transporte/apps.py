@@ -9,3 +9,6 @@ from django.apps import AppConfig
 class GuiaDeTransporteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Guia_de_transporte'
+
+    def ready(self):
+        from . import signals  # noqa: F401
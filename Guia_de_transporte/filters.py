@@ -0,0 +1,71 @@
+"""
+Filtros das listagens de GuiaDeTransporte e TransportItem (django-filter).
+"""
+from datetime import datetime, time, timedelta
+
+import django_filters
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import GuiaDeTransporte, TransportItem
+
+
+class QuantidadesFilter(django_filters.FilterSet):
+    """
+    - ``item``: parte do nome do item (sem distinguir maiúsculas).
+    - ``user``: registos do utilizador (``current_user`` e, nas guias, ``username``).
+    - ``created_at_inicio`` / ``created_at_fim``: janela de datas; uma data sem hora no
+      fim inclui o dia todo.
+    - ``com_falta``: ``true`` só as linhas com falta, ``false`` só as completas.
+    """
+    item = django_filters.CharFilter(lookup_expr='icontains')
+    user = django_filters.CharFilter(method='filtrar_user')
+    created_at_inicio = django_filters.CharFilter(method='filtrar_data')
+    created_at_fim = django_filters.CharFilter(method='filtrar_data')
+    com_falta = django_filters.BooleanFilter(method='filtrar_falta')
+
+    campos_user = ('current_user',)
+
+    def filtrar_user(self, queryset, name, value):
+        filtro = Q()
+        for campo in self.campos_user:
+            filtro |= Q(**{campo: value})
+        return queryset.filter(filtro)
+
+    def filtrar_data(self, queryset, name, value):
+        campo, limite = name.rsplit('_', 1)
+        try:
+            dia = parse_date(value)
+            valor = parse_datetime(value) if dia is None else None
+        except ValueError:  # Well formed but out of range (e.g. month 13)
+            dia = valor = None
+        if valor is None and dia is None:
+            raise ValidationError({name: "Data inválida; use AAAA-MM-DD ou ISO 8601."})
+        if dia is not None:
+            if limite == 'fim':
+                proximo = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time()))
+                return queryset.filter(**{f'{campo}__lt': proximo})
+            valor = datetime.combine(dia, time())
+        if timezone.is_naive(valor):
+            valor = timezone.make_aware(valor)
+        lookup = 'gte' if limite == 'inicio' else 'lte'
+        return queryset.filter(**{f'{campo}__{lookup}': valor})
+
+    def filtrar_falta(self, queryset, name, value):
+        return queryset.filter(em_falta__gt=0) if value else queryset.filter(em_falta=0)
+
+
+class GuiaDeTransporteFilter(QuantidadesFilter):
+    campos_user = ('username', 'current_user')
+
+    class Meta:
+        model = GuiaDeTransporte
+        fields = ['item', 'unidade', 'username', 'current_user', 'guia']
+
+
+class TransportItemFilter(QuantidadesFilter):
+    class Meta:
+        model = TransportItem
+        fields = ['item', 'unidade', 'current_user']
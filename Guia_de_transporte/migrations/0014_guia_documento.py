@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Guia_de_transporte', '0013_guiadetransporte_imagem_blob_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Guia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.CharField(blank=True, max_length=50, null=True, unique=True)),
+                ('data', models.DateField(blank=True, null=True)),
+                ('origem', models.CharField(blank=True, max_length=255, null=True)),
+                ('destino', models.CharField(blank=True, max_length=255, null=True)),
+                ('notas', models.TextField(blank=True, null=True)),
+                ('peso', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('em_falta', models.IntegerField(default=0)),
+                ('username', models.CharField(blank=True, max_length=150, null=True)),
+                ('current_user', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Guia (documento)',
+                'verbose_name_plural': 'Guias (documentos)',
+            },
+        ),
+        migrations.AddField(
+            model_name='guiadetransporte',
+            name='ordem',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='guiadetransporte',
+            name='guia',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='linhas', to='Guia_de_transporte.guia'),
+        ),
+    ]
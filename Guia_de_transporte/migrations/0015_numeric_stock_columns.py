@@ -0,0 +1,133 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+LOTE = 1000
+MODELOS = ('GuiaDeTransporte', 'TransportItem')
+LIMITE_TOTAL = Decimal('1e10')  # max_digits=12, decimal_places=2
+LIMITE_EM_FALTA = Decimal(2 ** 31)  # IntegerField: até 2**31 - 1
+
+
+def _temporario(campo):
+    return f'{campo}_numerico'
+
+
+def _decimal(texto, limite=LIMITE_TOTAL):
+    """
+    Decimal de um texto como "12", "12.5", "1.234,56", "1,234.56" ou "12 €"; ``None`` se não
+    for um número ou se não for menor que ``limite`` em valor absoluto.
+    """
+    texto = str(texto).replace('€', '').replace(' ', '').strip()
+    if texto.rfind(',') > texto.rfind('.'):
+        # Decimal comma ("1.234,56"): the dots are thousands separators
+        texto = texto.replace('.', '').replace(',', '.')
+    else:
+        texto = texto.replace(',', '')
+    try:
+        valor = Decimal(texto)
+    except InvalidOperation:
+        return None
+    return valor if valor.is_finite() and abs(valor) < limite else None
+
+
+def converter_quantidades(apps, schema_editor):
+    """
+    Converte ``em_falta`` e ``total`` de texto para número. Um ``em_falta`` vazio, que não é
+    um número inteiro ou que não cabe numa coluna integer volta a ser calculado pelas
+    quantidades; um ``total`` que não é um número (ou demasiado grande) fica 0. Os valores
+    que não foi possível converter são listados no fim.
+    """
+    for nome in MODELOS:
+        Modelo = apps.get_model('Guia_de_transporte', nome)
+        campos = [_temporario('em_falta'), _temporario('total')]
+        pendentes, falhadas = [], []
+        linhas = Modelo.objects.only('pk', 'quantidade', 'quantidade_total', 'em_falta', 'total')
+        for linha in linhas.order_by('pk').iterator(chunk_size=LOTE):
+            falhas = {}
+            calculado = Decimal(max((linha.quantidade or 0) - (linha.quantidade_total or 0), 0))
+            em_falta = _decimal(linha.em_falta, LIMITE_EM_FALTA) if linha.em_falta not in (None, '') else calculado
+            if em_falta is None or em_falta != em_falta.to_integral_value() or em_falta < 0:
+                falhas['em_falta'] = linha.em_falta
+                em_falta = calculado
+            total = _decimal(linha.total) if linha.total not in (None, '') else Decimal('0')
+            if total is None:
+                falhas['total'] = linha.total
+                total = Decimal('0')
+
+            setattr(linha, _temporario('em_falta'), int(em_falta))
+            setattr(linha, _temporario('total'), total.quantize(Decimal('0.01')))
+            if falhas:
+                falhadas.append((linha.pk, falhas))
+            pendentes.append(linha)
+            if len(pendentes) >= LOTE:
+                Modelo.objects.bulk_update(pendentes, campos)
+                pendentes = []
+        if pendentes:
+            Modelo.objects.bulk_update(pendentes, campos)
+
+        if falhadas:
+            print(f"\n  {len(falhadas)} {nome} rows had values that could not be converted "
+                  f"(em_falta recomputed from the quantities, total set to 0):")
+            for pk, falhas in falhadas:
+                detalhe = ', '.join(f'{campo}={texto!r}' for campo, texto in falhas.items())
+                print(f"    {nome} {pk}: {detalhe}")
+
+
+def reverter_quantidades(apps, schema_editor):
+    """Volta a escrever ``em_falta`` e ``total`` como texto."""
+    for nome in MODELOS:
+        Modelo = apps.get_model('Guia_de_transporte', nome)
+        pendentes = []
+        for linha in Modelo.objects.order_by('pk').iterator(chunk_size=LOTE):
+            linha.em_falta = str(getattr(linha, _temporario('em_falta')))
+            linha.total = format(getattr(linha, _temporario('total')).normalize(), 'f')
+            pendentes.append(linha)
+            if len(pendentes) >= LOTE:
+                Modelo.objects.bulk_update(pendentes, ['em_falta', 'total'])
+                pendentes = []
+        if pendentes:
+            Modelo.objects.bulk_update(pendentes, ['em_falta', 'total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Guia_de_transporte', '0014_guia_documento'),
+    ]
+
+    operations = [
+        *[
+            operacao
+            for modelo in ('guiadetransporte', 'transportitem')
+            for operacao in (
+                migrations.AddField(
+                    model_name=modelo,
+                    name=_temporario('em_falta'),
+                    field=models.IntegerField(default=0),
+                ),
+                migrations.AddField(
+                    model_name=modelo,
+                    name=_temporario('total'),
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            )
+        ],
+        migrations.RunPython(converter_quantidades, reverter_quantidades),
+        *[
+            operacao
+            for modelo in ('guiadetransporte', 'transportitem')
+            for campo in ('em_falta', 'total')
+            for operacao in (
+                migrations.RemoveField(model_name=modelo, name=campo),
+                migrations.RenameField(model_name=modelo, old_name=_temporario(campo), new_name=campo),
+            )
+        ],
+        migrations.AddIndex(
+            model_name='guiadetransporte',
+            index=models.Index(condition=models.Q(('em_falta__gt', 0)), fields=['item', 'unidade'], include=('em_falta',), name='guia_em_falta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportitem',
+            index=models.Index(condition=models.Q(('em_falta__gt', 0)), fields=['item', 'unidade'], include=('em_falta',), name='transportitem_em_falta_idx'),
+        ),
+    ]
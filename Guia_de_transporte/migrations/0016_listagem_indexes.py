@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Guia_de_transporte', '0015_numeric_stock_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guiadetransporte',
+            index=models.Index(fields=['username', 'created_at'], name='guia_username_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guiadetransporte',
+            index=models.Index(fields=['current_user', 'created_at'], name='guia_user_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guiadetransporte',
+            index=models.Index(fields=['created_at'], name='guia_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportitem',
+            index=models.Index(fields=['current_user', 'created_at'], name='transportitem_user_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportitem',
+            index=models.Index(fields=['created_at'], name='transportitem_data_idx'),
+        ),
+    ]
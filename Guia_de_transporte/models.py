@@ -2,10 +2,40 @@
 Documento de Modelos para Guia de Transporte.
 Define a estrutura de dados para as Guias de Transporte,
 incluindo campos como item, descrição, unidade, quantidade, notas e volume.
+Uma ``Guia`` é o documento (cabeçalho) e as suas linhas são registos ``GuiaDeTransporte``.
 """
 from django.db import models
+from blobstore.models import Blob
+
+class Guia(models.Model):
+    """
+    Cabeçalho de uma guia de transporte. ``peso``, ``volume`` e ``em_falta`` são os totais
+    das linhas, recalculados sempre que uma linha é gravada ou removida (ver services.py).
+    """
+    numero = models.CharField(max_length=50, unique=True, null=True, blank=True)
+    data = models.DateField(null=True, blank=True)
+    origem = models.CharField(max_length=255, blank=True, null=True)
+    destino = models.CharField(max_length=255, blank=True, null=True)
+    notas = models.TextField(blank=True, null=True)
+    peso = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    volume = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    em_falta = models.IntegerField(default=0)
+    username = models.CharField(max_length=150, blank=True, null=True)
+    current_user = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Guia (documento)'
+        verbose_name_plural = 'Guias (documentos)'
+
+    def __str__(self):
+        return self.numero or f"Guia {self.pk}"
 
 class GuiaDeTransporte(models.Model):
+    guia = models.ForeignKey(Guia, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='linhas')  # Documento a que a linha pertence (opcional)
+    ordem = models.PositiveIntegerField(default=0)  # Posição da linha na guia
     item = models.CharField(max_length=100)
     descricao = models.TextField()
     unidade = models.CharField(max_length=50, default='UN')  # Campo adicionado
@@ -14,9 +44,11 @@ class GuiaDeTransporte(models.Model):
     peso = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Campo adicionado
     volume = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Campo adicionado
     notas = models.TextField(blank=True, null=True)
-    em_falta = models.CharField(max_length=255, null=True, blank=True)
-    total = models.CharField(max_length=50, default='0')
+    em_falta = models.IntegerField(default=0)  # max(quantidade - quantidade_total, 0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     imagem = models.TextField(blank=True, null=True)  # Campo adicionado do TransportItem
+    imagem_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True,
+                                    related_name='+')  # Imagem no armazenamento de blobs
     username = models.CharField(max_length=150, blank=True, null=True)  # Campo para registrar o usuário
     current_user = models.CharField(max_length=255, blank=True, null=True)  # Campo para rastrear o usuário atual
     created_at = models.DateTimeField(auto_now_add=True)
@@ -26,6 +58,15 @@ class GuiaDeTransporte(models.Model):
         db_table = 'guia_de_transporte_guiadetransporte'
         verbose_name = 'Guia de Transporte'
         verbose_name_plural = 'Guias de Transporte'
+        indexes = [
+            # Relatório de faltas: só as linhas com falta, lidas sem ir à tabela
+            models.Index(fields=['item', 'unidade'], include=['em_falta'],
+                         condition=models.Q(em_falta__gt=0), name='guia_em_falta_idx'),
+            # Listagens: filtro por utilizador e janela de datas, ordenadas por created_at
+            models.Index(fields=['username', 'created_at'], name='guia_username_data_idx'),
+            models.Index(fields=['current_user', 'created_at'], name='guia_user_data_idx'),
+            models.Index(fields=['created_at'], name='guia_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.item} - {self.descricao[:50]}"
@@ -36,13 +77,23 @@ class TransportItem(models.Model):
     unidade = models.CharField(max_length=50, default='UN')
     quantidade = models.IntegerField(default=0)
     quantidade_total = models.IntegerField(default=0)  # Nova quantidade total
-    em_falta = models.CharField(max_length=50, default='0')
-    total = models.CharField(max_length=50, default='0')
+    em_falta = models.IntegerField(default=0)  # max(quantidade - quantidade_total, 0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     notas = models.TextField(blank=True, null=True)
     imagem = models.TextField(blank=True, null=True)  # Base64 encoded image
+    imagem_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True,
+                                    related_name='+')  # Imagem no armazenamento de blobs
     current_user = models.CharField(max_length=255, blank=True, null=True)  # Campo para rastrear o usuário atual
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'unidade'], include=['em_falta'],
+                         condition=models.Q(em_falta__gt=0), name='transportitem_em_falta_idx'),
+            models.Index(fields=['current_user', 'created_at'], name='transportitem_user_data_idx'),
+            models.Index(fields=['created_at'], name='transportitem_data_idx'),
+        ]
+
     def __str__(self):
         return f"{self.item} - {self.descricao}"
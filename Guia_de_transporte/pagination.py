@@ -0,0 +1,10 @@
+"""
+Paginação por cursor das listagens de GuiaDeTransporte e TransportItem.
+Usa a mesma paginação keyset dos Registros de Entrega, ordenada por ``created_at``.
+"""
+from Registros_de_Entregas.pagination import RegistroEntregaCursorPagination
+
+
+class GuiaCursorPagination(RegistroEntregaCursorPagination):
+    """``?cursor=``, ``?ordering=`` (``ordering_fields`` da view), ``?page_size=`` até 500."""
+    default_ordering = '-created_at'
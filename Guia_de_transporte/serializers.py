@@ -4,12 +4,16 @@ Responsável por converter os objetos do modelo GuiaDeTransporte para formatos c
 facilitando a comunicação da API REST.
 """
 from rest_framework import serializers
-from .models import GuiaDeTransporte, TransportItem
+from blobstore.serializers import BlobImageSerializerMixin
+from .models import Guia, GuiaDeTransporte, TransportItem
+from .services import FaltasService, GuiaService
 import logging
 
 logger = logging.getLogger(__name__)
 
-class GuiaDeTransporteSerializer(serializers.ModelSerializer):
+class GuiaDeTransporteSerializer(BlobImageSerializerMixin, serializers.ModelSerializer):
+    blob_fields = ('imagem',)
+
     class Meta:
         model = GuiaDeTransporte
         fields = ['id', 'item', 'descricao', 'unidade', 'quantidade', 'quantidade_total', 'peso', 'volume', 
@@ -22,10 +26,25 @@ class GuiaDeTransporteSerializer(serializers.ModelSerializer):
             logger.info(f"Image data present, length: {len(str(data['imagem']))}")
         return data
 
-class TransportItemSerializer(serializers.ModelSerializer):
+class GuiaDeTransporteListSerializer(serializers.ModelSerializer):
+    """
+    Representação leve para listagens: sem a imagem, só com ``tem_imagem``.
+    Espera um queryset preparado com ``ListagemService.projecao_listagem``.
+    """
+    tem_imagem = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = GuiaDeTransporte
+        fields = ['id', 'guia', 'ordem', 'item', 'descricao', 'unidade', 'quantidade', 'quantidade_total', 'peso',
+                  'volume', 'notas', 'em_falta', 'total', 'tem_imagem', 'username', 'current_user',
+                  'created_at', 'updated_at']
+
+class TransportItemSerializer(BlobImageSerializerMixin, serializers.ModelSerializer):
+    blob_fields = ('imagem',)
+
     class Meta:
         model = TransportItem
-        fields = '__all__'
+        exclude = ['imagem_blob']
     
     def validate(self, data):
         # Log the validation process for debugging
@@ -33,3 +52,61 @@ class TransportItemSerializer(serializers.ModelSerializer):
         if 'imagem' in data:
             logger.info(f"Image data present, length: {len(str(data['imagem']))}")
         return data
+
+
+class TransportItemListSerializer(serializers.ModelSerializer):
+    """Representação leve de TransportItem para listagens (ver GuiaDeTransporteListSerializer)."""
+    tem_imagem = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = TransportItem
+        exclude = ['imagem', 'imagem_blob']
+
+class SomaQuantidadeSerializer(serializers.Serializer):
+    """Pedido de soma à ``quantidade_total`` de um item (``delta`` negativo para retirar)."""
+    LIMITE = 1_000_000
+
+    delta = serializers.IntegerField(min_value=-LIMITE, max_value=LIMITE)
+    current_user = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+class GuiaLinhaSerializer(GuiaDeTransporteSerializer):
+    """Linha de uma guia; a ordem e o ``em_falta`` são calculados pelo GuiaService."""
+
+    class Meta(GuiaDeTransporteSerializer.Meta):
+        fields = ['id', 'ordem', 'item', 'descricao', 'unidade', 'quantidade', 'quantidade_total', 'peso',
+                  'volume', 'notas', 'em_falta', 'total', 'imagem', 'username', 'current_user']
+        read_only_fields = ['ordem', 'em_falta']
+
+    def validate(self, data):
+        erro = FaltasService.preparar(data)
+        if erro:
+            raise serializers.ValidationError({"notas": erro})
+        return data
+
+class GuiaSerializer(serializers.ModelSerializer):
+    """
+    Guia com as linhas aninhadas. ``linhas`` cria (ou, na edição, substitui) todas as linhas
+    num só pedido; os totais ``peso``, ``volume`` e ``em_falta`` são só de leitura.
+    """
+    linhas = GuiaLinhaSerializer(many=True, required=False)
+
+    class Meta:
+        model = Guia
+        fields = ['id', 'numero', 'data', 'origem', 'destino', 'notas', 'peso', 'volume', 'em_falta',
+                  'username', 'current_user', 'created_at', 'updated_at', 'linhas']
+        read_only_fields = ['peso', 'volume', 'em_falta']
+
+    def _linhas(self, validated_data):
+        linhas = validated_data.pop('linhas', None)
+        if linhas is None:
+            return None
+        linha = self.fields['linhas'].child
+        return [linha.externalize_images(dict(dados)) for dados in linhas]
+
+    def create(self, validated_data):
+        linhas = self._linhas(validated_data) or []
+        return GuiaService.criar(validated_data, linhas)
+
+    def update(self, instance, validated_data):
+        linhas = self._linhas(validated_data)
+        return GuiaService.atualizar(instance, validated_data, linhas)
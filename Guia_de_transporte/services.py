@@ -0,0 +1,195 @@
+"""
+Serviços das guias de transporte: cálculo das faltas, criação de uma guia com todas
+as linhas, manutenção dos totais do cabeçalho e relatório de faltas.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from .models import Guia, GuiaDeTransporte, TransportItem
+
+MENSAGEM_NOTAS = "É necessário justificar os itens em falta nas notas."
+
+# Verdadeiro enquanto o GuiaService escreve linhas em bloco e recalcula os totais no fim
+_totais_suspensos = ContextVar('guia_totais_suspensos', default=False)
+
+
+class ListagemService:
+    # Colunas que as listagens não transferem (base64 antigo das imagens)
+    CAMPOS_PESADOS = ('imagem',)
+
+    @staticmethod
+    def projecao_listagem(queryset):
+        """Queryset sem as colunas pesadas, com ``tem_imagem`` calculado no SQL."""
+        return queryset.defer(*ListagemService.CAMPOS_PESADOS).annotate(
+            tem_imagem=ExpressionWrapper(
+                Q(imagem_blob__isnull=False) | (Q(imagem__isnull=False) & ~Q(imagem='')),
+                output_field=BooleanField(),
+            ),
+        )
+
+
+class FaltasService:
+    # Tabelas que o relatório de faltas pode ler (``?fonte=``)
+    FONTES = {
+        'guias': GuiaDeTransporte,
+        'transport-items': TransportItem,
+    }
+
+    @staticmethod
+    def em_falta(quantidade, quantidade_total):
+        """Quantidade em falta numa linha (nunca negativa), como é gravada em ``em_falta``."""
+        return max(int(quantidade or 0) - int(quantidade_total or 0), 0)
+
+    @staticmethod
+    def preparar(data, instance=None):
+        """
+        Calcula ``em_falta`` para os dados de uma escrita (``instance`` completa o que não
+        foi enviado) e valida que uma falta vem justificada nas notas.
+        Retorna a mensagem de erro, ou ``None`` se os dados estão completos.
+        """
+        quantidade = data.get('quantidade', instance.quantidade if instance else 0)
+        quantidade_total = data.get('quantidade_total', instance.quantidade_total if instance else 0)
+        em_falta = FaltasService.em_falta(quantidade, quantidade_total)
+        notas = data.get('notas') or (instance.notas if instance else None) or ''
+        if em_falta and not notas.strip():
+            return MENSAGEM_NOTAS
+        data['em_falta'] = em_falta
+        return None
+
+    @staticmethod
+    def somar_quantidade(pk, delta, current_user=None):
+        """
+        Soma ``delta`` (positivo ou negativo) a ``quantidade_total`` de um TransportItem e
+        recalcula ``em_falta`` no mesmo UPDATE, a partir do valor que está na base de dados.
+        Escritas concorrentes somam-se sem bloqueios nem novas tentativas.
+        Retorna 0 se o item não existe ou se a quantidade ficaria negativa.
+        """
+        nova = F('quantidade_total') + delta
+        valores = {
+            'quantidade_total': nova,
+            'em_falta': Greatest(F('quantidade') - nova, Value(0)),
+            'updated_at': Now(),
+        }
+        if current_user:
+            valores['current_user'] = current_user
+        queryset = TransportItem.objects.filter(pk=pk)
+        if delta < 0:
+            queryset = queryset.filter(quantidade_total__gte=-delta)
+        return queryset.update(**valores)
+
+    @staticmethod
+    def relatorio(fonte='guias', user=None):
+        """
+        Quantidades em falta por item e unidade, somadas na base de dados.
+        Só lê as linhas com falta (índice parcial ``*_em_falta_idx``).
+        """
+        modelo = FaltasService.FONTES[fonte]
+        queryset = modelo.objects.filter(em_falta__gt=0)
+        if user:
+            filtro = Q(current_user=user)
+            if hasattr(modelo, 'username'):
+                filtro |= Q(username=user)
+            queryset = queryset.filter(filtro)
+        itens = list(
+            queryset.order_by().values('item', 'unidade')
+            .annotate(em_falta=Sum('em_falta'), linhas=Count('id'))
+            .order_by('-em_falta', 'item', 'unidade')
+        )
+        return {
+            'fonte': fonte,
+            'itens': itens,
+            'total': sum(linha['em_falta'] for linha in itens),
+        }
+
+
+class GuiaService:
+    # Campos de uma linha herdados do cabeçalho quando não são enviados
+    CAMPOS_HERDADOS = ('username', 'current_user')
+
+    @staticmethod
+    def com_linhas(queryset=None):
+        """Guias com as linhas já carregadas por ordem (uma consulta para todas as linhas)."""
+        queryset = Guia.objects.all() if queryset is None else queryset
+        return queryset.prefetch_related(
+            Prefetch('linhas', queryset=GuiaDeTransporte.objects.order_by('ordem', 'id'))
+        )
+
+    @staticmethod
+    @contextmanager
+    def totais_suspensos():
+        """Dentro do bloco, gravar ou remover linhas não recalcula os totais (ver signals.py)."""
+        token = _totais_suspensos.set(True)
+        try:
+            yield
+        finally:
+            _totais_suspensos.reset(token)
+
+    @staticmethod
+    def totais_ativos():
+        return not _totais_suspensos.get()
+
+    @staticmethod
+    def _total(expressao, vazio):
+        agregado = (
+            GuiaDeTransporte.objects.filter(guia=OuterRef('pk'))
+            .order_by().values('guia').annotate(total=Sum(expressao)).values('total')
+        )
+        return Coalesce(Subquery(agregado), Value(vazio))
+
+    @staticmethod
+    def atualizar_totais(guia_ids):
+        """Recalcula ``peso``, ``volume`` e ``em_falta`` das guias indicadas num só UPDATE."""
+        guia_ids = [guia_ids] if isinstance(guia_ids, int) else list(guia_ids)
+        if not guia_ids:
+            return 0
+        return Guia.objects.filter(pk__in=guia_ids).update(
+            peso=GuiaService._total(F('peso'), Decimal('0')),
+            volume=GuiaService._total(F('volume'), Decimal('0')),
+            em_falta=GuiaService._total(F('em_falta'), 0),
+        )
+
+    @staticmethod
+    def _preparar_linhas(guia, linhas):
+        objetos = []
+        for ordem, dados in enumerate(linhas, start=1):
+            dados = dict(dados)
+            for campo in GuiaService.CAMPOS_HERDADOS:
+                if not dados.get(campo):
+                    dados[campo] = getattr(guia, campo)
+            dados['em_falta'] = FaltasService.em_falta(dados.get('quantidade'), dados.get('quantidade_total'))
+            objetos.append(GuiaDeTransporte(guia=guia, ordem=ordem, **dados))
+        return objetos
+
+    @staticmethod
+    @transaction.atomic
+    def criar(dados, linhas):
+        """Cria a guia e todas as linhas (um INSERT para as linhas) e calcula os totais."""
+        guia = Guia.objects.create(**dados)
+        GuiaDeTransporte.objects.bulk_create(GuiaService._preparar_linhas(guia, linhas))
+        GuiaService.atualizar_totais(guia.pk)
+        guia.refresh_from_db(fields=['peso', 'volume', 'em_falta'])
+        return guia
+
+    @staticmethod
+    @transaction.atomic
+    def atualizar(guia, dados, linhas=None):
+        """
+        Atualiza o cabeçalho; se ``linhas`` for dado, substitui todas as linhas da guia
+        pelas enviadas (pela ordem em que vêm).
+        """
+        for campo, valor in dados.items():
+            setattr(guia, campo, valor)
+        guia.save()
+        if linhas is not None:
+            # The totals are recomputed once below, not after each deleted line
+            with GuiaService.totais_suspensos():
+                GuiaDeTransporte.objects.filter(guia=guia).delete()
+            GuiaDeTransporte.objects.bulk_create(GuiaService._preparar_linhas(guia, linhas))
+        GuiaService.atualizar_totais(guia.pk)
+        guia.refresh_from_db(fields=['peso', 'volume', 'em_falta'])
+        return guia
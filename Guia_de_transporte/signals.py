@@ -0,0 +1,22 @@
+"""
+Mantém os totais do cabeçalho (``Guia``) quando uma linha é gravada ou removida
+individualmente. As escritas em bloco do GuiaService recalculam os totais elas próprias
+(``GuiaService.totais_suspensos``).
+"""
+from django.db.models.signals import post_delete, post_save
+
+from .models import Guia, GuiaDeTransporte
+from .services import GuiaService
+
+
+def atualizar_totais_da_guia(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or not instance.guia_id or not GuiaService.totais_ativos():
+        return
+    # Lines removed in cascade with their guia: there is no header left to update
+    if isinstance(origin, Guia) or getattr(origin, 'model', None) is Guia:
+        return
+    GuiaService.atualizar_totais(instance.guia_id)
+
+
+post_save.connect(atualizar_totais_da_guia, sender=GuiaDeTransporte, dispatch_uid='guia_totais_save')
+post_delete.connect(atualizar_totais_da_guia, sender=GuiaDeTransporte, dispatch_uid='guia_totais_delete')
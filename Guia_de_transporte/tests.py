@@ -3,6 +3,362 @@ Documento de Testes para Guia de Transporte.
 Contém testes automatizados para validar o funcionamento correto dos modelos, 
 views e outras funcionalidades do aplicativo de Guia de Transporte.
 """
-from django.test import TestCase
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+from importlib import import_module
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.testing import TempDirSettingMixin
+from blobstore.tests import jpeg_com_orientacao
+from .models import Guia, GuiaDeTransporte, TransportItem
+from .pagination import GuiaCursorPagination
+
+
+@override_settings(BLOB_RENDITIONS={'thumb': 10}, BLOB_RENDITIONS_SYNC=True)
+class TransportItemImagemTests(TempDirSettingMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_upload_is_stored_as_blob(self):
+        response = self.client.post('/api/guia/transport-items/', {
+            'item': 'Cabo',
+            'quantidade': 1,
+            'quantidade_total': 1,
+            'imagem': SimpleUploadedFile('foto.jpg', jpeg_com_orientacao(), content_type='image/jpeg'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        item = TransportItem.objects.get()
+        self.assertIsNone(item.imagem)
+        self.assertIsNotNone(item.imagem_blob_id)
+        self.assertIn(f'/api/blobs/{item.imagem_blob_id}/', response.data['imagem'])
+        self.assertIn('rendition=thumb', response.data['imagem_rendicoes']['thumb'])
+        self.assertEqual(item.imagem_blob.renditions.count(), 1)
+
+
+class GuiaDocumentoTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def _linha(self, item, quantidade, quantidade_total, **extra):
+        return {'item': item, 'descricao': f'{item} desc', 'quantidade': quantidade,
+                'quantidade_total': quantidade_total, **extra}
+
+    def _criar(self, n=3, numero='GT-001'):
+        linhas = [self._linha(f'Item {i}', 10, 10, peso='1.50', volume='0.25') for i in range(n)]
+        linhas[0].update(quantidade_total=7, notas='Faltam 3 no armazém')
+        return self.client.post('/api/guia/documentos/', {
+            'numero': numero, 'origem': 'Armazém', 'destino': 'Obra', 'username': 'ana', 'linhas': linhas,
+        }, format='json')
+
+    def test_cria_guia_com_linhas_num_pedido(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._criar(50)
+        self.assertEqual(response.status_code, 201, response.data)
+        inserts = [q['sql'] for q in consultas.captured_queries
+                   if q['sql'].startswith('INSERT INTO "guia_de_transporte_guiadetransporte"')]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual([linha['ordem'] for linha in response.data['linhas']], list(range(1, 51)))
+        self.assertEqual(response.data['peso'], '75.00')
+        self.assertEqual(response.data['volume'], '12.50')
+        self.assertEqual(response.data['em_falta'], 3)
+        self.assertEqual(response.data['linhas'][0]['em_falta'], 3)
+        self.assertEqual(response.data['linhas'][1]['username'], 'ana')
+
+    def test_falta_sem_notas_e_rejeitada(self):
+        response = self.client.post('/api/guia/documentos/', {
+            'numero': 'GT-002', 'linhas': [self._linha('Cabo', 5, 2)],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('notas', response.data['linhas'][0])
+        self.assertFalse(Guia.objects.exists())
+
+    def test_leitura_com_duas_consultas(self):
+        guia_id = self._criar(20).data['id']
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/guia/documentos/{guia_id}/')
+        self.assertEqual(len(response.data['linhas']), 20)
+        self._criar(5, numero='GT-002')
+        self._criar(5, numero='GT-003')
+        with self.assertNumQueries(2):  # headers of the page and all their lines
+            response = self.client.get('/api/guia/documentos/', {'page_size': 2})
+        self.assertEqual([guia['numero'] for guia in response.data['results']], ['GT-003', 'GT-002'])
+        self.assertEqual(len(response.data['results'][0]['linhas']), 5)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([guia['numero'] for guia in response.data['results']], ['GT-001'])
+        self.assertIsNone(response.data['next'])
+
+    def test_totais_acompanham_escritas_nas_linhas(self):
+        guia = Guia.objects.get(pk=self._criar().data['id'])
+        linha = guia.linhas.get(ordem=2)
+
+        response = self.client.patch(f'/api/guia/guias/{linha.pk}/', {
+            'quantidade_total': 4, 'peso': '5.00', 'notas': 'Partidos',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        guia.refresh_from_db()
+        self.assertEqual((guia.peso, guia.em_falta), (Decimal('8.00'), 9))
+
+        guia.linhas.get(ordem=1).delete()
+        guia.refresh_from_db()
+        self.assertEqual((guia.peso, guia.volume, guia.em_falta), (Decimal('6.50'), Decimal('0.50'), 6))
+
+    def test_edicao_substitui_linhas(self):
+        guia_id = self._criar().data['id']
+        response = self.client.patch(f'/api/guia/documentos/{guia_id}/', {
+            'destino': 'Outra obra', 'linhas': [self._linha('Novo', 2, 2, peso='3.00')],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['destino'], 'Outra obra')
+        self.assertEqual([linha['item'] for linha in response.data['linhas']], ['Novo'])
+        self.assertEqual((response.data['peso'], response.data['em_falta']), ('3.00', 0))
+        self.assertEqual(GuiaDeTransporte.objects.filter(guia_id=guia_id).count(), 1)
+
+    def test_substituir_linhas_recalcula_totais_uma_vez(self):
+        guia_id = self._criar(30).data['id']
+        linhas = [self._linha(f'Novo {i}', 2, 2, peso='1.00') for i in range(30)]
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.put(f'/api/guia/documentos/{guia_id}/', {
+                'numero': 'GT-001', 'linhas': linhas,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['peso'], '30.00')
+
+        sql = [q['sql'] for q in consultas.captured_queries]
+        self.assertEqual(sum(s.startswith('UPDATE "Guia_de_transporte_guia"') and 'SUM(' in s for s in sql), 1)
+        self.assertEqual(sum(s.startswith('DELETE FROM "guia_de_transporte_guiadetransporte"') for s in sql), 1)
+        # Lookup (2), unique numero check, savepoint, header save, lines read and deleted by
+        # the collector (2), insert, totals, totals reload, release and the response (2):
+        # the same for any number of lines
+        self.assertEqual(len(sql), 13)
+
+    def test_apagar_guia_nao_recalcula_totais_por_linha(self):
+        guia_id = self._criar(30).data['id']
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.delete(f'/api/guia/documentos/{guia_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(GuiaDeTransporte.objects.exists())
+        sql = [q['sql'] for q in consultas.captured_queries]
+        self.assertFalse([s for s in sql if s.startswith('UPDATE "Guia_de_transporte_guia"')])
+
+    def test_linha_individual_atualiza_totais(self):
+        guia = Guia.objects.get(pk=self._criar(2).data['id'])
+        guia.linhas.first().delete()
+        guia.refresh_from_db()
+        self.assertEqual(guia.peso, Decimal('1.50'))
+
+
+class MigracaoQuantidadesTests(SimpleTestCase):
+    migracao = import_module('Guia_de_transporte.migrations.0015_numeric_stock_columns')
+
+    def test_separadores(self):
+        decimal = self.migracao._decimal
+        self.assertEqual(decimal('1.234,56'), Decimal('1234.56'))
+        self.assertEqual(decimal('1,234.56'), Decimal('1234.56'))
+        self.assertEqual(decimal('12,5 €'), Decimal('12.5'))
+        self.assertEqual(decimal('12'), Decimal('12'))
+        self.assertIsNone(decimal('abc'))
+
+    def test_em_falta_cabe_numa_coluna_integer(self):
+        decimal, limite = self.migracao._decimal, self.migracao.LIMITE_EM_FALTA
+        self.assertEqual(decimal(str(2 ** 31 - 1), limite), 2 ** 31 - 1)
+        self.assertIsNone(decimal(str(2 ** 31), limite))
+        self.assertEqual(decimal(str(2 ** 31)), 2 ** 31)
+
+
+class FaltasTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_escritas_calculam_em_falta_numerico(self):
+        response = self.client.post('/api/guia/transport-items/', {
+            'item': 'Cabo', 'quantidade': 10, 'quantidade_total': 4, 'notas': 'Partidos', 'total': '12.5',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['em_falta'], response.data['total']), (6, '12.50'))
+
+        response = self.client.patch(f"/api/guia/transport-items/{response.data['id']}/",
+                                     {'quantidade_total': 12}, format='json')
+        self.assertEqual(response.data['em_falta'], 0)
+
+        response = self.client.post('/api/guias/', {
+            'item': 'Tubo', 'descricao': 'PVC', 'quantidade': 3, 'quantidade_total': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('notas', response.data)
+
+    def test_relatorio_soma_por_item(self):
+        GuiaDeTransporte.objects.bulk_create([
+            GuiaDeTransporte(item='Cabo', descricao='', quantidade=10, quantidade_total=7, em_falta=3, username='ana'),
+            GuiaDeTransporte(item='Cabo', descricao='', quantidade=5, quantidade_total=0, em_falta=5, username='rui'),
+            GuiaDeTransporte(item='Tubo', descricao='', quantidade=2, quantidade_total=1, em_falta=1, username='ana'),
+            GuiaDeTransporte(item='Fita', descricao='', quantidade=2, quantidade_total=2, em_falta=0, username='ana'),
+        ])
+        TransportItem.objects.create(item='Caixa', quantidade=4, quantidade_total=1, em_falta=3)
+
+        response = self.client.get('/api/guia/em-falta/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['itens'], [
+            {'item': 'Cabo', 'unidade': 'UN', 'em_falta': 8, 'linhas': 2},
+            {'item': 'Tubo', 'unidade': 'UN', 'em_falta': 1, 'linhas': 1},
+        ])
+        self.assertEqual(response.data['total'], 9)
+
+        response = self.client.get('/api/guia/em-falta/', {'user': 'ana'})
+        self.assertEqual(response.data['total'], 4)
+        response = self.client.get('/api/guia/em-falta/', {'fonte': 'transport-items'})
+        self.assertEqual(response.data['itens'][0]['item'], 'Caixa')
+        self.assertEqual(self.client.get('/api/guia/em-falta/', {'fonte': 'x'}).status_code, 400)
+
+
+class SomarQuantidadeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.item = TransportItem.objects.create(item='Cabo', quantidade=10, quantidade_total=2, em_falta=8)
+        self.url = f'/api/guia/transport-items/{self.item.pk}/quantidade/'
+
+    def test_soma_e_recalcula_em_falta(self):
+        response = self.client.post(self.url, {'delta': 5, 'current_user': 'rui'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['quantidade_total'], response.data['em_falta']), (7, 3))
+        self.assertEqual(response.data['current_user'], 'rui')
+
+        response = self.client.post(self.url, {'delta': 6}, format='json')
+        self.assertEqual((response.data['quantidade_total'], response.data['em_falta']), (13, 0))
+        response = self.client.post(self.url, {'delta': -4}, format='json')
+        self.assertEqual((response.data['quantidade_total'], response.data['em_falta']), (9, 1))
+
+    def test_erros(self):
+        response = self.client.post(self.url, {'delta': -3}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantidade_total, 2)
+
+        self.assertEqual(self.client.post(self.url, {'delta': 'x'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 400)
+        response = self.client.post('/api/guia/transport-items/999999/quantidade/', {'delta': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class SomarQuantidadeConcorrenciaTests(TransactionTestCase):
+    THREADS = 8
+    PEDIDOS = 25
+
+    def test_somas_concorrentes_nao_se_perdem(self):
+        item = TransportItem.objects.create(item='Cabo', quantidade=500, quantidade_total=0, em_falta=500)
+        url = f'/api/guia/transport-items/{item.pk}/quantidade/'
+        inicio = threading.Barrier(self.THREADS)
+        falhas = []
+
+        def recolher(numero):
+            client = APIClient()
+            try:
+                inicio.wait()
+                for pedido in range(self.PEDIDOS):
+                    # Every third request takes one back out, so decrements race with increments
+                    delta = -1 if pedido % 3 == 2 else 2
+                    response = client.post(url, {'delta': delta, 'current_user': f'u{numero}'}, format='json')
+                    if response.status_code != 200:
+                        falhas.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=recolher, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(falhas, [])
+        por_thread = sum(-1 if pedido % 3 == 2 else 2 for pedido in range(self.PEDIDOS))
+        item.refresh_from_db()
+        self.assertEqual(item.quantidade_total, self.THREADS * por_thread)
+        self.assertEqual(item.em_falta, 500 - self.THREADS * por_thread)
+
+
+class ListagemTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        linhas = []
+        for n in range(12):
+            linhas.append(GuiaDeTransporte(
+                item=f'Cabo {n}' if n % 2 else f'Tubo {n}', descricao='', quantidade=5,
+                quantidade_total=5 if n % 3 else 2, em_falta=0 if n % 3 else 3,
+                username='ana' if n < 6 else None, current_user='rui' if n >= 6 else None,
+                imagem='data:image/png;base64,' + 'A' * 1000 if n == 0 else None,
+            ))
+        GuiaDeTransporte.objects.bulk_create(linhas)
+        # Same timestamp for half the rows: pages must still be stable through the id tiebreaker
+        GuiaDeTransporte.objects.filter(item__startswith='Cabo').update(
+            created_at=datetime(2024, 3, 5, 10, tzinfo=timezone.utc))
+        GuiaDeTransporte.objects.filter(item__startswith='Tubo').update(
+            created_at=datetime(2024, 3, 1, 10, tzinfo=timezone.utc))
+
+    def _todas(self, url, **params):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            ids += [linha['id'] for linha in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_paginas_por_cursor_sem_imagens(self):
+        response = self.client.get('/api/guias/', {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertNotIn('imagem', response.data['results'][0])
+        self.assertIn('tem_imagem', response.data['results'][0])
+
+        ids = self._todas('/api/guias/', page_size=5)
+        self.assertEqual(len(ids), 12)
+        self.assertEqual(len(set(ids)), 12)
+        self.assertEqual(ids, self._todas('/api/guia/guias/', page_size=5))
+        self.assertEqual(ids, self._todas('/api/guia/guias/', page_size=500))
+        com_imagem = GuiaDeTransporte.objects.get(imagem__isnull=False).pk
+        self.assertTrue(next(l for l in self.client.get('/api/guias/').data['results']
+                             if l['id'] == com_imagem)['tem_imagem'])
+
+    def test_cursor_invalido(self):
+        paginacao = GuiaCursorPagination()
+        for cursor in ({'o': '-created_at', 'v': 'x', 'pk': '1'},
+                       {'o': '-created_at', 'v': '2024-03-01T10:00:00+00:00', 'pk': 'x'}):
+            response = self.client.get('/api/guia/guias/', {'cursor': paginacao.encode_cursor(cursor)})
+            self.assertEqual(response.status_code, 404)
+
+    def test_filtros(self):
+        def ids(**params):
+            return set(self._todas('/api/guia/guias/', **params))
+
+        self.assertEqual(ids(item='cabo'), set(GuiaDeTransporte.objects.filter(item__startswith='Cabo')
+                                               .values_list('id', flat=True)))
+        self.assertEqual(len(ids(user='ana')), 6)
+        self.assertEqual(len(ids(user='rui')), 6)
+        self.assertEqual(len(ids(com_falta='true')), 4)
+        self.assertEqual(len(ids(com_falta='false')), 8)
+        self.assertEqual(len(ids(created_at_inicio='2024-03-02')), 6)
+        self.assertEqual(len(ids(created_at_fim='2024-03-05')), 12)
+        self.assertEqual(len(ids(created_at_fim='2024-03-05T09:00:00Z')), 6)
+        self.assertEqual(len(ids(user='ana', com_falta='true', item='tubo')), 1)
+        response = self.client.get('/api/guia/guias/', {'created_at_inicio': 'ontem'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_itens_de_transporte(self):
+        TransportItem.objects.bulk_create([
+            TransportItem(item='Caixa', quantidade=3, quantidade_total=1, em_falta=2, current_user='ana'),
+            TransportItem(item='Fita', quantidade=3, quantidade_total=3, em_falta=0, current_user='rui',
+                          imagem='data:image/png;base64,AAAA'),
+        ])
+        response = self.client.get('/api/guia/transport-items/', {'user': 'rui'})
+        self.assertEqual([linha['item'] for linha in response.data['results']], ['Fita'])
+        self.assertNotIn('imagem', response.data['results'][0])
+        self.assertTrue(response.data['results'][0]['tem_imagem'])
+        response = self.client.get('/api/guia/guiaderemeca/', {'com_falta': 'true', 'ordering': 'item'})
+        self.assertEqual([linha['item'] for linha in response.data['results']], ['Caixa'])
@@ -5,16 +5,19 @@ Utiliza o sistema de roteamento do Django REST Framework para criar endpoints da
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GuiaDeTransporteViewSet
+from .views import GuiaDeTransporteViewSet, GuiaViewSet
 from . import views
 
 router = DefaultRouter()
 router.register(r'guias', GuiaDeTransporteViewSet)
+router.register(r'documentos', GuiaViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('em-falta/', views.relatorio_faltas, name='guia-relatorio-faltas'),
     path('transport-items/', views.TransportItemListCreate.as_view(), name='transport-items-list-create'),
     path('transport-items/<int:pk>/', views.TransportItemRetrieveUpdateDestroy.as_view(), name='transport-items-retrieve-update-destroy'),
+    path('transport-items/<int:pk>/quantidade/', views.somar_quantidade, name='transport-items-somar-quantidade'),
     # Novos endpoints para corresponder ao serviço frontend
     path('guiaderemeca/', views.TransportItemListCreate.as_view(), name='guiaderemeca-list-create'),
     path('guiaderemeca/<int:pk>/', views.TransportItemRetrieveUpdateDestroy.as_view(), name='guiaderemeca-retrieve-update-destroy'),
@@ -3,271 +3,189 @@ Documento de Views para Guia de Transporte.
 Responsável por gerenciar as visualizações e endpoints da API para o modelo GuiaDeTransporte.
 Utiliza Django REST Framework para criar uma API RESTful.
 """
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, generics, status
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.decorators import api_view, parser_classes
 from .models import GuiaDeTransporte, TransportItem
-from .serializers import GuiaDeTransporteSerializer, TransportItemSerializer
-import base64
+from .filters import GuiaDeTransporteFilter, TransportItemFilter
+from .pagination import GuiaCursorPagination
+from .serializers import (
+    GuiaDeTransporteListSerializer, GuiaDeTransporteSerializer, GuiaSerializer, SomaQuantidadeSerializer,
+    TransportItemListSerializer, TransportItemSerializer,
+)
+from .services import FaltasService, GuiaService, ListagemService
+from blobstore.services import BlobService
 import os
 import logging
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
-class GuiaDeTransporteViewSet(viewsets.ModelViewSet):
-    queryset = GuiaDeTransporte.objects.all()
-    serializer_class = GuiaDeTransporteSerializer
+class ListagemMixin:
+    """
+    Listagens de GuiaDeTransporte e TransportItem: filtros (``filterset_class``), páginas
+    por cursor ordenadas por ``created_at`` e ``id``, e linhas sem o conteúdo das imagens.
+    """
+    filter_backends = [DjangoFilterBackend]
+    pagination_class = GuiaCursorPagination
+    ordering_fields = ['created_at', 'updated_at', 'item', 'quantidade', 'quantidade_total', 'em_falta']
+    list_serializer_class = None
+
+    def _listagem(self):
+        return getattr(self, 'action', 'list' if self.request.method == 'GET' else None) == 'list'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self._listagem():
+            queryset = ListagemService.projecao_listagem(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self._listagem():
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+class QuantidadesEscritaMixin:
+    """
+    create/update partilhados pelas views de GuiaDeTransporte e TransportItem: guarda a
+    imagem enviada como ficheiro, calcula ``em_falta`` (FaltasService.preparar) e
+    preenche ``username`` a partir de ``current_user``.
+    """
     parser_classes = (JSONParser, MultiPartParser, FormParser)
-    
+
+    def _dados(self, request, instance=None):
+        data = request.data.copy()
+        if 'imagem' in request.FILES:
+            image_file = request.FILES['imagem']
+            # Stored once in the blob store (renditions are generated there); the serializer keeps the reference
+            blob = BlobService.store_bytes(image_file.read())
+            data['imagem'] = BlobService.url_for(blob.sha256)
+
+        erro = FaltasService.preparar(data, instance)
+
+        # Use provided username or a default value from current_user
+        if not data.get('username') and request.data.get('current_user'):
+            data['username'] = request.data.get('current_user')
+        return data, erro
+
     def create(self, request, *args, **kwargs):
+        nome = self.get_queryset().model.__name__
         try:
-            logger.info(f"Create request received for GuiaDeTransporte")
-            
-            # Process image if present
-            if 'imagem' in request.FILES:
-                image_file = request.FILES['imagem']
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                image_type = image_file.content_type
-                data = request.data.copy()
-                data['imagem'] = f"data:{image_type};base64,{image_data}"
-            else:
-                data = request.data.copy()
-            
-            # Calculate em_falta automatically
-            quantidade = int(data.get('quantidade', 0))
-            quantidade_total = int(data.get('quantidade_total', 0))
-            
-            if quantidade_total < quantidade:
-                em_falta = str(quantidade - quantidade_total)
-                
-                # Validate that notes/justification is provided when items are missing
-                if not data.get('notas') or not data.get('notas').strip():
-                    return Response(
-                        {"notas": "É necessário justificar os itens em falta nas notas."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                em_falta = "0"
-                
-            data['em_falta'] = em_falta
-            
-            # Use provided username or a default value
-            if not data.get('username') and request.data.get('current_user'):
-                data['username'] = request.data.get('current_user')
-            
+            logger.info(f"Create request received for {nome}")
+            data, erro = self._dados(request)
+            if erro:
+                return Response({"notas": erro}, status=status.HTTP_400_BAD_REQUEST)
+
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
             self.perform_create(serializer)
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-            
         except Exception as e:
-            logger.error(f"Error creating GuiaDeTransporte: {str(e)}")
+            logger.error(f"Error creating {nome}: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        
+        nome = type(instance).__name__
         try:
-            logger.info(f"Update request received for item {instance.id}")
-            
-            if 'imagem' in request.FILES:
-                logger.info(f"Image file received in request.FILES")
-                image_file = request.FILES['imagem']
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                image_type = image_file.content_type
-                data = request.data.copy()
-                data['imagem'] = f"data:{image_type};base64,{image_data}"
-            else:
-                data = request.data.copy()
-                logger.info("No image file in request")
-            
-            # Calculate em_falta automatically
-            quantidade = int(data.get('quantidade', instance.quantidade))
-            quantidade_total = int(data.get('quantidade_total', instance.quantidade_total))
-            
-            if quantidade_total < quantidade:
-                em_falta = str(quantidade - quantidade_total)
-                
-                # Validate that notes/justification is provided when items are missing
-                if not data.get('notas') and (not instance.notas or instance.notas.strip() == ''):
-                    return Response(
-                        {"notas": "É necessário justificar os itens em falta nas notas."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                em_falta = "0"
-                
-            data['em_falta'] = em_falta
-            
-            # Update username from current_user if available
-            if not data.get('username') and request.data.get('current_user'):
-                data['username'] = request.data.get('current_user')
-            
+            logger.info(f"Update request received for {nome} {instance.id}")
+            data, erro = self._dados(request, instance)
+            if erro:
+                return Response({"notas": erro}, status=status.HTTP_400_BAD_REQUEST)
+
             serializer = self.get_serializer(instance, data=data, partial=partial)
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
-            
+
             if getattr(instance, '_prefetched_objects_cache', None):
                 instance._prefetched_objects_cache = {}
-            
+
             return Response(serializer.data)
         except Exception as e:
-            logger.error(f"Error updating item: {str(e)}")
+            logger.error(f"Error updating {nome}: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class GuiaDeTransporteListCreateView(generics.ListCreateAPIView):
+class GuiaDeTransporteViewSet(ListagemMixin, QuantidadesEscritaMixin, viewsets.ModelViewSet):
     queryset = GuiaDeTransporte.objects.all()
     serializer_class = GuiaDeTransporteSerializer
-    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    list_serializer_class = GuiaDeTransporteListSerializer
+    filterset_class = GuiaDeTransporteFilter
 
-    def create(self, request, *args, **kwargs):
-        try:
-            # Process image if present
-            if 'imagem' in request.FILES:
-                image_file = request.FILES['imagem']
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                image_type = image_file.content_type
-                data = request.data.copy()
-                data['imagem'] = f"data:{image_type};base64,{image_data}"
-            else:
-                data = request.data.copy()
-                
-            # Calculate em_falta automatically
-            quantidade = int(data.get('quantidade', 0))
-            quantidade_total = int(data.get('quantidade_total', 0))
-            
-            if quantidade_total < quantidade:
-                em_falta = str(quantidade - quantidade_total)
-                
-                # Validate that notes/justification is provided when items are missing
-                if not data.get('notas') or not data.get('notas').strip():
-                    return Response(
-                        {"notas": "É necessário justificar os itens em falta nas notas."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                em_falta = "0"
-                
-            data['em_falta'] = em_falta
-            
-            # Use provided username or a default value
-            if not data.get('username') and request.data.get('current_user'):
-                data['username'] = request.data.get('current_user')
-                
-            serializer = self.get_serializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-        except Exception as e:
-            logger.error(f"Error creating item: {str(e)}")
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+class GuiaViewSet(viewsets.ModelViewSet):
+    """
+    Guias (documentos) com as linhas aninhadas: criadas num só pedido e devolvidas
+    com uma consulta para o cabeçalho e outra para todas as linhas. A listagem é
+    paginada por cursor como as restantes (``?page_size=``, ``?cursor=``, ``?ordering=``).
+    """
+    queryset = GuiaService.com_linhas()
+    serializer_class = GuiaSerializer
+    # Each guide carries all its lines, so pages stay small (50, at most 500)
+    pagination_class = GuiaCursorPagination
+    ordering_fields = ['created_at', 'updated_at']
 
-class TransportItemListCreate(generics.ListCreateAPIView):
-    queryset = TransportItem.objects.all()
-    serializer_class = TransportItemSerializer
-    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    def perform_create(self, serializer):
+        guia = serializer.save()
+        # The response lists the lines from the same ordered prefetch as a GET
+        serializer.instance = GuiaService.com_linhas().get(pk=guia.pk)
 
-    def create(self, request, *args, **kwargs):
-        try:
-            # Process image if present
-            if 'imagem' in request.FILES:
-                image_file = request.FILES['imagem']
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                image_type = image_file.content_type
-                data = request.data.copy()
-                data['imagem'] = f"data:{image_type};base64,{image_data}"
-            else:
-                data = request.data.copy()
-            
-            # Calculate em_falta automatically
-            quantidade = int(data.get('quantidade', 0))
-            quantidade_total = int(data.get('quantidade_total', 0))
-            
-            if quantidade_total < quantidade:
-                em_falta = str(quantidade - quantidade_total)
-                
-                # Validate that notes/justification is provided when items are missing
-                if not data.get('notas') or not data.get('notas').strip():
-                    return Response(
-                        {"notas": "É necessário justificar os itens em falta nas notas."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                em_falta = "0"
-                
-            data['em_falta'] = em_falta
-            
-            # Use provided username or a default value from current_user
-            if not data.get('username') and request.data.get('current_user'):
-                data['username'] = request.data.get('current_user')
-            
-            serializer = self.get_serializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
-        except Exception as e:
-            logger.error(f"Error creating TransportItem: {str(e)}")
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    def perform_update(self, serializer):
+        guia = serializer.save()
+        serializer.instance = GuiaService.com_linhas().get(pk=guia.pk)
 
-class TransportItemRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
+class GuiaDeTransporteListCreateView(ListagemMixin, QuantidadesEscritaMixin, generics.ListCreateAPIView):
+    queryset = GuiaDeTransporte.objects.all()
+    serializer_class = GuiaDeTransporteSerializer
+    list_serializer_class = GuiaDeTransporteListSerializer
+    filterset_class = GuiaDeTransporteFilter
+
+class TransportItemListCreate(ListagemMixin, QuantidadesEscritaMixin, generics.ListCreateAPIView):
     queryset = TransportItem.objects.all()
     serializer_class = TransportItemSerializer
-    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    list_serializer_class = TransportItemListSerializer
+    filterset_class = TransportItemFilter
 
-    def update(self, request, *args, **kwargs):
-        partial = kwargs.pop('partial', False)
-        instance = self.get_object()
-        
-        try:
-            logger.info(f"Update request received for TransportItem {instance.id}")
-            
-            if 'imagem' in request.FILES:
-                logger.info("Processing image file in TransportItem update")
-                image_file = request.FILES['imagem']
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                image_type = image_file.content_type
-                data = request.data.copy()
-                data['imagem'] = f"data:{image_type};base64,{image_data}"
-            else:
-                data = request.data.copy()
-            
-            # Calculate em_falta automatically
-            quantidade = int(data.get('quantidade', instance.quantidade))
-            quantidade_total = int(data.get('quantidade_total', instance.quantidade_total))
-            
-            if quantidade_total < quantidade:
-                em_falta = str(quantidade - quantidade_total)
-                
-                # Validate that notes/justification is provided when items are missing
-                if not data.get('notas') and (not instance.notas or instance.notas.strip() == ''):
-                    return Response(
-                        {"notas": "É necessário justificar os itens em falta nas notas."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                em_falta = "0"
-                
-            data['em_falta'] = em_falta
-            
-            # Update username from current_user if available
-            if not data.get('username') and request.data.get('current_user'):
-                data['username'] = request.data.get('current_user')
-            
-            serializer = self.get_serializer(instance, data=data, partial=partial)
-            serializer.is_valid(raise_exception=True)
-            self.perform_update(serializer)
-            return Response(serializer.data)
-        except Exception as e:
-            logger.error(f"Error updating TransportItem: {str(e)}")
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+class TransportItemRetrieveUpdateDestroy(QuantidadesEscritaMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = TransportItem.objects.all()
+    serializer_class = TransportItemSerializer
 
     def delete(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+def relatorio_faltas(request):
+    """
+    Quantidades em falta por item (``?fonte=guias`` ou ``transport-items``,
+    opcionalmente só de um utilizador com ``?user=``).
+    """
+    fonte = request.query_params.get('fonte', 'guias')
+    if fonte not in FaltasService.FONTES:
+        return Response({"fonte": f"Use um de: {', '.join(FaltasService.FONTES)}."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response(FaltasService.relatorio(fonte, request.query_params.get('user') or None))
+
+
+@api_view(['POST'])
+def somar_quantidade(request, pk):
+    """
+    Soma ``delta`` à ``quantidade_total`` de um item e recalcula ``em_falta`` num só UPDATE,
+    para que vários utilizadores possam registar recolhas do mesmo item ao mesmo tempo.
+    """
+    pedido = SomaQuantidadeSerializer(data=request.data)
+    pedido.is_valid(raise_exception=True)
+    delta = pedido.validated_data['delta']
+
+    if not FaltasService.somar_quantidade(pk, delta, pedido.validated_data.get('current_user')):
+        if not TransportItem.objects.filter(pk=pk).exists():
+            return Response({"detail": "Item não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"quantidade_total": "A quantidade total não pode ficar negativa."},
+                        status=status.HTTP_409_CONFLICT)
+
+    item = TransportItem.objects.get(pk=pk)
+    return Response(TransportItemSerializer(item, context={'request': request}).data)
@@ -1,10 +1,24 @@
 from django.contrib import admin
-from .models import RegistroEntrega
+from .models import EstatisticaEntrega, RegistroEntrega, RegistroImagem
+
+class RegistroImagemInline(admin.TabularInline):
+    model = RegistroImagem
+    extra = 0
+    raw_id_fields = ['blob']
+    readonly_fields = ['criado_em']
 
 @admin.register(RegistroEntrega)
 class RegistroEntregaAdmin(admin.ModelAdmin):
+    inlines = [RegistroImagemInline]
     list_display = ['numero_obra', 'numero_instalacao', 'data_entrega', 'data_criacao', 'criado_em', 'criado_por']
     list_filter = ['data_entrega', 'data_criacao', 'criado_por']
     search_fields = ['numero_obra', 'numero_instalacao', 'notas']
     date_hierarchy = 'data_entrega'
+    raw_id_fields = ['criado_por', 'assinatura_blob', 'imagem_blob']
+
+
+@admin.register(EstatisticaEntrega)
+class EstatisticaEntregaAdmin(admin.ModelAdmin):
+    list_display = ['mes', 'tipo_documento', 'criado_por', 'total', 'finalizados', 'dias_ate_finalizacao']
+    list_filter = ['tipo_documento', 'mes']
     raw_id_fields = ['criado_por']
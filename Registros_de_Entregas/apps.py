@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RegistrosDeEntregasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Registros_de_Entregas'
+
+    def ready(self):
+        # Keeps EstatisticaEntrega in step with RegistroEntrega
+        from . import signals  # noqa: F401
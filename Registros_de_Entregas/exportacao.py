@@ -0,0 +1,111 @@
+"""
+Exportação dos Registros de Entrega em CSV e XLSX.
+
+As linhas são lidas com ``values_list(...).iterator(chunk_size=...)`` (cursor do lado do
+servidor no PostgreSQL) e escritas à medida que chegam, por isso a memória usada não
+depende do número de registros. As colunas de imagem nunca são lidas.
+"""
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import RegistroEntrega
+
+CHUNK_SIZE = 2000
+
+# (cabeçalho, campo do modelo)
+COLUNAS = [
+    ('ID', 'id'),
+    ('ID da Obra', 'obra_id'),
+    ('Número da Obra', 'numero_obra'),
+    ('Número de Instalação', 'numero_instalacao'),
+    ('Data de Entrega', 'data_entrega'),
+    ('Data de Entrega à Chefia', 'data_entrega_doc'),
+    ('Data de Finalização', 'data_trabalho_finalizado'),
+    ('Tipo de Documento', 'tipo_documento'),
+    ('Observações', 'notas'),
+    ('Criado por', 'criado_por__username'),
+    ('Data de Criação', 'data_criacao'),
+]
+
+# Primeiros caracteres com que o Excel interpreta uma célula como fórmula
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def texto_seguro(valor):
+    """Texto que não é interpretado como fórmula ao abrir o ficheiro no Excel (prefixo ``'``)."""
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def linhas(queryset, chunk_size=CHUNK_SIZE):
+    """Tuplos prontos a escrever, na ordem de ``COLUNAS``, lidos em blocos de ``chunk_size``."""
+    tipos = dict(RegistroEntrega.TIPO_DOCUMENTO_CHOICES)
+    indice_tipo = [campo for _, campo in COLUNAS].index('tipo_documento')
+    valores = queryset.order_by('data_entrega', 'id').values_list(*[campo for _, campo in COLUNAS])
+    for linha in valores.iterator(chunk_size=chunk_size):
+        linha = list(linha)
+        linha[0] = str(linha[0])
+        linha[indice_tipo] = tipos.get(linha[indice_tipo], linha[indice_tipo])
+        yield [texto_seguro(valor) for valor in linha]
+
+
+class _Echo:
+    """Objeto tipo ficheiro que devolve o que lhe é escrito (para o csv.writer)."""
+    def write(self, value):
+        return value
+
+
+def _iter_csv(queryset, chunk_size):
+    writer = csv.writer(_Echo(), delimiter=';')
+    # BOM so Excel opens the file as UTF-8; ';' is the separator it expects in pt-PT
+    yield '\ufeff' + writer.writerow([cabecalho for cabecalho, _ in COLUNAS])
+    for linha in linhas(queryset, chunk_size):
+        yield writer.writerow(['' if valor is None else valor for valor in linha])
+
+
+def exportar_csv(queryset, nome_ficheiro, chunk_size=CHUNK_SIZE):
+    response = StreamingHttpResponse(_iter_csv(queryset, chunk_size), content_type=CONTENT_TYPES['csv'])
+    response['Content-Disposition'] = f'attachment; filename="{nome_ficheiro}.csv"'
+    return response
+
+
+def exportar_xlsx(queryset, nome_ficheiro, chunk_size=CHUNK_SIZE):
+    """
+    Folha de cálculo em modo write-only: cada linha é escrita de imediato para um ficheiro
+    temporário em vez de ficar em memória. O ficheiro final é enviado em blocos.
+    """
+    workbook = Workbook(write_only=True)
+    folha = workbook.create_sheet('Registros de Entrega')
+    folha.append([cabecalho for cabecalho, _ in COLUNAS])
+    for linha in linhas(queryset, chunk_size):
+        # Timezone-aware datetimes are not supported by openpyxl: written in local time
+        folha.append([
+            timezone.localtime(valor).replace(tzinfo=None) if getattr(valor, 'tzinfo', None) else valor
+            for valor in linha
+        ])
+
+    ficheiro = tempfile.TemporaryFile()
+    workbook.save(ficheiro)
+    ficheiro.seek(0)
+    return FileResponse(
+        ficheiro,
+        as_attachment=True,
+        filename=f'{nome_ficheiro}.xlsx',
+        content_type=CONTENT_TYPES['xlsx']
+    )
+
+
+EXPORTADORES = {
+    'csv': exportar_csv,
+    'xlsx': exportar_xlsx,
+}
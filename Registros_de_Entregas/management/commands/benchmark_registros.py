@@ -0,0 +1,312 @@
+import base64
+import json
+import os
+import random
+import re
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from Registros_de_Entregas.models import RegistroEntrega
+from Registros_de_Entregas.serializers import RegistroEntregaSerializer, RegistroEntregaListSerializer
+from Registros_de_Entregas.services import RegistroEntregaService
+from Registros_de_Entregas.views import RegistroEntregaViewSet
+
+# Índices criados para os filtros avançados; o cenário "filtros" compara com e sem eles
+INDICES_FILTROS = (
+    'registro_tipo_data_idx',
+    'registro_criador_data_idx',
+    'registro_data_doc_idx',
+    'registro_data_final_idx',
+)
+EXECUTION_TIME_RE = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+class Rollback(Exception):
+    """Usada para desfazer os dados de teste no fim do benchmark."""
+
+
+def bytes_sql(queryset):
+    """Executa o SQL do queryset e soma o tamanho dos valores devolvidos pela base de dados."""
+    sql, params = queryset.query.sql_with_params()
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            total += sum(len(str(valor).encode('utf-8')) for valor in row if valor is not None)
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o custo das consultas dos Registros de Entrega (bytes lidos da base de dados, "
+        "bytes de JSON, número de queries e planos EXPLAIN) antes e depois das otimizações. "
+        "Os dados de teste são criados numa transação desfeita no fim; não correr em produção, "
+        "o cenário 'filtros' bloqueia a tabela enquanto remove temporariamente os índices."
+    )
+
+    cenarios = ('lista', 'filtros', 'serializador')
+    registros_por_cenario = {'lista': 200, 'filtros': 100000, 'serializador': 10000}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cenario', choices=self.cenarios, default='lista',
+                            help="Cenário a medir")
+        parser.add_argument('--registros', type=int, default=None,
+                            help="Número de registros de teste a criar (0 usa apenas os existentes; "
+                                 "por omissão 200 para 'lista', 100000 para 'filtros' e 10000 para 'serializador')")
+        parser.add_argument('--page-size', type=int, default=50,
+                            help="Número de registros por página")
+        parser.add_argument('--tamanho-imagem', type=int, default=50 * 1024,
+                            help="Tamanho em bytes de cada imagem de teste (antes de base64), cenário 'lista'")
+        parser.add_argument('--repeticoes', type=int, default=3,
+                            help="Repetições de cada medição do cenário 'serializador' (conta a melhor)")
+        parser.add_argument('--manter', action='store_true',
+                            help="Mantém os registros de teste em vez de os apagar no fim")
+
+    def handle(self, *args, **kwargs):
+        cenario = kwargs['cenario']
+        if kwargs['registros'] is None:
+            kwargs['registros'] = self.registros_por_cenario[cenario]
+        try:
+            with transaction.atomic():
+                getattr(self, f'preparar_{cenario}')(**kwargs)
+                getattr(self, f'cenario_{cenario}')(**kwargs)
+                if not kwargs['manter']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write("Registros de teste removidos.")
+
+    def criar_registros(self, quantidade, conteudo=None, usuarios=(), lote=1000):
+        """
+        Cria registros com uma distribuição próxima da real: três anos de datas, todos os
+        tipos de documento, vários autores e datas opcionais preenchidas só em parte.
+        ``conteudo`` (base64) é guardado em linha na assinatura e nas imagens, no formato antigo.
+        """
+        if quantidade <= 0:
+            return
+        aleatorio = random.Random(42)
+        tipos = [codigo for codigo, _ in RegistroEntrega.TIPO_DOCUMENTO_CHOICES]
+        usuarios = list(usuarios) or [None]
+        inicio = date(2022, 1, 1)
+        for base in range(0, quantidade, lote):
+            novos = []
+            for i in range(base, min(base + lote, quantidade)):
+                data_entrega = inicio + timedelta(days=aleatorio.randrange(3 * 365))
+                novos.append(RegistroEntrega(
+                    obra_id=f'BENCH-{i}',
+                    data_entrega=data_entrega,
+                    data_entrega_doc=(
+                        data_entrega + timedelta(days=aleatorio.randrange(30))
+                        if aleatorio.random() < 0.6 else None
+                    ),
+                    data_trabalho_finalizado=(
+                        data_entrega + timedelta(days=aleatorio.randrange(90))
+                        if aleatorio.random() < 0.4 else None
+                    ),
+                    numero_instalacao=f'INS-BENCH-{i}',
+                    numero_obra=f'OBRA-BENCH-{i % 500}',
+                    notas='Registro criado pelo benchmark',
+                    tipo_documento=aleatorio.choice(tipos),
+                    criado_por=aleatorio.choice(usuarios),
+                    assinatura=conteudo,
+                    imagem=conteudo,
+                    imagens=json.dumps([conteudo, conteudo]) if conteudo else None,
+                ))
+            RegistroEntrega.objects.bulk_create(novos)
+        self.stdout.write(f"Criados {quantidade} registros de teste.")
+
+    def preparar_lista(self, registros, tamanho_imagem, **kwargs):
+        conteudo = 'data:image/png;base64,' + base64.b64encode(os.urandom(tamanho_imagem)).decode('ascii')
+        self.criar_registros(registros, conteudo, lote=100)
+
+    def preparar_filtros(self, registros, **kwargs):
+        usuarios = User.objects.bulk_create([
+            User(username=f'benchmark-registros-{i}') for i in range(20)
+        ])
+        self.criar_registros(registros, usuarios=usuarios)
+        with connection.cursor() as cursor:
+            # Fresh statistics so the planner sees the seeded volume
+            cursor.execute(f'ANALYZE "{RegistroEntrega._meta.db_table}"')
+
+    def medir(self, rotulo, queryset, serializer_class, page_size):
+        request = Request(RequestFactory().get('/api/registros/'))
+        pagina = queryset.order_by('-data_entrega', 'id')[:page_size]
+
+        with CaptureQueriesContext(connection) as queries:
+            inicio = time.perf_counter()
+            dados = serializer_class(list(pagina), many=True, context={'request': request}).data
+            conteudo = JSONRenderer().render(dados)
+            duracao = time.perf_counter() - inicio
+
+        resultado = {
+            'bytes_sql': bytes_sql(pagina),
+            'bytes_json': len(conteudo),
+            'queries': len(queries),
+            'ms': duracao * 1000,
+        }
+        self.stdout.write(
+            f"{rotulo:<8} bd={resultado['bytes_sql']:>12,} B  json={resultado['bytes_json']:>12,} B  "
+            f"queries={resultado['queries']:>3}  tempo={resultado['ms']:>8.1f} ms"
+        )
+        return resultado
+
+    def cenario_lista(self, page_size, **kwargs):
+        """Página da listagem com o serializer completo vs. a projeção leve."""
+        if not RegistroEntrega.objects.exists():
+            raise CommandError("Não existem registros para medir.")
+
+        self.stdout.write(f"Listagem, {page_size} registros por página:")
+        antes = self.medir('antes', RegistroEntregaViewSet.queryset.all(), RegistroEntregaSerializer, page_size)
+        depois = self.medir(
+            'depois',
+            RegistroEntregaService.projecao_listagem(RegistroEntrega.objects.all()),
+            RegistroEntregaListSerializer,
+            page_size
+        )
+        if antes['bytes_sql']:
+            reducao = 100 * (1 - depois['bytes_sql'] / antes['bytes_sql'])
+            self.stdout.write(self.style.SUCCESS(f"Bytes lidos da base de dados reduzidos em {reducao:.1f}%"))
+
+    def combinacoes_filtros(self):
+        """Combinações de parâmetros de ``_apply_advanced_filters`` usadas pelos dashboards."""
+        registro = RegistroEntrega.objects.exclude(criado_por=None).order_by('-data_entrega').first()
+        if registro is None:
+            raise CommandError("Não existem registros com autor para medir.")
+        fim = registro.data_entrega
+        mes = {'data_entrega_inicio': (fim - timedelta(days=30)).isoformat(), 'data_entrega_fim': fim.isoformat()}
+        ano = {'data_entrega_inicio': (fim - timedelta(days=365)).isoformat(), 'data_entrega_fim': fim.isoformat()}
+        tipo = {'tipo_documento': registro.tipo_documento}
+        autor = {'criado_por': str(registro.criado_por_id)}
+        return [
+            ('data_entrega (mês)', mes),
+            ('data_entrega (ano)', ano),
+            ('data_entrega_doc (mês)', {
+                'data_entrega_doc_inicio': mes['data_entrega_inicio'], 'data_entrega_doc_fim': mes['data_entrega_fim']
+            }),
+            ('data_trabalho_finalizado (mês)', {
+                'data_trabalho_finalizado_inicio': mes['data_entrega_inicio'],
+                'data_trabalho_finalizado_fim': mes['data_entrega_fim']
+            }),
+            ('tipo_documento', tipo),
+            ('tipo_documento + data_entrega (mês)', {**tipo, **mes}),
+            ('criado_por', autor),
+            ('criado_por + data_entrega (ano)', {**autor, **ano}),
+            ('tipo + criado_por + data_entrega (ano)', {**tipo, **autor, **ano}),
+        ]
+
+    def explicar(self, parametros, page_size):
+        """EXPLAIN ANALYZE da primeira página da listagem com os filtros indicados."""
+        view = RegistroEntregaViewSet()
+        request = Request(RequestFactory().get('/api/registros/', parametros))
+        queryset = view._apply_advanced_filters(request, RegistroEntrega.objects.all())
+        pagina = queryset.order_by('-data_entrega', 'id')[:page_size + 1]
+        plano = pagina.explain(analyze=True)
+        match = EXECUTION_TIME_RE.search(plano)
+        no_raiz = next(
+            (linha.strip().lstrip('-> ') for linha in plano.splitlines()[1:] if 'Scan' in linha),
+            plano.splitlines()[0]
+        )
+        return (float(match.group(1)) if match else 0.0), no_raiz.split('  (')[0]
+
+    def cenario_filtros(self, page_size, **kwargs):
+        """Tempo de EXPLAIN ANALYZE de cada combinação de filtros, com e sem os novos índices."""
+        if connection.vendor != 'postgresql':
+            raise CommandError("O cenário 'filtros' requer PostgreSQL.")
+
+        combinacoes = self.combinacoes_filtros()
+        com_indices = {nome: self.explicar(parametros, page_size) for nome, parametros in combinacoes}
+
+        sem_indices = {}
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for indice in INDICES_FILTROS:
+                        cursor.execute(f'DROP INDEX IF EXISTS "{indice}"')
+                sem_indices = {nome: self.explicar(parametros, page_size) for nome, parametros in combinacoes}
+                raise Rollback()
+        except Rollback:
+            pass
+
+        total = RegistroEntrega.objects.count()
+        self.stdout.write(f"Filtros avançados sobre {total:,} registros ({page_size} por página):")
+        self.stdout.write(f"{'combinação':<40} {'sem índices':>12} {'com índices':>12}  plano")
+        for nome, _ in combinacoes:
+            antes, _ = sem_indices[nome]
+            depois, plano = com_indices[nome]
+            self.stdout.write(f"{nome:<40} {antes:>9.2f} ms {depois:>9.2f} ms  {plano}")
+
+    def preparar_serializador(self, registros, **kwargs):
+        self.preparar_filtros(registros)
+
+    def debitar(self, rotulo, funcao, linhas, repeticoes):
+        """Melhor tempo de ``funcao(linha)`` aplicada a todas as linhas; imprime linhas/s."""
+        melhor = None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            for linha in linhas:
+                funcao(linha)
+            duracao = time.perf_counter() - inicio
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        por_segundo = len(linhas) / melhor if melhor else float('inf')
+        self.stdout.write(f"{rotulo:<52} {por_segundo:>12,.0f} linhas/s")
+        return por_segundo
+
+    def cenario_serializador(self, repeticoes, **kwargs):
+        """Linhas por segundo do mapeamento camelCase compilado vs. o duplo dicionário anterior."""
+        # No request in the context: URLs stay relative, so the host settings do not matter here
+        request = None
+        contexto = {}
+        instancias = list(RegistroEntregaViewSet.queryset.all())
+        if not instancias:
+            raise CommandError("Não existem registros para medir.")
+        listagem = list(RegistroEntregaService.projecao_listagem(RegistroEntrega.objects.select_related('criado_por')))
+        campos_lista = [campo for campo in RegistroEntregaListSerializer.Meta.fields if campo != 'criado_por']
+        linhas_values = list(
+            RegistroEntregaService.projecao_listagem(RegistroEntrega.objects.all()).values(
+                *campos_lista, 'criado_por__id', 'criado_por__username',
+                'criado_por__first_name', 'criado_por__last_name'
+            )
+        )
+
+        completo = RegistroEntregaSerializer(context=contexto)
+        leve = RegistroEntregaListSerializer(context=contexto)
+
+        def completo_anterior(instance):
+            # Previous implementation: full DRF pass, then a second camelCase dict
+            representation = serializers.ModelSerializer.to_representation(completo, instance)
+            representation['assinatura'] = RegistroEntregaService.representar_blob(instance, 'assinatura', request)
+            representation['imagem'] = RegistroEntregaService.representar_blob(instance, 'imagem', request)
+            representation['imagens'] = RegistroEntregaService.representar_imagens(instance, request)
+            return {chave: representation[campo] for campo, chave in completo.camel_case_fields.items()}
+
+        def leve_anterior(instance):
+            representation = serializers.ModelSerializer.to_representation(leve, instance)
+            return {chave: representation[campo] for campo, chave in leve.camel_case_fields.items()}
+
+        self.stdout.write(f"Serialização de {len(instancias):,} registros (melhor de {repeticoes}):")
+        self.debitar('completo, DRF + dicionário camelCase (anterior)', completo_anterior, instancias, repeticoes)
+        self.debitar('completo, plano compilado', completo.to_representation, instancias, repeticoes)
+        self.debitar('listagem, DRF + dicionário camelCase (anterior)', leve_anterior, listagem, repeticoes)
+        self.debitar('listagem, plano compilado (instâncias)', leve.to_representation, listagem, repeticoes)
+        self.debitar('listagem, plano compilado (linhas values())', leve.to_representation, linhas_values, repeticoes)
+
+        payloads = [completo_anterior(instance) for instance in instancias]
+        for payload in payloads:
+            for campo in ('id', 'assinatura', 'imagem', 'imagens', 'dataCriacao', 'criadoPor'):
+                payload.pop(campo)
+
+        def validar(payload):
+            serializer = RegistroEntregaSerializer(data=payload, context=contexto)
+            if not serializer.is_valid():
+                raise CommandError(f"Payload inválido no benchmark: {serializer.errors}")
+
+        self.stdout.write(f"Escrita de {len(payloads):,} payloads camelCase:")
+        self.debitar('mapeamento + validação DRF dos campos', validar, payloads, repeticoes)
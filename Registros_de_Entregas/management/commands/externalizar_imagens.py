@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from Registros_de_Entregas.models import RegistroEntrega
+from Registros_de_Entregas.services import RegistroEntregaService
+
+
+class Command(BaseCommand):
+    help = (
+        "Move as assinaturas e imagens base64 guardadas em linha nos RegistroEntrega "
+        "para o armazenamento de blobs, deixando apenas as referências na tabela"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Número de registros processados por transação")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Apenas conta os registros que seriam migrados")
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+
+        com_conteudo_em_linha = (
+            (Q(assinatura__isnull=False) & ~Q(assinatura='')) |
+            (Q(imagem__isnull=False) & ~Q(imagem='')) |
+            (Q(imagens__isnull=False) & ~Q(imagens='') & ~Q(imagens='[]'))
+        )
+        # Only primary keys are loaded up front; the heavy columns are read row by row
+        pks = list(
+            RegistroEntrega.objects.filter(com_conteudo_em_linha)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        self.stdout.write(f"Registros com conteúdo em linha: {len(pks)}")
+
+        if kwargs['dry_run']:
+            return
+
+        migrados = 0
+        for inicio in range(0, len(pks), batch_size):
+            lote = pks[inicio:inicio + batch_size]
+            with transaction.atomic():
+                for registro in RegistroEntrega.objects.select_for_update().filter(pk__in=lote):
+                    alterados = RegistroEntregaService.externalizar_registro(registro)
+                    if alterados:
+                        registro.save(update_fields=alterados)
+                        migrados += 1
+            self.stdout.write(f"Processados {min(inicio + batch_size, len(pks))}/{len(pks)}")
+
+        self.stdout.write(self.style.SUCCESS(f"{migrados} registros migrados para o armazenamento de blobs."))
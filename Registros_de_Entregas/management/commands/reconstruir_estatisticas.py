@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Registros_de_Entregas.services import EstatisticaEntregaService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula a tabela de resumo EstatisticaEntrega a partir de todos os Registros de Entrega "
+        "(necessário depois de importações ou atualizações em massa, que não disparam sinais)"
+    )
+
+    def handle(self, *args, **kwargs):
+        linhas = EstatisticaEntregaService.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"Estatísticas reconstruídas: {linhas} linhas de resumo."))
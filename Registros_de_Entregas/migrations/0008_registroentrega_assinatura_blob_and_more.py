@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blobstore', '0001_initial'),
+        ('Registros_de_Entregas', '0007_registroentrega_tipo_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroentrega',
+            name='assinatura_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='blobstore.blob', verbose_name='Assinatura (Blob)'),
+        ),
+        migrations.AddField(
+            model_name='registroentrega',
+            name='imagem_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='blobstore.blob', verbose_name='Imagem (Blob)'),
+        ),
+        migrations.AddField(
+            model_name='registroentrega',
+            name='imagens_blobs',
+            field=models.JSONField(blank=True, default=list, verbose_name='Imagens Adicionais (SHA-256)'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+LOTE = 1000
+
+
+def dividir_imagens(apps, schema_editor):
+    """Cada referência da lista JSON ``imagens_blobs`` passa a ser uma linha de RegistroImagem."""
+    RegistroEntrega = apps.get_model('Registros_de_Entregas', 'RegistroEntrega')
+    RegistroImagem = apps.get_model('Registros_de_Entregas', 'RegistroImagem')
+
+    novas = []
+    registros = RegistroEntrega.objects.exclude(imagens_blobs=[]).values_list('pk', 'imagens_blobs')
+    for registro_id, shas in registros.iterator(chunk_size=LOTE):
+        novas.extend(
+            RegistroImagem(registro_id=registro_id, blob_id=sha256, ordem=ordem)
+            for ordem, sha256 in enumerate(shas or [])
+        )
+        if len(novas) >= LOTE:
+            RegistroImagem.objects.bulk_create(novas)
+            novas = []
+    RegistroImagem.objects.bulk_create(novas)
+
+
+def juntar_imagens(apps, schema_editor):
+    RegistroEntrega = apps.get_model('Registros_de_Entregas', 'RegistroEntrega')
+    RegistroImagem = apps.get_model('Registros_de_Entregas', 'RegistroImagem')
+
+    por_registro = {}
+    for registro_id, sha256 in RegistroImagem.objects.order_by('registro_id', 'ordem').values_list('registro_id', 'blob_id'):
+        por_registro.setdefault(registro_id, []).append(sha256)
+    for registro_id, shas in por_registro.items():
+        RegistroEntrega.objects.filter(pk=registro_id).update(imagens_blobs=shas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blobstore', '0001_initial'),
+        ('Registros_de_Entregas', '0008_registroentrega_assinatura_blob_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroImagem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveIntegerField(verbose_name='Ordem')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='blobstore.blob', verbose_name='Imagem (Blob)')),
+                ('registro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imagens_anexas', to='Registros_de_Entregas.registroentrega', verbose_name='Registro')),
+            ],
+            options={
+                'verbose_name': 'Imagem do Registro',
+                'verbose_name_plural': 'Imagens dos Registros',
+                'ordering': ['ordem'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='registroimagem',
+            constraint=models.UniqueConstraint(fields=('registro', 'ordem'), name='registroimagem_registro_ordem_unico'),
+        ),
+        migrations.RunPython(dividir_imagens, juntar_imagens),
+        migrations.RemoveField(
+            model_name='registroentrega',
+            name='imagens_blobs',
+        ),
+    ]
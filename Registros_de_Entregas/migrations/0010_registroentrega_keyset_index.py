@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Registros_de_Entregas', '0009_registroimagem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registroentrega',
+            index=models.Index(fields=['-data_entrega', 'id'], name='registro_data_entrega_id_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the table against writes
+    atomic = False
+
+    dependencies = [
+        ('Registros_de_Entregas', '0010_registroentrega_keyset_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='registroentrega',
+            index=models.Index(fields=['tipo_documento', '-data_entrega', 'id'], name='registro_tipo_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='registroentrega',
+            index=models.Index(fields=['criado_por', '-data_entrega', 'id'], name='registro_criador_data_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='registroentrega',
+            index=models.Index(condition=models.Q(('data_entrega_doc__isnull', False)), fields=['data_entrega_doc'], name='registro_data_doc_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='registroentrega',
+            index=models.Index(condition=models.Q(('data_trabalho_finalizado__isnull', False)), fields=['data_trabalho_finalizado'], name='registro_data_final_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, ExtractDay, TruncMonth
+
+
+def preencher_estatisticas(apps, schema_editor):
+    """Calcula o resumo inicial a partir dos registros existentes."""
+    RegistroEntrega = apps.get_model('Registros_de_Entregas', 'RegistroEntrega')
+    EstatisticaEntrega = apps.get_model('Registros_de_Entregas', 'EstatisticaEntrega')
+
+    dias = ExpressionWrapper(F('data_trabalho_finalizado') - F('data_entrega'), output_field=DurationField())
+    linhas = (
+        RegistroEntrega.objects.order_by()
+        .annotate(mes_entrega=TruncMonth('data_entrega'), tipo=Coalesce('tipo_documento', Value('')))
+        .values('mes_entrega', 'tipo', 'criado_por')
+        .annotate(
+            soma_total=Count('pk'),
+            soma_finalizados=Count('data_trabalho_finalizado'),
+            soma_dias=Coalesce(Sum(ExtractDay(dias)), 0),
+        )
+    )
+    EstatisticaEntrega.objects.bulk_create([
+        EstatisticaEntrega(
+            mes=linha['mes_entrega'],
+            tipo_documento=linha['tipo'],
+            criado_por_id=linha['criado_por'],
+            total=linha['soma_total'],
+            finalizados=linha['soma_finalizados'],
+            dias_ate_finalizacao=linha['soma_dias'],
+        )
+        for linha in linhas.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Registros_de_Entregas', '0011_registroentrega_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaEntrega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('tipo_documento', models.CharField(blank=True, default='', max_length=50, verbose_name='Tipo de Documento')),
+                ('total', models.IntegerField(default=0, verbose_name='Total de registros')),
+                ('finalizados', models.IntegerField(default=0, verbose_name='Registros com data de finalização')),
+                ('dias_ate_finalizacao', models.BigIntegerField(default=0, verbose_name='Soma dos dias entre entrega e finalização')),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Entregas',
+                'verbose_name_plural': 'Estatísticas de Entregas',
+                'ordering': ['mes', 'tipo_documento'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='estatisticaentrega',
+            constraint=models.UniqueConstraint(condition=models.Q(('criado_por__isnull', False)), fields=('mes', 'tipo_documento', 'criado_por'), name='estatistica_mes_tipo_autor_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='estatisticaentrega',
+            constraint=models.UniqueConstraint(condition=models.Q(('criado_por__isnull', True)), fields=('mes', 'tipo_documento'), name='estatistica_mes_tipo_sem_autor_unico'),
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
 from django.utils import timezone
 import json
 from django.contrib.auth.models import User
+from blobstore.models import Blob
 
 class RegistroEntrega(models.Model):
     # Document type choices
@@ -26,6 +27,11 @@ class RegistroEntrega(models.Model):
     assinatura = models.TextField(blank=True, null=True, verbose_name="Assinatura (Base64)")
     imagem = models.TextField(blank=True, null=True, verbose_name="Imagem (Base64)")
     imagens = models.TextField(null=True, blank=True, verbose_name="Imagens Adicionais")
+    # Referências para o armazenamento de blobs (substituem o conteúdo base64 em linha)
+    assinatura_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True,
+                                        related_name='+', verbose_name="Assinatura (Blob)")
+    imagem_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True,
+                                    related_name='+', verbose_name="Imagem (Blob)")
     notas = models.TextField(blank=True, null=True, verbose_name="Observações")
     data_criacao = models.DateTimeField(default=timezone.now, verbose_name="Data de Criação")
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
@@ -57,10 +63,85 @@ class RegistroEntrega(models.Model):
         else:
             self.imagens = None
 
+    def save(self, *args, **kwargs):
+        """Grava o registro e atualiza EstatisticaEntrega (sinais) na mesma transação."""
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Registro de Entrega"
         verbose_name_plural = "Registros de Entregas"
         ordering = ['-data_entrega']
+        indexes = [
+            # Keyset pagination over the default list ordering (-data_entrega, id)
+            models.Index(fields=['-data_entrega', 'id'], name='registro_data_entrega_id_idx'),
+            # Advanced filters (tipo_documento / criado_por) combined with a data_entrega range,
+            # returned in the list ordering so the page can be read straight from the index
+            models.Index(fields=['tipo_documento', '-data_entrega', 'id'], name='registro_tipo_data_idx'),
+            models.Index(fields=['criado_por', '-data_entrega', 'id'], name='registro_criador_data_idx'),
+            # Range filters on the optional dates never match NULL, so those rows are left out
+            models.Index(fields=['data_entrega_doc'], name='registro_data_doc_idx',
+                         condition=models.Q(data_entrega_doc__isnull=False)),
+            models.Index(fields=['data_trabalho_finalizado'], name='registro_data_final_idx',
+                         condition=models.Q(data_trabalho_finalizado__isnull=False)),
+        ]
 
     def __str__(self):
         return f"Obra #{self.numero_obra} - Instalação #{self.numero_instalacao}"
+
+
+class RegistroImagem(models.Model):
+    """
+    Imagem adicional de um registro. Cada imagem é uma linha própria, inserida sem
+    reescrever as anteriores; a ordem de apresentação é dada pelo campo ``ordem``.
+    """
+    registro = models.ForeignKey(RegistroEntrega, on_delete=models.CASCADE,
+                                 related_name='imagens_anexas', verbose_name="Registro")
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+', verbose_name="Imagem (Blob)")
+    ordem = models.PositiveIntegerField(verbose_name="Ordem")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "Imagem do Registro"
+        verbose_name_plural = "Imagens dos Registros"
+        ordering = ['ordem']
+        constraints = [
+            models.UniqueConstraint(fields=['registro', 'ordem'], name='registroimagem_registro_ordem_unico'),
+        ]
+
+    def __str__(self):
+        return f"Imagem {self.ordem} do registro {self.registro_id}"
+
+
+class EstatisticaEntrega(models.Model):
+    """
+    Resumo dos registros por mês de entrega, tipo de documento e autor.
+    Mantido incrementalmente pelos sinais de gravação/remoção de RegistroEntrega
+    e reconstruível com ``manage.py reconstruir_estatisticas``.
+    """
+    mes = models.DateField(verbose_name="Mês")  # Primeiro dia do mês de data_entrega
+    tipo_documento = models.CharField(max_length=50, blank=True, default='', verbose_name="Tipo de Documento")
+    criado_por = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='+', verbose_name="Criado por")
+    total = models.IntegerField(default=0, verbose_name="Total de registros")
+    finalizados = models.IntegerField(default=0, verbose_name="Registros com data de finalização")
+    dias_ate_finalizacao = models.BigIntegerField(
+        default=0, verbose_name="Soma dos dias entre entrega e finalização"
+    )
+
+    class Meta:
+        verbose_name = "Estatística de Entregas"
+        verbose_name_plural = "Estatísticas de Entregas"
+        ordering = ['mes', 'tipo_documento']
+        constraints = [
+            # criado_por is nullable, so the "no author" bucket needs its own unique index
+            models.UniqueConstraint(fields=['mes', 'tipo_documento', 'criado_por'],
+                                    condition=models.Q(criado_por__isnull=False),
+                                    name='estatistica_mes_tipo_autor_unico'),
+            models.UniqueConstraint(fields=['mes', 'tipo_documento'],
+                                    condition=models.Q(criado_por__isnull=True),
+                                    name='estatistica_mes_tipo_sem_autor_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m} {self.tipo_documento or '-'} {self.criado_por_id or '-'}: {self.total}"
@@ -0,0 +1,208 @@
+"""
+Paginação por cursor (keyset) para os Registros de Entrega.
+
+Em vez de ``OFFSET``/``COUNT(*)``, cada página é pedida a partir da posição
+``(valor do campo de ordenação, id)`` do último registro visto, o que permite ao
+PostgreSQL usar o índice e manter o custo constante seja qual for a página.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimar_total(queryset):
+    """
+    Número aproximado de linhas segundo o planeador do PostgreSQL (sem ``COUNT(*)``).
+    Devolve None noutras bases de dados.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plano = cursor.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return int(plano[0]['Plan']['Plan Rows'])
+
+
+class RegistroEntregaPageNumberPagination(PageNumberPagination):
+    """Paginação antiga por número de página (``?page=``), agora com tamanho limitado."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class RegistroEntregaCursorPagination(BasePagination):
+    """
+    Paginação keyset sobre ``(campo de ordenação, id)``.
+
+    - ``?cursor=`` é opaco para o cliente; basta seguir os links ``next``/``previous``.
+    - ``?ordering=`` aceita um dos ``ordering_fields`` da view (com ``-`` para descendente).
+    - ``?page_size=`` limitado a ``max_page_size``.
+    - ``?estimar_total=1`` acrescenta ``total_estimado`` a partir das estatísticas do planeador.
+    - ``?page=`` mantém o modo antigo por número de página, para clientes existentes.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    estimate_query_param = 'estimar_total'
+    default_ordering = '-data_entrega'
+    tiebreaker = 'id'
+    legacy_query_param = 'page'
+    legacy_pagination_class = RegistroEntregaPageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if self.legacy_query_param in request.query_params:
+            self.legacy = self.legacy_pagination_class()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.campo = queryset.model._meta.get_field(self.ordering.lstrip('-'))
+        self.campo_desempate = queryset.model._meta.get_field(self.tiebreaker)
+        self.nullable = self.campo.null
+        self.base_url = request.build_absolute_uri()
+        self.total_estimado = (
+            estimar_total(queryset) if request.query_params.get(self.estimate_query_param) else None
+        )
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        if cursor is not None:
+            queryset = queryset.filter(self._position_filter(cursor['v'], cursor['pk'], before=reverse))
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        return results
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total_estimado is not None:
+            payload['total_estimado'] = self.total_estimado
+        return Response(payload)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, view):
+        allowed = set(getattr(view, 'ordering_fields', None) or [])
+        param = request.query_params.get(self.ordering_query_param, '')
+        for term in param.split(','):
+            term = term.strip()
+            if term and term.lstrip('-') in allowed:
+                return term
+        return self.default_ordering
+
+    def _order_by(self, reverse):
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        if reverse:
+            descending = not descending
+        # Nulls always sort after values in the forward direction. The clause is only
+        # added for nullable fields so that NOT NULL columns keep matching their index.
+        nulls = {}
+        if self.nullable:
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        expression = F(field).desc(**nulls) if descending else F(field).asc(**nulls)
+        tiebreaker = f'-{self.tiebreaker}' if reverse else self.tiebreaker
+        return [expression, tiebreaker]
+
+    def _position_filter(self, value, pk, before):
+        """Linhas depois (ou antes) da posição ``(value, pk)`` na ordem de avanço."""
+        field = self.ordering.lstrip('-')
+        beyond = 'lt' if self.ordering.startswith('-') else 'gt'
+        if before:
+            beyond = 'gt' if beyond == 'lt' else 'lt'
+        tie = 'lt' if before else 'gt'
+
+        if value is None:
+            same_position = Q(**{f'{field}__isnull': True, f'{self.tiebreaker}__{tie}': pk})
+            return Q(**{f'{field}__isnull': False}) | same_position if before else same_position
+
+        condition = Q(**{f'{field}__{beyond}': value}) | Q(**{field: value, f'{self.tiebreaker}__{tie}': pk})
+        if before or not self.nullable:
+            return condition
+        return condition | Q(**{f'{field}__isnull': True})
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def _link(self, instance, reverse):
+        value = getattr(instance, self.ordering.lstrip('-'))
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        token = self.encode_cursor({
+            'o': self.ordering,
+            'v': value,
+            'pk': str(getattr(instance, self.tiebreaker)),
+            'r': reverse,
+        })
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def encode_cursor(self, cursor):
+        raw = json.dumps(cursor, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            cursor = json.loads(raw)
+            if cursor['o'] != self.ordering:
+                raise ValueError("Cursor de outra ordenação")
+            # Values that do not fit the fields would only fail when the query runs
+            valor = None if cursor['v'] is None else self.campo.to_python(cursor['v'])
+            pk = self.campo_desempate.to_python(cursor['pk'])
+            if pk is None:
+                raise ValueError("Cursor sem posição")
+            return {'v': valor, 'pk': pk, 'r': bool(cursor.get('r'))}
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+            raise NotFound("Cursor inválido")
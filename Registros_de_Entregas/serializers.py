@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from backend.serializers import CamelCaseSerializerMixin
 from .models import RegistroEntrega
+from .services import RegistroEntregaService
 from django.contrib.auth.models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -7,11 +9,29 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'first_name', 'last_name']
 
-class RegistroEntregaSerializer(serializers.ModelSerializer):
+class RegistroEntregaSerializer(CamelCaseSerializerMixin, serializers.ModelSerializer):
     # Explicitly define imagens as a field since it's a property in the model
-    imagens = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=True, allow_null=True)
+    imagens = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False, allow_empty=True, allow_null=True)
     criado_por = UserSerializer(read_only=True)
-    
+
+    # Formato esperado pelo frontend: campo do modelo -> chave camelCase
+    camel_case_fields = {
+        'id': 'id',
+        'obra_id': 'obraId',
+        'data_entrega': 'dataEntrega',
+        'data_entrega_doc': 'dataEntregaDoc',
+        'data_trabalho_finalizado': 'dataTrabalhoFinalizado',
+        'numero_instalacao': 'numeroInstalacao',
+        'numero_obra': 'numeroObra',
+        'assinatura': 'assinatura',
+        'imagem': 'imagem',
+        'imagens': 'imagens',
+        'notas': 'notas',
+        'data_criacao': 'dataCriacao',
+        'criado_por': 'criadoPor',
+        'tipo_documento': 'tipoDocumento',
+    }
+
     class Meta:
         model = RegistroEntrega
         fields = [
@@ -21,68 +41,24 @@ class RegistroEntregaSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'data_criacao', 'criado_em', 'atualizado_em', 'criado_por']
 
-    def to_representation(self, instance):
-        """Converte para o formato esperado pelo frontend"""
-        representation = super().to_representation(instance)
-        
-        # Get images from the model's field using the helper method
-        if hasattr(instance, 'get_imagens'):
-            representation['imagens'] = instance.get_imagens()
-        
-        # Get creator information
-        criado_por = representation.get('criado_por')
-        
-        return {
-            'id': str(representation['id']),
-            'obraId': representation['obra_id'],
-            'dataEntrega': representation['data_entrega'],
-            'dataEntregaDoc': representation['data_entrega_doc'],
-            'dataTrabalhoFinalizado': representation['data_trabalho_finalizado'],
-            'numeroInstalacao': representation['numero_instalacao'],
-            'numeroObra': representation['numero_obra'],
-            'assinatura': representation['assinatura'],
-            'imagem': representation['imagem'],
-            'imagens': representation['imagens'],
-            'notas': representation['notas'],
-            'dataCriacao': representation['data_criacao'],
-            'criadoPor': criado_por,
-            'tipoDocumento': representation['tipo_documento'],
-        }
+    # Images are served from the blob store; base64 only when explicitly requested
+    def representar_assinatura(self, instance):
+        return RegistroEntregaService.representar_blob(instance, 'assinatura', self.context.get('request'))
+
+    def representar_imagem(self, instance):
+        return RegistroEntregaService.representar_blob(instance, 'imagem', self.context.get('request'))
+
+    def representar_imagens(self, instance):
+        return RegistroEntregaService.representar_imagens(instance, self.context.get('request'))
 
-    def to_internal_value(self, data):
-        """Converte do formato do frontend para o formato interno"""
-        internal_data = {}
-        
-        # Se os dados vierem no formato do frontend, converter para o formato do modelo
-        if 'obraId' in data:
-            internal_data['obra_id'] = data.get('obraId', '')
-            internal_data['data_entrega'] = data.get('dataEntrega', '')
-            internal_data['data_entrega_doc'] = data.get('dataEntregaDoc', None)
-            internal_data['data_trabalho_finalizado'] = data.get('dataTrabalhoFinalizado', None)
-            internal_data['numero_instalacao'] = data.get('numeroInstalacao', '')
-            internal_data['numero_obra'] = data.get('numeroObra', '')
-            internal_data['assinatura'] = data.get('assinatura', None)
-            internal_data['imagem'] = data.get('imagem', None)
-            internal_data['notas'] = data.get('notas', None)
-            internal_data['tipo_documento'] = data.get('tipoDocumento', 'trabalho_directo_faturar')
-            
-            # Handle images list separately to prevent losing it during conversion
-            if 'imagens' in data:
-                # This will be handled by the custom create/update methods
-                internal_data['imagens'] = data.get('imagens', [])
-            
-            return internal_data
-        
-        # If data isn't in frontend format, process normally
-        return super().to_internal_value(data)
-        
     def create(self, validated_data):
         imagens = validated_data.pop('imagens', []) if 'imagens' in validated_data else []
+        RegistroEntregaService.externalizar_dados(validated_data)
         instance = super().create(validated_data)
         
         # Set images separately using the helper method
         if imagens:
-            instance.set_imagens(imagens)
+            RegistroEntregaService.definir_imagens(instance, imagens)
             instance.save()
             
         return instance
@@ -90,13 +66,53 @@ class RegistroEntregaSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         # Get images before removing from validated_data
         imagens = validated_data.pop('imagens', None)
+        RegistroEntregaService.externalizar_dados(validated_data)
         
         # Update other fields
         instance = super().update(instance, validated_data)
         
         # Update images separately if included in the request
         if imagens is not None:
-            instance.set_imagens(imagens)
+            RegistroEntregaService.definir_imagens(instance, imagens)
             instance.save()
             
         return instance
+
+
+class RegistroEntregaListSerializer(CamelCaseSerializerMixin, serializers.ModelSerializer):
+    """
+    Representação leve para listagens: apenas metadados de texto, com indicadores
+    de assinatura/imagem e o número de imagens em vez do conteúdo.
+    Espera um queryset preparado com ``RegistroEntregaService.projecao_listagem``
+    (instâncias ou linhas de ``values()``).
+    """
+    criado_por = UserSerializer(read_only=True)
+    tem_assinatura = serializers.BooleanField(read_only=True)
+    tem_imagem = serializers.BooleanField(read_only=True)
+    num_imagens = serializers.IntegerField(read_only=True)
+
+    camel_case_fields = {
+        'id': 'id',
+        'obra_id': 'obraId',
+        'data_entrega': 'dataEntrega',
+        'data_entrega_doc': 'dataEntregaDoc',
+        'data_trabalho_finalizado': 'dataTrabalhoFinalizado',
+        'numero_instalacao': 'numeroInstalacao',
+        'numero_obra': 'numeroObra',
+        'notas': 'notas',
+        'data_criacao': 'dataCriacao',
+        'criado_por': 'criadoPor',
+        'tipo_documento': 'tipoDocumento',
+        'tem_assinatura': 'temAssinatura',
+        'tem_imagem': 'temImagem',
+        'num_imagens': 'numImagens',
+    }
+
+    class Meta:
+        model = RegistroEntrega
+        fields = [
+            'id', 'obra_id', 'data_entrega', 'data_entrega_doc', 'data_trabalho_finalizado',
+            'numero_instalacao', 'numero_obra', 'notas', 'data_criacao', 'criado_por',
+            'tipo_documento', 'tem_assinatura', 'tem_imagem', 'num_imagens'
+        ]
+        read_only_fields = fields
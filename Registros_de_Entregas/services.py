@@ -1,13 +1,333 @@
-from .models import RegistroEntrega
+from django.db import connection, transaction
+from django.db.models import (
+    BooleanField, Count, DurationField, ExpressionWrapper, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce, ExtractDay, TruncMonth
+from .models import EstatisticaEntrega, RegistroEntrega, RegistroImagem
+from blobstore.services import BlobService, RenditionService
 
 class RegistroEntregaService:
+    # Campos de imagem única que passam a ser guardados no armazenamento de blobs
+    CAMPOS_BLOB = ('assinatura', 'imagem')
+    # Colunas pesadas (base64 em linha) que a listagem nunca lê
+    CAMPOS_PESADOS = ('assinatura', 'imagem', 'imagens')
+
     @staticmethod
     def create_registro(data):
         """Create a new registro with business logic"""
         # Add any business logic here
         return RegistroEntrega.objects.create(**data)
-        
+
     @staticmethod
     def get_registros_por_obra(obra_id):
         """Get registros filtered by obra_id"""
         return RegistroEntrega.objects.filter(obra_id=obra_id)
+
+    @staticmethod
+    def projecao_listagem(queryset):
+        """
+        Restringe o queryset às colunas de texto usadas pelas listagens.
+        As imagens são substituídas por indicadores e pela contagem de RegistroImagem,
+        calculados no SQL sem transferir o conteúdo das colunas pesadas.
+        """
+        def preenchido(campo):
+            return Q(**{f'{campo}__isnull': False}) & ~Q(**{campo: ''})
+
+        contagem_imagens = (
+            RegistroImagem.objects.filter(registro=OuterRef('pk'))
+            .order_by()
+            .values('registro')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return queryset.defer(*RegistroEntregaService.CAMPOS_PESADOS).annotate(
+            tem_assinatura=ExpressionWrapper(
+                Q(assinatura_blob__isnull=False) | preenchido('assinatura'), output_field=BooleanField()
+            ),
+            tem_imagem=ExpressionWrapper(
+                Q(imagem_blob__isnull=False) | preenchido('imagem'), output_field=BooleanField()
+            ),
+            num_imagens=Coalesce(Subquery(contagem_imagens, output_field=IntegerField()), Value(0)),
+        )
+
+    @staticmethod
+    def resolver_blob(valor):
+        """
+        Converte um valor enviado pelo cliente (base64, data URI ou URL de um blob já
+        existente) num Blob. Devolve None se o valor não for nenhum destes formatos.
+        """
+        return BlobService.resolve_reference(valor)
+
+    @staticmethod
+    def externalizar_dados(data):
+        """
+        Substitui, em ``validated_data``, a assinatura e a imagem em base64 por referências
+        de blob. Valores que não são base64 válido ficam em linha (compatibilidade).
+        """
+        for campo in RegistroEntregaService.CAMPOS_BLOB:
+            if campo not in data:
+                continue
+            valor = data[campo]
+            blob = RegistroEntregaService.resolver_blob(valor) if valor else None
+            data[f'{campo}_blob'] = blob
+            if blob is not None or not valor:
+                data[campo] = None
+        return data
+
+    @staticmethod
+    def adicionar_imagens(registro, blobs):
+        """
+        Acrescenta imagens ao registro inserindo apenas as novas linhas.
+        O registro pai é bloqueado durante a inserção para que uploads concorrentes
+        recebam posições distintas em vez de se sobreporem.
+        """
+        with transaction.atomic():
+            list(RegistroEntrega.objects.select_for_update().filter(pk=registro.pk).values_list('pk'))
+            ultima = registro.imagens_anexas.aggregate(ultima=Max('ordem'))['ultima']
+            inicio = 0 if ultima is None else ultima + 1
+            return RegistroImagem.objects.bulk_create([
+                RegistroImagem(registro=registro, blob=blob, ordem=inicio + i)
+                for i, blob in enumerate(blobs)
+            ])
+
+    @staticmethod
+    def remover_imagem(registro, imagem_id):
+        """Remove uma única imagem; devolve False se não pertencer ao registro."""
+        apagadas, _ = RegistroImagem.objects.filter(registro=registro, pk=imagem_id).delete()
+        return apagadas > 0
+
+    @staticmethod
+    def definir_imagens(registro, imagens):
+        """
+        Substitui a lista completa de imagens adicionais (PUT/POST com ``imagens``).
+        Se todas as imagens puderem ser guardadas como blobs ficam como linhas de
+        RegistroImagem; caso contrário a lista é mantida em linha tal como recebida.
+        Entradas vazias são ignoradas. O registro tem de ser gravado a seguir para
+        persistir o campo ``imagens``.
+        """
+        imagens = [imagem for imagem in imagens or [] if imagem]
+        blobs = [RegistroEntregaService.resolver_blob(imagem) for imagem in imagens]
+        with transaction.atomic():
+            registro.imagens_anexas.all().delete()
+            if all(blob is not None for blob in blobs):
+                RegistroEntregaService.adicionar_imagens(registro, blobs)
+                registro.set_imagens(None)
+            else:
+                registro.set_imagens(imagens)
+
+    @staticmethod
+    def externalizar_registro(registro):
+        """
+        Move para o armazenamento de blobs todo o conteúdo base64 ainda guardado em linha.
+        As imagens adicionais passam a linhas de RegistroImagem, depois das já existentes.
+        Devolve a lista de campos do registro alterados (vazia se nada mudou).
+        """
+        alterados = []
+        for campo in RegistroEntregaService.CAMPOS_BLOB:
+            valor = getattr(registro, campo)
+            if not valor:
+                continue
+            blob = RegistroEntregaService.resolver_blob(valor)
+            if blob is not None:
+                setattr(registro, f'{campo}_blob', blob)
+                setattr(registro, campo, None)
+                alterados += [campo, f'{campo}_blob']
+
+        imagens = registro.get_imagens()
+        if imagens:
+            blobs = [RegistroEntregaService.resolver_blob(imagem) for imagem in imagens]
+            if all(blob is not None for blob in blobs):
+                RegistroEntregaService.adicionar_imagens(registro, blobs)
+                registro.set_imagens(None)
+                alterados.append('imagens')
+        return alterados
+
+    @staticmethod
+    def base64_solicitado(request):
+        """O cliente pode pedir o formato antigo (base64 em linha) com ``?formato_imagem=base64``."""
+        return request is not None and request.GET.get('formato_imagem') == 'base64'
+
+    @staticmethod
+    def representar_blob(registro, campo, request=None):
+        """URL do blob (ou data URI em modo de compatibilidade) para assinatura/imagem."""
+        sha256 = getattr(registro, f'{campo}_blob_id')
+        if not sha256:
+            return getattr(registro, campo)
+        if RegistroEntregaService.base64_solicitado(request):
+            return BlobService.as_data_uri(getattr(registro, f'{campo}_blob'))
+        return BlobService.url_for(sha256, request)
+
+    @staticmethod
+    def representar_imagens(registro, request=None):
+        """
+        Lista de imagens adicionais como URLs (ou data URIs em modo de compatibilidade).
+        Usa a cache de ``prefetch_related('imagens_anexas')`` quando disponível.
+        """
+        # Legacy inline entries that could not be moved to the blob store come first
+        em_linha = registro.get_imagens()
+        anexas = registro.imagens_anexas.all()
+        if RegistroEntregaService.base64_solicitado(request):
+            return em_linha + [BlobService.as_data_uri(anexa.blob) for anexa in anexas]
+        return em_linha + [BlobService.url_for(anexa.blob_id, request) for anexa in anexas]
+
+    @staticmethod
+    def detalhar_imagens(registro, request=None):
+        """Imagens adicionais com identificador e ordem, para remoção individual."""
+        return [
+            {
+                'id': anexa.pk,
+                'ordem': anexa.ordem,
+                'url': BlobService.url_for(anexa.blob_id, request),
+                'rendicoes': RenditionService.urls(anexa.blob_id, request),
+            }
+            for anexa in registro.imagens_anexas.all()
+        ]
+
+
+class EstatisticaEntregaService:
+    """
+    Manutenção da tabela de resumo EstatisticaEntrega.
+    Cada registro contribui com ``(total=1, finalizados=0|1, dias)`` para a linha
+    ``(mês de entrega, tipo de documento, autor)``; gravações e remoções aplicam apenas
+    a diferença, com um INSERT ... ON CONFLICT atómico.
+    """
+    CAMPOS = ('data_entrega', 'tipo_documento', 'criado_por_id', 'data_trabalho_finalizado')
+
+    @staticmethod
+    def contribuicao(valores):
+        """Devolve ``(chave, deltas)`` para um dicionário com os ``CAMPOS`` do registro."""
+        campo_data = RegistroEntrega._meta.get_field('data_entrega')
+        # Values assigned by hand (e.g. objects.create(data_entrega='2024-01-01')) may still be strings
+        data_entrega = campo_data.to_python(valores['data_entrega'])
+        if data_entrega is None:
+            return None
+        finalizado = campo_data.to_python(valores['data_trabalho_finalizado'])
+        chave = (data_entrega.replace(day=1), valores['tipo_documento'] or '', valores['criado_por_id'])
+        deltas = (1, 1, (finalizado - data_entrega).days) if finalizado else (1, 0, 0)
+        return chave, deltas
+
+    @staticmethod
+    def contribuicao_registro(registro):
+        return EstatisticaEntregaService.contribuicao({
+            campo: getattr(registro, campo) for campo in EstatisticaEntregaService.CAMPOS
+        })
+
+    @staticmethod
+    def _upsert_sql(sem_autor, origem):
+        tabela = connection.ops.quote_name(EstatisticaEntrega._meta.db_table)
+        if sem_autor:
+            alvo = '(mes, tipo_documento) WHERE criado_por_id IS NULL'
+        else:
+            alvo = '(mes, tipo_documento, criado_por_id) WHERE criado_por_id IS NOT NULL'
+        return (
+            f'INSERT INTO {tabela} (mes, tipo_documento, criado_por_id, total, finalizados, dias_ate_finalizacao) '
+            f'{origem} '
+            f'ON CONFLICT {alvo} DO UPDATE SET '
+            f'total = {tabela}.total + EXCLUDED.total, '
+            f'finalizados = {tabela}.finalizados + EXCLUDED.finalizados, '
+            f'dias_ate_finalizacao = {tabela}.dias_ate_finalizacao + EXCLUDED.dias_ate_finalizacao'
+        )
+
+    @staticmethod
+    def aplicar(contribuicao, sinal=1):
+        """Soma (``sinal=1``) ou subtrai (``sinal=-1``) a contribuição de um registro."""
+        if contribuicao is None:
+            return
+        (mes, tipo_documento, criado_por_id), deltas = contribuicao
+        sql = EstatisticaEntregaService._upsert_sql(criado_por_id is None, 'VALUES (%s, %s, %s, %s, %s, %s)')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [mes, tipo_documento, criado_por_id, *(sinal * delta for delta in deltas)])
+
+    @staticmethod
+    def atualizar(anterior, atual):
+        """Aplica a diferença entre a contribuição anterior e a atual de um registro."""
+        if anterior == atual:
+            return
+        EstatisticaEntregaService.aplicar(anterior, -1)
+        EstatisticaEntregaService.aplicar(atual, 1)
+
+    @staticmethod
+    def transferir_para_sem_autor(user_id):
+        """
+        Os registros de um utilizador removido ficam sem autor (SET_NULL, sem sinais);
+        as suas linhas de resumo são somadas às linhas sem autor antes de serem apagadas.
+        """
+        tabela = connection.ops.quote_name(EstatisticaEntrega._meta.db_table)
+        sql = EstatisticaEntregaService._upsert_sql(
+            True,
+            f'SELECT mes, tipo_documento, NULL, total, finalizados, dias_ate_finalizacao '
+            f'FROM {tabela} WHERE criado_por_id = %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id])
+        EstatisticaEntrega.objects.filter(criado_por_id=user_id).delete()
+
+    @staticmethod
+    def agregados(queryset=None):
+        """Linhas de resumo calculadas diretamente a partir dos registros (usado na reconstrução)."""
+        queryset = RegistroEntrega.objects.all() if queryset is None else queryset
+        dias = ExpressionWrapper(F('data_trabalho_finalizado') - F('data_entrega'), output_field=DurationField())
+        return (
+            queryset.order_by()
+            .annotate(mes_entrega=TruncMonth('data_entrega'), tipo=Coalesce('tipo_documento', Value('')))
+            .values('mes_entrega', 'tipo', 'criado_por')
+            .annotate(
+                soma_total=Count('pk'),
+                soma_finalizados=Count('data_trabalho_finalizado'),
+                soma_dias=Coalesce(Sum(ExtractDay(dias)), 0),
+            )
+        )
+
+    @staticmethod
+    def linhas_agregadas():
+        """Objetos EstatisticaEntrega (por gravar) com os ``agregados`` de todos os registros."""
+        return [
+            EstatisticaEntrega(
+                mes=linha['mes_entrega'],
+                tipo_documento=linha['tipo'],
+                criado_por_id=linha['criado_por'],
+                total=linha['soma_total'],
+                finalizados=linha['soma_finalizados'],
+                dias_ate_finalizacao=linha['soma_dias'],
+            )
+            for linha in EstatisticaEntregaService.agregados().iterator()
+        ]
+
+    @staticmethod
+    def reconstruir():
+        """Recalcula toda a tabela de resumo. Devolve o número de linhas criadas."""
+        with transaction.atomic():
+            # Taken before the aggregate is read: incremental updates from registros written
+            # meanwhile wait for the lock and are applied on top of the rebuilt rows. A registro
+            # commits together with its update, so one still waiting is not in the aggregate
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {connection.ops.quote_name(EstatisticaEntrega._meta.db_table)} '
+                    f'IN SHARE ROW EXCLUSIVE MODE'
+                )
+            linhas = EstatisticaEntregaService.linhas_agregadas()
+            EstatisticaEntrega.objects.all().delete()
+            EstatisticaEntrega.objects.bulk_create(linhas, batch_size=1000)
+        return len(linhas)
+
+    @staticmethod
+    def consultar(agrupar, filtros):
+        """
+        Totais da tabela de resumo agrupados pelos campos de ``agrupar``
+        (subconjunto de ``mes``, ``tipo_documento`` e ``criado_por``).
+        """
+        campos = {
+            'mes': ['mes'],
+            'tipo_documento': ['tipo_documento'],
+            'criado_por': ['criado_por', 'criado_por__username'],
+        }
+        valores = [campo for grupo in agrupar for campo in campos[grupo]]
+        somas = {
+            'soma_total': Coalesce(Sum('total'), 0),
+            'soma_finalizados': Coalesce(Sum('finalizados'), 0),
+            'soma_dias': Coalesce(Sum('dias_ate_finalizacao'), 0),
+        }
+        queryset = EstatisticaEntrega.objects.filter(**filtros)
+        if not valores:
+            return [queryset.aggregate(**somas)]
+        return queryset.values(*valores).annotate(**somas).filter(soma_total__gt=0).order_by(*valores)
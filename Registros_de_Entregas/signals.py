@@ -0,0 +1,56 @@
+"""
+Sinais que mantêm a tabela EstatisticaEntrega atualizada a cada gravação/remoção, na
+transação da própria escrita (``RegistroEntrega.save`` é atómico).
+Operações em massa (``bulk_create``, ``update()``) não disparam sinais; nesses casos
+usar ``manage.py reconstruir_estatisticas``.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import RegistroEntrega
+from .services import EstatisticaEntregaService
+
+
+@receiver(pre_save, sender=RegistroEntrega)
+def guardar_contribuicao_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._estatistica_anterior = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None:
+        # update_fields may name a foreign key by its attname ('criado_por_id')
+        update_fields = {RegistroEntrega._meta.get_field(campo).name for campo in update_fields}
+    if update_fields is not None and not update_fields & {
+        'data_entrega', 'tipo_documento', 'criado_por', 'data_trabalho_finalizado'
+    }:
+        # e.g. image-only saves: nothing the statistics depend on can change
+        instance._estatistica_anterior = EstatisticaEntregaService.contribuicao_registro(instance)
+        return
+    # Locked until the save commits (RegistroEntrega.save is atomic): a concurrent update of
+    # the same registro reads the values this one writes, not the ones both started from
+    anterior = (
+        RegistroEntrega.objects.select_for_update().filter(pk=instance.pk)
+        .values(*EstatisticaEntregaService.CAMPOS).first()
+    )
+    if anterior is not None:
+        instance._estatistica_anterior = EstatisticaEntregaService.contribuicao(anterior)
+
+
+@receiver(post_save, sender=RegistroEntrega)
+def atualizar_estatisticas(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    EstatisticaEntregaService.atualizar(
+        getattr(instance, '_estatistica_anterior', None),
+        EstatisticaEntregaService.contribuicao_registro(instance)
+    )
+
+
+@receiver(post_delete, sender=RegistroEntrega)
+def remover_das_estatisticas(sender, instance, **kwargs):
+    EstatisticaEntregaService.aplicar(EstatisticaEntregaService.contribuicao_registro(instance), -1)
+
+
+@receiver(pre_delete, sender=User)
+def transferir_estatisticas_do_utilizador(sender, instance, **kwargs):
+    EstatisticaEntregaService.transferir_para_sem_autor(instance.pk)
@@ -1,11 +1,26 @@
-from django.test import TestCase
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+from rest_framework import serializers
 from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
-from .models import RegistroEntrega
+from .models import EstatisticaEntrega, RegistroEntrega, RegistroImagem
+from .pagination import RegistroEntregaCursorPagination
+from .services import EstatisticaEntregaService, RegistroEntregaService
 from django.contrib.auth.models import User
 import uuid
+from .serializers import RegistroEntregaListSerializer, RegistroEntregaSerializer
 from .views import RegistroEntregaViewSet
 import json
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from backend.testing import QueryBudgetMixin, TempDirSettingMixin
 
 class RegistroEntregaAPITests(TestCase):
     def setUp(self):
@@ -130,3 +145,560 @@ class RegistroEntregaAPITests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['imagem'], 'test-image-3')
         self.assertEqual(len(response.data['imagens']), 2)
+
+
+PNG_BASE64 = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+
+
+class RegistroEntregaBlobTests(TempDirSettingMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='tecnico', password='tecnico123')
+        self.client.force_authenticate(user=self.user)
+
+    def _criar(self, **extra):
+        data = {
+            'obraId': 'OB1',
+            'dataEntrega': '2024-01-10',
+            'numeroInstalacao': 'INS-1',
+            'numeroObra': 'N1',
+            'assinatura': PNG_BASE64,
+            'imagem': PNG_BASE64,
+            'imagens': [PNG_BASE64, PNG_BASE64],
+        }
+        data.update(extra)
+        return self.client.post('/api/registros/', data, format='json')
+
+    def test_create_stores_references_only(self):
+        response = self._criar()
+        self.assertEqual(response.status_code, 201)
+        registro = RegistroEntrega.objects.get(pk=response.data['id'])
+        self.assertIsNone(registro.imagem)
+        self.assertIsNone(registro.assinatura)
+        self.assertIsNone(registro.imagens)
+        self.assertIsNotNone(registro.imagem_blob_id)
+        self.assertEqual(
+            list(registro.imagens_anexas.values_list('blob_id', flat=True)),
+            [registro.imagem_blob_id] * 2
+        )
+        self.assertIn(f'/api/blobs/{registro.imagem_blob_id}/', response.data['imagem'])
+
+    def test_blank_images_are_accepted_and_skipped(self):
+        response = self._criar(imagens=['', PNG_BASE64])
+        self.assertEqual(response.status_code, 201, response.data)
+        registro = RegistroEntrega.objects.get(pk=response.data['id'])
+        self.assertIsNone(registro.imagens)
+        self.assertEqual(registro.imagens_anexas.count(), 1)
+
+    def test_base64_is_opt_in(self):
+        registro_id = self._criar().data['id']
+        response = self.client.get(f'/api/registros/{registro_id}/images/?formato_imagem=base64')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['imagem'].startswith('data:image/png;base64,'))
+        self.assertEqual(len(response.data['imagens']), 2)
+
+    def test_update_echoing_urls_keeps_references(self):
+        created = self._criar().data
+        response = self.client.patch(
+            f"/api/registros/{created['id']}/",
+            {'imagem': created['imagem'], 'notas': 'editado'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        registro = RegistroEntrega.objects.get(pk=created['id'])
+        self.assertIsNotNone(registro.imagem_blob_id)
+        self.assertIsNone(registro.imagem)
+
+    def test_externalizar_imagens_command(self):
+        registro = RegistroEntrega.objects.create(
+            obra_id='OB2', data_entrega='2024-01-11', numero_instalacao='INS-2',
+            numero_obra='N2', imagem=PNG_BASE64, assinatura='nao-e-base64'
+        )
+        registro.set_imagens([PNG_BASE64])
+        registro.save()
+
+        call_command('externalizar_imagens', stdout=StringIO())
+
+        registro.refresh_from_db()
+        self.assertIsNone(registro.imagem)
+        self.assertIsNotNone(registro.imagem_blob_id)
+        self.assertEqual(registro.assinatura, 'nao-e-base64')
+        self.assertIsNone(registro.imagens)
+        self.assertEqual(registro.imagens_anexas.count(), 1)
+
+    def test_add_and_remove_single_image(self):
+        registro_id = self._criar(imagens=[]).data['id']
+        url = f'/api/registros/{registro_id}/imagens/'
+
+        response = self.client.post(url, {'imagens': [PNG_BASE64]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        primeira = response.data[0]
+        response = self.client.post(url, {'imagem_0': SimpleUploadedFile('foto.png', b'\x89PNG\r\n\x1a\nfoto')},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['ordem'], primeira['ordem'] + 1)
+
+        response = self.client.delete(f"{url}{primeira['id']}/")
+        self.assertEqual(response.status_code, 204)
+        images = self.client.get(f'/api/registros/{registro_id}/images/').data
+        self.assertEqual(len(images['imagens']), 1)
+        self.assertEqual(len(images['imagensDetalhe']), 1)
+
+        outro = User.objects.create_user(username='outro', password='outro123')
+        self.client.force_authenticate(user=outro)
+        response = self.client.post(url, {'imagens': [PNG_BASE64]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_upload_view_appends_rows(self):
+        registro_id = self._criar(imagens=[PNG_BASE64]).data['id']
+        response = self.client.post(
+            f'/api/registros/{registro_id}/upload_images/',
+            {'imagem_0': SimpleUploadedFile('a.png', b'\x89PNG\r\n\x1a\na'),
+             'imagem_1': SimpleUploadedFile('b.png', b'\x89PNG\r\n\x1a\nb')},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['debug_info']['final_image_count'], 3)
+        ordens = list(RegistroImagem.objects.filter(registro_id=registro_id).values_list('ordem', flat=True))
+        self.assertEqual(ordens, [0, 1, 2])
+
+
+class RegistroEntregaPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Several rows share the same date so the id tiebreaker is exercised
+        for i in range(7):
+            RegistroEntrega.objects.create(
+                obra_id=f'P{i}',
+                data_entrega=date(2024, 1, 1 + i // 3),
+                data_entrega_doc=date(2024, 2, 1 + i) if i % 2 else None,
+                numero_instalacao=f'INS-P{i}',
+                numero_obra=f'NP{i}',
+            )
+
+    def _percorrer(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_walks_every_row_once(self):
+        ids, pages = self._percorrer('/api/registros/?page_size=2')
+        self.assertEqual(pages, 4)
+        esperado = [
+            str(pk) for pk in RegistroEntrega.objects.order_by('-data_entrega', 'id').values_list('pk', flat=True)
+        ]
+        self.assertEqual(ids, esperado)
+
+    def test_nullable_ordering_field(self):
+        ids, _ = self._percorrer('/api/registros/?page_size=3&ordering=data_entrega_doc')
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_previous_link_returns_same_page(self):
+        first = self.client.get('/api/registros/?page_size=3').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [item['id'] for item in back['results']],
+            [item['id'] for item in first['results']]
+        )
+
+    def test_estimated_total_and_page_size_cap(self):
+        response = self.client.get('/api/registros/?estimar_total=1&page_size=100000')
+        self.assertIn('total_estimado', response.data)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/registros/?cursor=nao-e-um-cursor')
+        self.assertEqual(response.status_code, 404)
+        # Well-formed cursors whose values do not fit the fields
+        paginacao = RegistroEntregaCursorPagination()
+        for cursor in ({'o': '-data_entrega', 'v': 'x', 'pk': str(uuid.uuid4())},
+                       {'o': '-data_entrega', 'v': '2024-01-01', 'pk': 'nao-e-um-uuid'}):
+            response = self.client.get('/api/registros/', {'cursor': paginacao.encode_cursor(cursor)})
+            self.assertEqual(response.status_code, 404)
+
+    def test_legacy_page_number_mode(self):
+        response = self.client.get('/api/registros/?page=1&page_size=5')
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class RegistroEntregaListProjectionTests(TempDirSettingMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.registro = RegistroEntrega.objects.create(
+            obra_id='L1',
+            data_entrega=date(2024, 3, 1),
+            numero_instalacao='INS-L1',
+            numero_obra='NL1',
+            assinatura='data:image/png;base64,iVBORw0KGgo=',
+            imagens='["data:image/png;base64,iVBORw0KGgo="]',
+        )
+        RegistroEntregaService.externalizar_registro(self.registro)
+        self.registro.save()
+
+    def test_list_omits_image_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/registros/')
+        self.assertEqual(response.status_code, 200)
+        item = response.data['results'][0]
+        self.assertNotIn('assinatura', item)
+        self.assertNotIn('imagens', item)
+        self.assertTrue(item['temAssinatura'])
+        self.assertFalse(item['temImagem'])
+        self.assertEqual(item['numImagens'], 1)
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('"imagens"', sql)
+
+    def test_retrieve_keeps_full_payload(self):
+        response = self.client.get(f'/api/registros/{self.registro.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/api/blobs/', response.data['assinatura'])
+        self.assertEqual(len(response.data['imagens']), 1)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_registros', registros=3, tamanho_imagem=64, page_size=2, stdout=out)
+        self.assertIn('depois', out.getvalue())
+        self.assertEqual(RegistroEntrega.objects.count(), 1)
+
+    def test_benchmark_filtros_command(self):
+        out = StringIO()
+        call_command('benchmark_registros', cenario='filtros', registros=200, stdout=out)
+        self.assertIn('tipo_documento + data_entrega', out.getvalue())
+        self.assertEqual(RegistroEntrega.objects.count(), 1)
+        self.assertFalse(User.objects.filter(username__startswith='benchmark-registros-').exists())
+
+
+class RegistroEntregaCamelCaseSerializerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='camel', first_name='Ana', password='pass')
+        self.registro = RegistroEntrega.objects.create(
+            obra_id='C1',
+            data_entrega=date(2024, 5, 2),
+            data_trabalho_finalizado=date(2024, 5, 9),
+            numero_instalacao='INS-C1',
+            numero_obra='NC1',
+            notas='nota',
+            tipo_documento='obra',
+            criado_por=self.user,
+        )
+
+    def test_representation_matches_drf_fields(self):
+        serializer = RegistroEntregaSerializer()
+        esperado = serializers.ModelSerializer.to_representation(serializer, self.registro)
+        data = serializer.to_representation(self.registro)
+        for name, key in serializer.camel_case_fields.items():
+            if name not in ('assinatura', 'imagem', 'imagens'):
+                self.assertEqual(data[key], esperado[name], name)
+        self.assertEqual(data['criadoPor']['first_name'], 'Ana')
+        self.assertEqual(data['dataEntrega'], '2024-05-02')
+        self.assertIsNone(data['dataEntregaDoc'])
+
+    def test_list_serializer_accepts_values_rows(self):
+        queryset = RegistroEntregaService.projecao_listagem(RegistroEntrega.objects.all())
+        instancia = RegistroEntregaListSerializer(queryset, many=True).data[0]
+        campos = [campo for campo in RegistroEntregaListSerializer.Meta.fields if campo != 'criado_por']
+        linha = queryset.values(
+            *campos, 'criado_por__id', 'criado_por__username', 'criado_por__first_name', 'criado_por__last_name',
+        )
+        self.assertEqual(RegistroEntregaListSerializer(linha, many=True).data[0], instancia)
+
+    def test_write_validates_camel_case_payload(self):
+        self.client.force_authenticate(self.user)
+        payload = {
+            'obraId': 'C2', 'dataEntrega': '2024-06-01', 'dataEntregaDoc': '',
+            'numeroInstalacao': 'INS-C2', 'numeroObra': 'NC2', 'tipoDocumento': 'obra',
+        }
+        response = self.client.post('/api/registros/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIsNone(RegistroEntrega.objects.get(obra_id='C2').data_entrega_doc)
+
+        response = self.client.post('/api/registros/', dict(payload, dataEntrega='31/02/2024'), format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_benchmark_serializador_command(self):
+        out = StringIO()
+        call_command('benchmark_registros', cenario='serializador', registros=20, repeticoes=1, stdout=out)
+        self.assertIn('plano compilado', out.getvalue())
+        self.assertEqual(RegistroEntrega.objects.count(), 1)
+
+
+class RegistroEntregaQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='budget', password='pass')
+        self.registro = self._criar(0)
+
+    def _criar(self, i):
+        return RegistroEntrega.objects.create(
+            obra_id=f'Q{i}',
+            data_entrega=date(2024, 4, 1),
+            numero_instalacao=f'INS-Q{i}',
+            numero_obra=f'NQ{i}',
+            criado_por=User.objects.create_user(username=f'autor{i}', password='pass'),
+        )
+
+    def _criar_varios(self, n):
+        inicio = RegistroEntrega.objects.count()
+        for i in range(inicio, inicio + n):
+            self._criar(i)
+
+    def test_list_budget(self):
+        self.assertQueryBudget('/api/registros/', 1, self._criar_varios)
+
+    def test_list_legacy_page_budget(self):
+        self.assertQueryBudget('/api/registros/?page=1', 2, self._criar_varios)
+
+    def test_retrieve_budget(self):
+        url = f'/api/registros/{self.registro.pk}/'
+        self.assertQueryBudget(url, 3, lambda n: None)
+        _, response = self.count_queries(url)
+        self.assertEqual(response.data['criadoPor']['username'], 'autor0')
+
+
+class RegistroEntregaExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='financas', password='pass')
+        for i in range(5):
+            RegistroEntrega.objects.create(
+                obra_id=f'E{i}',
+                data_entrega=date(2024, 5, 1 + i),
+                numero_instalacao=f'INS-E{i}',
+                numero_obra=f'NE{i}',
+                notas='Entrega; com "aspas"' if i == 0 else None,
+                tipo_documento='obra',
+                criado_por=self.user,
+                assinatura='data:image/png;base64,iVBORw0KGgo=',
+            )
+
+    def test_csv_streams_filtered_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/registros/exportar/?data_entrega_inicio=2024-05-01&data_entrega_fim=2024-05-03'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            conteudo = b''.join(response.streaming_content).decode('utf-8')
+
+        self.assertTrue(conteudo.startswith('\ufeffID;ID da Obra'))
+        linhas = conteudo.strip().splitlines()
+        self.assertEqual(len(linhas), 4)
+        self.assertIn('"Entrega; com ""aspas"""', linhas[1])
+        self.assertIn('3. Obra', linhas[1])
+        self.assertIn('financas', linhas[1])
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('"assinatura"', sql)
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get('/api/registros/exportar/?formato=xlsx&numero_obra=NE2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        folha = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        linhas = list(folha.values)
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(linhas[1][1], 'E2')
+
+    @override_settings(TIME_ZONE='Europe/Lisbon')
+    def test_formulas_are_not_evaluated(self):
+        from openpyxl import load_workbook
+
+        RegistroEntrega.objects.filter(obra_id='E3').update(
+            notas='=HYPERLINK("http://exemplo.pt")', numero_obra='+351', obra_id='@SUM(A1)',
+            data_criacao=datetime(2024, 7, 1, 10, 0, tzinfo=dt_timezone.utc),
+        )
+        conteudo = b''.join(self.client.get('/api/registros/exportar/?numero_obra=%2B351').streaming_content)
+        linha = conteudo.decode('utf-8').strip().splitlines()[1]
+        self.assertIn(";'@SUM(A1);'+351;", linha)
+        self.assertIn('"\'=HYPERLINK(""http://exemplo.pt"")"', linha)
+
+        response = self.client.get('/api/registros/exportar/?formato=xlsx&numero_obra=%2B351')
+        folha = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        linha = list(folha.values)[1]
+        self.assertEqual(linha[1:3], ("'@SUM(A1)", "'+351"))
+        self.assertEqual(linha[8], '\'=HYPERLINK("http://exemplo.pt")')
+        # Local time (summer time in Lisbon), not UTC
+        self.assertEqual(linha[10], datetime(2024, 7, 1, 11, 0))
+
+    def test_invalid_format(self):
+        response = self.client.get('/api/registros/exportar/?formato=pdf')
+        self.assertEqual(response.status_code, 400)
+
+
+class EstatisticaEntregaTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tecnico = User.objects.create_user(username='tecnico', password='pass')
+
+    def _criar(self, **kwargs):
+        dados = {
+            'obra_id': 'S1',
+            'data_entrega': date(2024, 6, 10),
+            'numero_instalacao': 'INS-S1',
+            'numero_obra': 'NS1',
+            'tipo_documento': 'obra',
+            'criado_por': self.tecnico,
+        }
+        dados.update(kwargs)
+        return RegistroEntrega.objects.create(**dados)
+
+    def _resumo(self):
+        return sorted(
+            EstatisticaEntrega.objects.filter(total__gt=0).values_list(
+                'mes', 'tipo_documento', 'criado_por_id', 'total', 'finalizados', 'dias_ate_finalizacao'
+            ),
+            key=str
+        )
+
+    def test_incremental_matches_rebuild(self):
+        registro = self._criar(data_trabalho_finalizado=date(2024, 6, 14))
+        self._criar(data_entrega=date(2024, 6, 20))
+        outro = self._criar(tipo_documento=None, criado_por=None)
+
+        registro.tipo_documento = 'retirada_lixo'
+        registro.data_trabalho_finalizado = date(2024, 6, 30)
+        registro.save()
+        outro.data_entrega = '2024-07-02'
+        outro.save()
+        self._criar(data_entrega=date(2024, 8, 1)).delete()
+
+        incremental = self._resumo()
+        self.assertIn((date(2024, 6, 1), 'retirada_lixo', self.tecnico.pk, 1, 1, 20), incremental)
+        self.assertIn((date(2024, 7, 1), '', None, 1, 0, 0), incremental)
+
+        EstatisticaEntregaService.reconstruir()
+        self.assertEqual(self._resumo(), incremental)
+
+    def test_update_fields_by_attname(self):
+        registro = self._criar()
+        outro = User.objects.create_user(username='outro', password='pass')
+        registro.criado_por_id = outro.pk
+        registro.save(update_fields=['criado_por_id'])
+        self.assertEqual(self._resumo(), [(date(2024, 6, 1), 'obra', outro.pk, 1, 0, 0)])
+
+    def test_deleted_user_moves_to_no_author(self):
+        self._criar()
+        self._criar(criado_por=None)
+        self.tecnico.delete()
+        self.assertEqual(self._resumo(), [(date(2024, 6, 1), 'obra', None, 2, 0, 0)])
+
+    def test_endpoint(self):
+        self._criar(data_trabalho_finalizado=date(2024, 6, 12))
+        self._criar(data_trabalho_finalizado=date(2024, 6, 15))
+        self._criar(data_entrega=date(2024, 5, 3), tipo_documento='retirada_lixo')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/registros/estatisticas/?agrupar=mes,tipo_documento,criado_por')
+        self.assertEqual(response.status_code, 200)
+        junho = response.data['estatisticas'][1]
+        self.assertEqual(junho['mes'], '2024-06')
+        self.assertEqual(junho['tipoDocumentoLabel'], '3. Obra')
+        self.assertEqual(junho['criadoPor']['username'], 'tecnico')
+        self.assertEqual(junho['total'], 2)
+        self.assertEqual(junho['mediaDiasAteFinalizacao'], 3.5)
+
+        response = self.client.get('/api/registros/estatisticas/?agrupar=tipo_documento&mes_inicio=2024-06')
+        self.assertEqual([linha['total'] for linha in response.data['estatisticas']], [2])
+
+        response = self.client.get('/api/registros/estatisticas/?agrupar=&mes_fim=2024-12')
+        self.assertEqual(response.data['estatisticas'][0]['total'], 3)
+
+        response = self.client.get('/api/registros/estatisticas/?agrupar=obra')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_command(self):
+        self._criar()
+        EstatisticaEntrega.objects.all().delete()
+        out = StringIO()
+        call_command('reconstruir_estatisticas', stdout=out)
+        self.assertIn('1 linhas', out.getvalue())
+        self.assertEqual(self._resumo(), [(date(2024, 6, 1), 'obra', self.tecnico.pk, 1, 0, 0)])
+
+
+class EstatisticaEntregaReconstrucaoConcorrenteTests(TransactionTestCase):
+    def _criar(self, obra_id):
+        return RegistroEntrega.objects.create(
+            obra_id=obra_id, data_entrega=date(2024, 6, 10), numero_instalacao=f'INS-{obra_id}',
+            numero_obra=f'N{obra_id}', tipo_documento='obra',
+        )
+
+    def test_registro_gravado_durante_a_reconstrucao_nao_se_perde(self):
+        self._criar('C1')
+        agregado = threading.Event()
+        gravado = threading.Event()
+        linhas_agregadas = EstatisticaEntregaService.linhas_agregadas
+
+        def agregar_e_esperar():
+            linhas = linhas_agregadas()
+            agregado.set()
+            # Gives the concurrent writer the chance to finish before the table is replaced;
+            # while the rebuild holds the lock its statistics update has to wait instead
+            gravado.wait(timeout=1)
+            return linhas
+
+        def gravar():
+            try:
+                agregado.wait(timeout=5)
+                self._criar('C2')
+                gravado.set()
+            finally:
+                connection.close()
+
+        escritor = threading.Thread(target=gravar)
+        escritor.start()
+        with mock.patch.object(EstatisticaEntregaService, 'linhas_agregadas', side_effect=agregar_e_esperar):
+            EstatisticaEntregaService.reconstruir()
+        escritor.join()
+
+        self.assertEqual(RegistroEntrega.objects.count(), 2)
+        self.assertEqual(
+            list(EstatisticaEntrega.objects.values_list('mes', 'tipo_documento', 'total')),
+            [(date(2024, 6, 1), 'obra', 2)],
+        )
+
+    def test_registro_gravado_antes_da_leitura_dos_agregados_conta_uma_vez(self):
+        self._criar('C1')
+        linhas_agregadas = EstatisticaEntregaService.linhas_agregadas
+
+        def gravar():
+            try:
+                self._criar('C2')
+            finally:
+                connection.close()
+
+        escritor = threading.Thread(target=gravar)
+
+        def gravar_e_agregar():
+            # The writer inserts its registro and then waits for the rebuild lock to apply
+            # its statistics update; only then is the aggregate read
+            escritor.start()
+            with connection.cursor() as cursor:
+                for _ in range(500):
+                    cursor.execute('SELECT count(*) FROM pg_locks WHERE NOT granted')
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.01)
+            return linhas_agregadas()
+
+        with mock.patch.object(EstatisticaEntregaService, 'linhas_agregadas', side_effect=gravar_e_agregar):
+            EstatisticaEntregaService.reconstruir()
+        escritor.join()
+
+        self.assertEqual(RegistroEntrega.objects.count(), 2)
+        self.assertEqual(
+            list(EstatisticaEntrega.objects.values_list('mes', 'tipo_documento', 'total')),
+            [(date(2024, 6, 1), 'obra', 2)],
+        )
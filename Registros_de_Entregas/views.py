@@ -2,10 +2,13 @@ from django.shortcuts import render
 from rest_framework import viewsets, filters
 from rest_framework.response import Response
 from rest_framework import status
-from .models import RegistroEntrega
-from .serializers import RegistroEntregaSerializer
+from .models import RegistroEntrega, RegistroImagem
+from .serializers import RegistroEntregaSerializer, RegistroEntregaListSerializer
+from .services import RegistroEntregaService, EstatisticaEntregaService
+from blobstore.services import BlobService
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.pagination import PageNumberPagination
+from .pagination import RegistroEntregaCursorPagination
+from .exportacao import EXPORTADORES
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.files.storage import default_storage
@@ -16,8 +19,9 @@ import json
 import logging
 import traceback
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -26,7 +30,11 @@ class RegistroEntregaViewSet(viewsets.ModelViewSet):
     """
     API endpoint que permite operações CRUD em Registros de Entrega
     """
-    queryset = RegistroEntrega.objects.all()
+    queryset = RegistroEntrega.objects.select_related(
+        'criado_por', 'assinatura_blob', 'imagem_blob'
+    ).prefetch_related(
+        Prefetch('imagens_anexas', queryset=RegistroImagem.objects.select_related('blob'))
+    )
     serializer_class = RegistroEntregaSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = [
@@ -39,7 +47,21 @@ class RegistroEntregaViewSet(viewsets.ModelViewSet):
         'data_entrega', 'data_entrega_doc', 'data_trabalho_finalizado',
         'data_criacao', 'criado_em', 'tipo_documento'
     ]
-    pagination_class = PageNumberPagination
+    pagination_class = RegistroEntregaCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # List screens never load the image columns; see the images action for those
+            queryset = RegistroEntregaService.projecao_listagem(
+                RegistroEntrega.objects.select_related('criado_por')
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RegistroEntregaListSerializer
+        return super().get_serializer_class()
 
     def list(self, request, *args, **kwargs):
         """
@@ -61,6 +83,9 @@ class RegistroEntregaViewSet(viewsets.ModelViewSet):
 
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
+        except APIException:
+            # Let DRF render client errors such as an invalid cursor
+            raise
         except Exception as e:
             logger.error(f"Error in list method: {str(e)}")
             return Response(
@@ -216,11 +241,12 @@ class RegistroEntregaViewSet(viewsets.ModelViewSet):
         try:
             registro = self.get_object()
             
-            # Return only images data
+            # Return only images data (blob URLs, or base64 with ?formato_imagem=base64)
             return Response({
                 'id': str(registro.id),
-                'imagem': registro.imagem,
-                'imagens': registro.get_imagens()
+                'imagem': RegistroEntregaService.representar_blob(registro, 'imagem', request),
+                'imagens': RegistroEntregaService.representar_imagens(registro, request),
+                'imagensDetalhe': RegistroEntregaService.detalhar_imagens(registro, request)
             })
         except Exception as e:
             logger.error(f"Error fetching images: {str(e)}")
@@ -229,6 +255,139 @@ class RegistroEntregaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=True, methods=['post'], url_path='imagens')
+    def adicionar_imagens(self, request, pk=None):
+        """
+        Acrescenta uma ou mais imagens ao registro sem reescrever as existentes.
+        Aceita ficheiros (multipart) ou uma lista ``imagens`` em base64 (JSON).
+        """
+        registro = self.get_object()
+        if not self._has_update_permission(request.user, registro):
+            return Response(
+                {"error": "Você não tem permissão para editar este registro"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        blobs = [
+            BlobService.store_bytes(ficheiro.read())
+            for ficheiro in request.FILES.values()
+        ]
+        imagens = request.data.get('imagens', []) if not request.FILES else []
+        if isinstance(imagens, str):
+            imagens = [imagens]
+        for imagem in imagens:
+            blob = RegistroEntregaService.resolver_blob(imagem)
+            if blob is None:
+                return Response(
+                    {"error": "Imagem inválida: esperado base64 ou URL de blob"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            blobs.append(blob)
+
+        if not blobs:
+            return Response({"error": "Nenhuma imagem enviada"}, status=status.HTTP_400_BAD_REQUEST)
+
+        criadas = RegistroEntregaService.adicionar_imagens(registro, blobs)
+        return Response(
+            [
+                {'id': anexa.pk, 'ordem': anexa.ordem, 'url': BlobService.url_for(anexa.blob_id, request)}
+                for anexa in criadas
+            ],
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['delete'], url_path=r'imagens/(?P<imagem_id>\d+)')
+    def remover_imagem(self, request, pk=None, imagem_id=None):
+        """
+        Remove uma única imagem adicional do registro.
+        """
+        registro = self.get_object()
+        if not self._has_update_permission(request.user, registro):
+            return Response(
+                {"error": "Você não tem permissão para editar este registro"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if not RegistroEntregaService.remover_imagem(registro, imagem_id):
+            return Response({"error": "Imagem não encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'])
+    def estatisticas(self, request):
+        """
+        Totais de registros lidos da tabela de resumo (não percorre os registros).
+
+        - ``?agrupar=`` lista separada por vírgulas de ``mes``, ``tipo_documento``, ``criado_por``
+          (omissão: ``mes,tipo_documento``)
+        - ``?mes_inicio=`` / ``?mes_fim=`` no formato ``AAAA-MM``
+        - ``?tipo_documento=`` e ``?criado_por=`` (id do utilizador)
+        """
+        params = request.query_params
+        agrupar = [grupo.strip() for grupo in params.get('agrupar', 'mes,tipo_documento').split(',') if grupo.strip()]
+        invalidos = set(agrupar) - {'mes', 'tipo_documento', 'criado_por'}
+        if invalidos:
+            return Response(
+                {"error": "Agrupamento inválido", "detail": f"Campos desconhecidos: {', '.join(sorted(invalidos))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        filtros = {}
+        try:
+            if params.get('mes_inicio'):
+                filtros['mes__gte'] = datetime.strptime(params['mes_inicio'], '%Y-%m').date()
+            if params.get('mes_fim'):
+                filtros['mes__lte'] = datetime.strptime(params['mes_fim'], '%Y-%m').date()
+            if params.get('criado_por'):
+                filtros['criado_por_id'] = int(params['criado_por'])
+        except ValueError as e:
+            return Response(
+                {"error": "Parâmetros inválidos", "detail": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if params.get('tipo_documento'):
+            filtros['tipo_documento'] = params['tipo_documento']
+
+        tipos = dict(RegistroEntrega.TIPO_DOCUMENTO_CHOICES)
+        resultados = []
+        for linha in EstatisticaEntregaService.consultar(agrupar, filtros):
+            item = {}
+            if 'mes' in agrupar:
+                item['mes'] = linha['mes'].strftime('%Y-%m')
+            if 'tipo_documento' in agrupar:
+                item['tipoDocumento'] = linha['tipo_documento'] or None
+                item['tipoDocumentoLabel'] = tipos.get(linha['tipo_documento'], 'Sem tipo')
+            if 'criado_por' in agrupar:
+                item['criadoPor'] = (
+                    {'id': linha['criado_por'], 'username': linha['criado_por__username']}
+                    if linha['criado_por'] else None
+                )
+            item['total'] = linha['soma_total']
+            item['finalizados'] = linha['soma_finalizados']
+            item['mediaDiasAteFinalizacao'] = (
+                round(linha['soma_dias'] / linha['soma_finalizados'], 1) if linha['soma_finalizados'] else None
+            )
+            resultados.append(item)
+
+        return Response({'success': True, 'estatisticas': resultados})
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta todos os registros que correspondem aos filtros (os mesmos da listagem,
+        incluindo os intervalos de datas) em ``?formato=csv`` (omissão) ou ``?formato=xlsx``.
+        """
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in EXPORTADORES:
+            return Response(
+                {"error": "Formato de exportação inválido", "detail": f"Formatos suportados: {', '.join(EXPORTADORES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(RegistroEntrega.objects.all())
+        queryset = self._apply_advanced_filters(request, queryset)
+        nome_ficheiro = f"registros_entrega_{datetime.now():%Y%m%d_%H%M}"
+        return EXPORTADORES[formato](queryset, nome_ficheiro)
+
     @action(detail=False, methods=['get'])
     def document_types(self, request):
         """
@@ -265,7 +424,10 @@ class RegistroDiagnosticView(APIView):
                 'id': str(registro.id),
                 'imagens_raw': registro.imagens,  # Raw JSON string from DB
                 'imagens_parsed': registro.get_imagens(),  # Parsed list
+                'imagens_anexas': RegistroEntregaService.detalhar_imagens(registro),
                 'imagem': registro.imagem,
+                'imagem_blob': registro.imagem_blob_id,
+                'assinatura_blob': registro.assinatura_blob_id,
                 'data_entrega': registro.data_entrega,
                 'data_entrega_doc': registro.data_entrega_doc,
                 'data_trabalho_finalizado': registro.data_trabalho_finalizado,
@@ -278,7 +440,7 @@ class RegistroDiagnosticView(APIView):
             return Response({
                 'success': True,
                 'diagnostic_info': raw_data,
-                'serialized_data': RegistroEntregaSerializer(registro).data
+                'serialized_data': RegistroEntregaSerializer(registro, context={'request': request}).data
             }, status=status.HTTP_200_OK)
             
         except RegistroEntrega.DoesNotExist:
@@ -302,7 +464,7 @@ class RegistroUploadImagesView(APIView):
             registro = RegistroEntrega.objects.get(pk=pk)
             
             # Get the initial state
-            initial_images = registro.get_imagens()
+            initial_images = RegistroEntregaService.representar_imagens(registro)
             
             # Collect all image files from the request
             image_files = []
@@ -319,36 +481,25 @@ class RegistroUploadImagesView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Save each image file and convert to base64
-            saved_images = []
-            for img_file in image_files:
-                # Generate a unique name for the image
-                img_name = f"{registro.pk}_{uuid.uuid4()}_{img_file.name}"
-                
-                # Save the image file to storage
-                file_path = default_storage.save(f'registros/images/{img_name}', img_file)
-                
-                # Read file and convert to base64 for storage
-                with default_storage.open(file_path) as f:
-                    image_data = f.read()
-                    base64_image = base64.b64encode(image_data).decode('utf-8')
-                    saved_images.append(base64_image)
-                
-                # Clean up the file since we're storing it as base64
-                default_storage.delete(file_path)
+            # Store each image file in the blob store and keep only its reference
+            saved_images = [
+                BlobService.store_bytes(img_file.read())
+                for img_file in image_files
+            ]
             
-            # Update the registro with the new images
-            current_images = registro.get_imagens() or []
-            current_images.extend(saved_images)
+            # Move any legacy inline images out of the row before appending
+            alterados = RegistroEntregaService.externalizar_registro(registro)
+            if alterados:
+                registro.save(update_fields=alterados)
             
-            registro.set_imagens(current_images)
-            registro.save()
+            # Append only the new rows; previous images are never rewritten
+            RegistroEntregaService.adicionar_imagens(registro, saved_images)
             
             # Verify images were saved correctly
-            final_images = registro.get_imagens()
+            final_images = RegistroEntregaService.representar_imagens(registro)
             
             # Return the updated registro
-            serializer = RegistroEntregaSerializer(registro)
+            serializer = RegistroEntregaSerializer(registro, context={'request': request})
             return Response({
                 'success': True,
                 'data': serializer.data,
@@ -22,8 +22,10 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
+def save_user_profile(sender, instance, created, **kwargs):
+    # Só grava o perfil se já estiver carregado; caso contrário cada gravação do usuário
+    # (incluindo o last_login no login) custaria uma consulta e um UPDATE extra
+    if not created and User.profile.related.is_cached(instance):
         instance.profile.save()
 
 # Se você quiser registrar esse modelo no admin, adicione ao admin.py:
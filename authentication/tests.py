@@ -1,3 +1,35 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from backend.testing import QueryBudgetMixin
+from .models import UserProfile
+
+
+class AuthenticationQueryTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='perfil', email='perfil@example.com', password='pass')
+
+    def criar_usuarios(self, n):
+        inicio = User.objects.count()
+        for i in range(inicio, inicio + n):
+            User.objects.create_user(username=f'outro{i}', password='pass')
+
+    def test_profile_created_with_user(self):
+        self.assertTrue(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_saving_user_does_not_touch_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_profile_budget(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertQueryBudget('/api/users/profile/', 1, self.criar_usuarios)
+
+    def test_login_budget(self):
+        self.assertQueryBudget(
+            '/api/auth/login/', 4, self.criar_usuarios, method='post',
+            data={'username': 'perfil@example.com', 'password': 'pass'}, format='json'
+        )
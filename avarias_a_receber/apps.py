@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class AvariasAReceberConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'avarias_a_receber'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,150 @@
+"""
+Leitura tolerante das datas e horas das avarias.
+
+Até à migração 0006 estes campos eram texto livre, gravado por clientes diferentes em
+formatos diferentes (ISO, ``dd/mm/aaaa hh:mm``, ``toLocaleString`` do browser, só a hora...).
+Estas regras aceitam o que os clientes ainda enviam; a migração 0006 usou uma cópia
+delas para converter os valores antigos. Sem fuso horário, um valor é interpretado no fuso de ``settings.TIME_ZONE``,
+como no resto da API.
+"""
+import re
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Formatos com dia primeiro (pt-PT) tentados depois do ISO; separadores normalizados para '/'
+FORMATOS_DATA_HORA = (
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %Hh%M',
+    '%d/%m/%Y %H:%M:%S.%f',
+    '%d/%m/%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%d/%m/%y %H:%M',
+    '%d/%m/%y',
+)
+FORMATOS_HORA = ('%H:%M:%S', '%H:%M', '%Hh%M', '%Hh')
+
+# Campos de data/hora de uma avaria; os pares (início, fim) servem para acertar o dia dos fins
+CAMPOS = (
+    'data_da_avaria', 'fim_da_avaria',
+    'inicio_deslocacao1', 'fim_deslocacao1', 'inicio_deslocacao2', 'fim_deslocacao2',
+)
+PARES = (
+    ('data_da_avaria', 'fim_da_avaria'),
+    ('inicio_deslocacao1', 'fim_deslocacao1'),
+    ('inicio_deslocacao2', 'fim_deslocacao2'),
+)
+
+_SEPARADORES_DATA = re.compile(r'(?<=\d)[.-](?=\d)')
+_ESPACOS = re.compile(r'\s+')
+
+
+def _normalizar(texto):
+    texto = str(texto).strip()
+    # "05/03/2024, 14:30:00" (toLocaleString) and "2024-03-05 às 14:30"
+    texto = texto.replace(',', ' ').replace(' às ', ' ').replace(' as ', ' ')
+    return _ESPACOS.sub(' ', texto).strip()
+
+
+def _consciente(valor):
+    return timezone.make_aware(valor) if timezone.is_naive(valor) else valor
+
+
+def interpretar_hora(texto):
+    """``time`` se ``texto`` for só uma hora ("14:30", "14h30"), senão ``None``."""
+    texto = _normalizar(texto).lower()
+    for formato in FORMATOS_HORA:
+        try:
+            return datetime.strptime(texto, formato).time()
+        except ValueError:
+            continue
+    return None
+
+
+def interpretar_data(texto):
+    """``date`` se ``texto`` for só uma data ("2024-03-05", "05/03/2024"), senão ``None``."""
+    texto = _SEPARADORES_DATA.sub('/', _normalizar(texto))
+    for formato in ('%Y/%m/%d', '%d/%m/%Y'):
+        try:
+            valor = datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+        if valor.year >= 1900:
+            return valor.date()
+    return None
+
+
+def interpretar_data_hora(texto):
+    """
+    Datetime com fuso horário para ``texto``, ou ``None`` se não for reconhecido.
+    Datas sem hora ficam à meia-noite; uma hora sozinha não é aceite (ver ``interpretar_avaria``).
+    """
+    if texto is None:
+        return None
+    if isinstance(texto, datetime):
+        return _consciente(texto)
+    if isinstance(texto, date):
+        return _consciente(datetime.combine(texto, time()))
+    texto = _normalizar(texto)
+    if not texto:
+        return None
+
+    try:
+        valor = parse_datetime(texto.replace(' ', 'T', 1) if 'T' not in texto else texto)
+    except ValueError:  # Looks like ISO but is out of range (e.g. month 13)
+        valor = None
+    if valor is not None:
+        return _consciente(valor)
+
+    barras = _SEPARADORES_DATA.sub('/', texto)
+    for formato in FORMATOS_DATA_HORA:
+        try:
+            valor = datetime.strptime(barras, formato)
+        except ValueError:
+            continue
+        # '%Y' also accepts '24', which would be the year 24
+        if valor.year >= 1900:
+            return _consciente(valor)
+    return None
+
+
+def _vazio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def interpretar_avaria(valores):
+    """
+    Converte os campos ``CAMPOS`` de uma avaria (texto, ``datetime`` ou ``time``).
+
+    Uma hora sozinha recebe a data da avaria; se for o fim de um par e ficar antes do
+    início, passou a meia-noite e fica no dia seguinte.
+    Retorna ``(convertidos, falhas)``: ``falhas`` tem o valor original de cada campo que
+    não foi possível interpretar (e que fica ``None`` em ``convertidos``).
+    """
+    dia = interpretar_data_hora(valores.get('data_da_avaria'))
+    dia = timezone.localtime(dia).date() if dia else None
+    convertidos, falhas, so_hora = {}, {}, set()
+    for campo in CAMPOS:
+        valor = valores.get(campo)
+        convertido = None
+        if _vazio(valor):
+            pass
+        elif isinstance(valor, time) or (isinstance(valor, str) and interpretar_hora(valor)):
+            hora = valor if isinstance(valor, time) else interpretar_hora(valor)
+            if dia is not None:
+                convertido = _consciente(datetime.combine(dia, hora))
+                so_hora.add(campo)
+        else:
+            convertido = interpretar_data_hora(valor)
+        if convertido is None and not _vazio(valor):
+            falhas[campo] = valor.isoformat() if isinstance(valor, time) else str(valor)
+        convertidos[campo] = convertido
+
+    for inicio, fim in PARES:
+        if fim in so_hora and convertidos[inicio] and convertidos[fim] < convertidos[inicio]:
+            convertidos[fim] += timedelta(days=1)
+    return convertidos, falhas
@@ -0,0 +1,236 @@
+import re
+from datetime import date, datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+LOTE = 1000
+
+# The date parser of avarias_a_receber/datas.py as it was when this migration was written,
+# copied so that later changes to the app's parser do not change what the migration does
+
+# Formatos com dia primeiro (pt-PT) tentados depois do ISO; separadores normalizados para '/'
+FORMATOS_DATA_HORA = (
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %Hh%M',
+    '%d/%m/%Y %H:%M:%S.%f',
+    '%d/%m/%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%d/%m/%y %H:%M',
+    '%d/%m/%y',
+)
+FORMATOS_HORA = ('%H:%M:%S', '%H:%M', '%Hh%M', '%Hh')
+
+# Campos de data/hora de uma avaria; os pares (início, fim) servem para acertar o dia dos fins
+CAMPOS = (
+    'data_da_avaria', 'fim_da_avaria',
+    'inicio_deslocacao1', 'fim_deslocacao1', 'inicio_deslocacao2', 'fim_deslocacao2',
+)
+PARES = (
+    ('data_da_avaria', 'fim_da_avaria'),
+    ('inicio_deslocacao1', 'fim_deslocacao1'),
+    ('inicio_deslocacao2', 'fim_deslocacao2'),
+)
+
+_SEPARADORES_DATA = re.compile(r'(?<=\d)[.-](?=\d)')
+_ESPACOS = re.compile(r'\s+')
+
+
+def _normalizar(texto):
+    texto = str(texto).strip()
+    # "05/03/2024, 14:30:00" (toLocaleString) and "2024-03-05 às 14:30"
+    texto = texto.replace(',', ' ').replace(' às ', ' ').replace(' as ', ' ')
+    return _ESPACOS.sub(' ', texto).strip()
+
+
+def _consciente(valor):
+    return timezone.make_aware(valor) if timezone.is_naive(valor) else valor
+
+
+def interpretar_hora(texto):
+    """``time`` se ``texto`` for só uma hora ("14:30", "14h30"), senão ``None``."""
+    texto = _normalizar(texto).lower()
+    for formato in FORMATOS_HORA:
+        try:
+            return datetime.strptime(texto, formato).time()
+        except ValueError:
+            continue
+    return None
+
+
+def interpretar_data_hora(texto):
+    """
+    Datetime com fuso horário para ``texto``, ou ``None`` se não for reconhecido.
+    Datas sem hora ficam à meia-noite; uma hora sozinha não é aceite (ver ``interpretar_avaria``).
+    """
+    if texto is None:
+        return None
+    if isinstance(texto, datetime):
+        return _consciente(texto)
+    if isinstance(texto, date):
+        return _consciente(datetime.combine(texto, time()))
+    texto = _normalizar(texto)
+    if not texto:
+        return None
+
+    try:
+        valor = parse_datetime(texto.replace(' ', 'T', 1) if 'T' not in texto else texto)
+    except ValueError:  # Looks like ISO but is out of range (e.g. month 13)
+        valor = None
+    if valor is not None:
+        return _consciente(valor)
+
+    barras = _SEPARADORES_DATA.sub('/', texto)
+    for formato in FORMATOS_DATA_HORA:
+        try:
+            valor = datetime.strptime(barras, formato)
+        except ValueError:
+            continue
+        # '%Y' also accepts '24', which would be the year 24
+        if valor.year >= 1900:
+            return _consciente(valor)
+    return None
+
+
+def _vazio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def interpretar_avaria(valores):
+    """
+    Converte os campos ``CAMPOS`` de uma avaria (texto, ``datetime`` ou ``time``).
+
+    Uma hora sozinha recebe a data da avaria; se for o fim de um par e ficar antes do
+    início, passou a meia-noite e fica no dia seguinte.
+    Retorna ``(convertidos, falhas)``: ``falhas`` tem o valor original de cada campo que
+    não foi possível interpretar (e que fica ``None`` em ``convertidos``).
+    """
+    dia = interpretar_data_hora(valores.get('data_da_avaria'))
+    dia = timezone.localtime(dia).date() if dia else None
+    convertidos, falhas, so_hora = {}, {}, set()
+    for campo in CAMPOS:
+        valor = valores.get(campo)
+        convertido = None
+        if _vazio(valor):
+            pass
+        elif isinstance(valor, time) or (isinstance(valor, str) and interpretar_hora(valor)):
+            hora = valor if isinstance(valor, time) else interpretar_hora(valor)
+            if dia is not None:
+                convertido = _consciente(datetime.combine(dia, hora))
+                so_hora.add(campo)
+        else:
+            convertido = interpretar_data_hora(valor)
+        if convertido is None and not _vazio(valor):
+            falhas[campo] = valor.isoformat() if isinstance(valor, time) else str(valor)
+        convertidos[campo] = convertido
+
+    for inicio, fim in PARES:
+        if fim in so_hora and convertidos[inicio] and convertidos[fim] < convertidos[inicio]:
+            convertidos[fim] += timedelta(days=1)
+    return convertidos, falhas
+
+
+def _temporario(campo):
+    return f'{campo}_convertida'
+
+
+def converter_datas(apps, schema_editor):
+    """
+    Lê o texto antigo de cada campo, grava o datetime na coluna nova e guarda em
+    ``datas_por_interpretar`` (e lista no fim) os valores que não foi possível interpretar.
+    """
+    Avaria = apps.get_model('avarias_a_receber', 'Avaria')
+    campos_novos = [_temporario(campo) for campo in CAMPOS] + ['datas_por_interpretar']
+    convertidas, falhadas, pendentes = 0, [], []
+
+    for avaria in Avaria.objects.only('pk', *CAMPOS).order_by('pk').iterator(chunk_size=LOTE):
+        valores, falhas = interpretar_avaria({campo: getattr(avaria, campo) for campo in CAMPOS})
+        for campo, valor in valores.items():
+            setattr(avaria, _temporario(campo), valor)
+        avaria.datas_por_interpretar = falhas or None
+        if falhas:
+            falhadas.append((avaria.pk, falhas))
+        pendentes.append(avaria)
+        convertidas += 1
+        if len(pendentes) >= LOTE:
+            Avaria.objects.bulk_update(pendentes, campos_novos)
+            pendentes = []
+    if pendentes:
+        Avaria.objects.bulk_update(pendentes, campos_novos)
+
+    if falhadas:
+        print(f"\n  {len(falhadas)} of {convertidas} avarias have dates that could not be parsed "
+              f"(kept in datas_por_interpretar, the fields were left empty):")
+        for pk, falhas in falhadas:
+            detalhe = ', '.join(f'{campo}={texto!r}' for campo, texto in falhas.items())
+            print(f"    avaria {pk}: {detalhe}")
+
+
+def reverter_datas(apps, schema_editor):
+    """Volta a escrever as datas em texto (ISO 8601, ou o texto original que não foi convertido)."""
+    Avaria = apps.get_model('avarias_a_receber', 'Avaria')
+    pendentes = []
+    for avaria in Avaria.objects.order_by('pk').iterator(chunk_size=LOTE):
+        originais = avaria.datas_por_interpretar or {}
+        for campo in CAMPOS:
+            valor = getattr(avaria, _temporario(campo))
+            texto = valor.isoformat() if valor else originais.get(campo)
+            setattr(avaria, campo, texto if texto is not None else ('' if campo == 'data_da_avaria' else None))
+        pendentes.append(avaria)
+        if len(pendentes) >= LOTE:
+            Avaria.objects.bulk_update(pendentes, CAMPOS)
+            pendentes = []
+    if pendentes:
+        Avaria.objects.bulk_update(pendentes, CAMPOS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('avarias_a_receber', '0005_ratesconfiguration'),
+    ]
+
+    operations = [
+        # Lets the reverse migration re-add the text column before refilling it
+        migrations.AlterField(
+            model_name='avaria',
+            name='data_da_avaria',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='avaria',
+            name='datas_por_interpretar',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        *[
+            migrations.AddField(
+                model_name='avaria',
+                name=_temporario(campo),
+                field=models.DateTimeField(blank=True, null=True),
+            )
+            for campo in CAMPOS
+        ],
+        migrations.RunPython(converter_datas, reverter_datas),
+        *[migrations.RemoveField(model_name='avaria', name=campo) for campo in CAMPOS],
+        *[
+            migrations.RenameField(model_name='avaria', old_name=_temporario(campo), new_name=campo)
+            for campo in CAMPOS
+        ],
+        migrations.AlterField(
+            model_name='avaria',
+            name='data_da_avaria',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='avaria',
+            index=models.Index(fields=['current_user', 'data_da_avaria'], name='avaria_user_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='avaria',
+            index=models.Index(fields=['data_da_avaria'], name='avaria_data_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('avarias_a_receber', '0006_avaria_datetime_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaria',
+            index=models.Index(condition=models.Q(('pago', 'Não')), fields=['current_user', 'data_da_avaria'], name='avaria_por_pagar_idx'),
+        ),
+    ]
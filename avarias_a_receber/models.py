@@ -1,21 +1,35 @@
 from django.db import models
+from django.db.models import Q
 
 class Avaria(models.Model):
     localizacao = models.CharField(max_length=255)
     instalacao = models.CharField(max_length=255)
     descricao_da_avaria = models.TextField(blank=True, null=True)
-    data_da_avaria = models.CharField(max_length=255)
-    fim_da_avaria = models.CharField(max_length=255, blank=True, null=True)
+    # Nulo só em avarias antigas cuja data em texto não foi possível converter (ver datas_por_interpretar)
+    data_da_avaria = models.DateTimeField(null=True)
+    fim_da_avaria = models.DateTimeField(blank=True, null=True)
     estado_do_elevador = models.CharField(max_length=255)
     pago = models.CharField(max_length=3, choices=[('Sim', 'Sim'), ('Não', 'Não')], default='Não')
     notas = models.TextField(blank=True, null=True)
-    inicio_deslocacao1 = models.CharField(max_length=255, blank=True, null=True)
-    fim_deslocacao1 = models.CharField(max_length=255, blank=True, null=True)
-    inicio_deslocacao2 = models.CharField(max_length=255, blank=True, null=True)
-    fim_deslocacao2 = models.CharField(max_length=255, blank=True, null=True)
+    inicio_deslocacao1 = models.DateTimeField(blank=True, null=True)
+    fim_deslocacao1 = models.DateTimeField(blank=True, null=True)
+    inicio_deslocacao2 = models.DateTimeField(blank=True, null=True)
+    fim_deslocacao2 = models.DateTimeField(blank=True, null=True)
     codigo_material = models.CharField(max_length=255, blank=True, null=True)
     descricao_material = models.CharField(max_length=255, blank=True, null=True)
     current_user = models.CharField(max_length=255, blank=True, null=True)
+    # Texto original das datas que a migração 0006 não conseguiu interpretar: {campo: texto}
+    datas_por_interpretar = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['current_user', 'data_da_avaria'], name='avaria_user_data_idx'),
+            models.Index(fields=['data_da_avaria'], name='avaria_data_idx'),
+            # Contas a receber: só as avarias por pagar
+            models.Index(
+                fields=['current_user', 'data_da_avaria'], name='avaria_por_pagar_idx', condition=Q(pago='Não')
+            ),
+        ]
 
     def __str__(self):
         return f"{self.localizacao} - {self.instalacao} - {self.data_da_avaria}"
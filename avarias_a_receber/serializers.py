@@ -1,16 +1,69 @@
+from datetime import time
+
+from django.db import models
 from rest_framework import serializers
+from .datas import CAMPOS as CAMPOS_DATA, interpretar_avaria, interpretar_data_hora, interpretar_hora
 from .models import Avaria, Material, RatesConfiguration
 
+
+class DataHoraAvariaField(serializers.DateTimeField):
+    """
+    DateTimeField que aceita também os formatos antigos (ver ``datas.py``). Uma hora
+    sozinha é devolvida como ``time`` e completada com a data da avaria em ``validate``.
+    """
+
+    def validate_empty_values(self, data):
+        # Older clients send '' for dates that are not filled in yet
+        if isinstance(data, str) and not data.strip() and self.allow_null:
+            return True, None
+        return super().validate_empty_values(data)
+
+    def to_internal_value(self, value):
+        if isinstance(value, str):
+            hora = interpretar_hora(value)
+            if hora is not None:
+                return hora
+        valor = interpretar_data_hora(value)
+        if valor is None:
+            self.fail('invalid', format='AAAA-MM-DDThh:mm, dd/mm/aaaa hh:mm')
+        return valor
+
+
 class AvariaSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DateTimeField: DataHoraAvariaField,
+    }
+
     class Meta:
         model = Avaria
         fields = '__all__'
-        
+        read_only_fields = ['datas_por_interpretar']
+        extra_kwargs = {
+            # Nullable only for old rows whose text date could not be converted
+            'data_da_avaria': {'required': True, 'allow_null': False},
+        }
+
     def validate(self, data):
         # Ensure current_user is provided when creating new avarias
         request = self.context.get('request')
         if request and request.method == 'POST' and 'current_user' not in data:
             raise serializers.ValidationError("current_user field is required")
+
+        if any(isinstance(data.get(campo), time) for campo in CAMPOS_DATA):
+            # Times on their own take the date of the avaria (and roll past midnight)
+            valores = {
+                campo: data[campo] if campo in data else getattr(self.instance, campo, None)
+                for campo in CAMPOS_DATA
+            }
+            convertidos, falhas = interpretar_avaria(valores)
+            if falhas:
+                raise serializers.ValidationError({
+                    campo: "Hora sem data: indique a data completa ou a data da avaria" for campo in falhas
+                })
+            for campo in CAMPOS_DATA:
+                if campo in data:
+                    data[campo] = convertidos[campo]
         return data
 
 class MaterialSerializer(serializers.ModelSerializer):
@@ -0,0 +1,291 @@
+"""
+Arquivo: services.py
+Descrição:
+    Cálculo do valor a pagar aos técnicos pelas deslocações das avarias, com as tarifas
+    de ``RatesConfiguration``, e relatório dos valores ainda por receber.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+
+from backend.cache import CacheVersionada
+from .models import Avaria, RatesConfiguration
+
+CENTIMO = Decimal('0.01')
+MINUTOS_POR_HORA = Decimal(60)
+
+
+def _arredondar(valor):
+    return valor.quantize(CENTIMO, rounding=ROUND_HALF_UP)
+
+
+def _horas(minutos):
+    return _arredondar(Decimal(minutos) / MINUTOS_POR_HORA)
+
+
+class FaturacaoService:
+    """Valor das deslocações de um técnico num mês, por dia e no total."""
+
+    # Minutos a partir das 23:00 (e até às 07:00 do dia seguinte) levam a sobretaxa
+    INICIO_SOBRETAXA = time(23, 0)
+    FIM_SOBRETAXA = time(7, 0)
+    # Estados do elevador (em minúsculas) pagos com a tarifa de paragem
+    ESTADOS_PARADO = ('parado', 'parada')
+    # Intervalos acima disto são tratados como erro de preenchimento e não são pagos
+    DURACAO_MAXIMA = timedelta(hours=24)
+    INTERVALOS = (('inicio_deslocacao1', 'fim_deslocacao1'), ('inicio_deslocacao2', 'fim_deslocacao2'))
+    TARIFAS = ('standard_rate', 'stop_rate', 'after_11pm_surcharge')
+    CACHE = CacheVersionada('avarias:faturacao')
+
+    @staticmethod
+    def _tarifas(configuracao):
+        # The model defaults are floats until the row is saved
+        return {
+            campo: _arredondar(Decimal(str(getattr(configuracao, campo))))
+            for campo in FaturacaoService.TARIFAS
+        }
+
+    @staticmethod
+    def tarifas(user):
+        """
+        Tarifas do utilizador como ``Decimal``, ou os valores por omissão do modelo se
+        ainda não as configurou (sem criar a configuração).
+        """
+        configuracao = (
+            RatesConfiguration.objects.filter(current_user=user).first() or RatesConfiguration(current_user=user)
+        )
+        return FaturacaoService._tarifas(configuracao)
+
+    @staticmethod
+    def tarifas_por_utilizador(queryset=None):
+        """
+        ``tarifas()`` de vários utilizadores numa query: devolve uma função user -> tarifas
+        (os valores por omissão para quem não tem configuração).
+        """
+        queryset = RatesConfiguration.objects.all() if queryset is None else queryset
+        configuradas = {
+            configuracao.current_user: FaturacaoService._tarifas(configuracao) for configuracao in queryset
+        }
+        omissao = FaturacaoService._tarifas(RatesConfiguration())
+        return lambda user: configuradas.get(user, omissao)
+
+    @staticmethod
+    def campos_horarios():
+        return [campo for intervalo in FaturacaoService.INTERVALOS for campo in intervalo]
+
+    @staticmethod
+    def limites_do_mes(ano, mes):
+        inicio = timezone.make_aware(datetime(ano, mes, 1))
+        seguinte = timezone.make_aware(datetime(ano + mes // 12, mes % 12 + 1, 1))
+        return inicio, seguinte
+
+    @staticmethod
+    def minutos_com_sobretaxa(inicio, fim):
+        """Minutos de [inicio, fim) dentro das janelas 23:00-07:00 (hora local)."""
+        inicio, fim = timezone.localtime(inicio), timezone.localtime(fim)
+        total = timedelta()
+        dia = inicio.date() - timedelta(days=1)
+        while dia <= fim.date():
+            janela_inicio = timezone.make_aware(datetime.combine(dia, FaturacaoService.INICIO_SOBRETAXA))
+            janela_fim = timezone.make_aware(datetime.combine(dia + timedelta(days=1), FaturacaoService.FIM_SOBRETAXA))
+            sobreposicao = min(fim, janela_fim) - max(inicio, janela_inicio)
+            if sobreposicao > timedelta():
+                total += sobreposicao
+            dia += timedelta(days=1)
+        return int(total.total_seconds() // 60)
+
+    @staticmethod
+    def deslocacoes(estado, horarios, tarifas):
+        """
+        Deslocações pagas de uma avaria. ``horarios`` são os campos de ``INTERVALOS`` por
+        ordem e ``tarifas`` o resultado de ``tarifas()``.
+
+        Retorna ``(deslocacoes, completa)``: uma lista de ``(dia, minutos, minutos com
+        sobretaxa, valor sem arredondar)`` e ``False`` se alguma deslocação foi ignorada
+        (falta uma das pontas, acaba antes de começar ou dura mais de um dia).
+        """
+        parado = (estado or '').strip().lower() in FaturacaoService.ESTADOS_PARADO
+        tarifa = tarifas['stop_rate'] if parado else tarifas['standard_rate']
+        deslocacoes, completa = [], True
+        for indice in range(0, len(horarios), 2):
+            partida, chegada = horarios[indice], horarios[indice + 1]
+            if partida is None and chegada is None:
+                continue
+            if partida is None or chegada is None or not (
+                timedelta() < chegada - partida <= FaturacaoService.DURACAO_MAXIMA
+            ):
+                completa = False
+                continue
+            minutos = int((chegada - partida).total_seconds() // 60)
+            noturnos = FaturacaoService.minutos_com_sobretaxa(partida, chegada)
+            valor = (
+                Decimal(minutos) * tarifa + Decimal(noturnos) * tarifas['after_11pm_surcharge']
+            ) / MINUTOS_POR_HORA
+            deslocacoes.append((timezone.localtime(partida).date(), minutos, noturnos, valor))
+        return deslocacoes, completa
+
+    @staticmethod
+    def calcular(user, ano, mes):
+        """
+        Percorre numa passagem as avarias do ``user`` com ``data_da_avaria`` no mês e divide
+        cada deslocação em minutos normais e com sobretaxa. O valor de uma hora é a tarifa
+        de paragem (elevador parado) ou a normal, mais ``after_11pm_surcharge`` nas horas
+        com sobretaxa. Cada deslocação conta no dia em que começou.
+        """
+        tarifas = FaturacaoService.tarifas(user)
+        inicio, seguinte = FaturacaoService.limites_do_mes(ano, mes)
+        avarias = (
+            Avaria.objects.filter(current_user=user, data_da_avaria__gte=inicio, data_da_avaria__lt=seguinte)
+            .order_by('data_da_avaria', 'id')
+            .values_list('id', 'estado_do_elevador', *FaturacaoService.campos_horarios())
+        )
+
+        # dia -> [minutos normais, minutos com sobretaxa, valor sem arredondar]
+        por_dia = defaultdict(lambda: [0, 0, Decimal(0)])
+        ignoradas = []
+        numero_avarias = 0
+        for pk, estado, *horarios in avarias:
+            numero_avarias += 1
+            deslocacoes, completa = FaturacaoService.deslocacoes(estado, horarios, tarifas)
+            if not completa:
+                ignoradas.append(pk)
+            for dia, minutos, noturnos, valor in deslocacoes:
+                linha = por_dia[dia]
+                linha[0] += minutos - noturnos
+                linha[1] += noturnos
+                linha[2] += valor
+
+        dias = []
+        total = {'minutos': 0, 'minutos_sobretaxa': 0, 'valor': Decimal(0)}
+        for dia in sorted(por_dia):
+            normais, noturnos, valor = por_dia[dia]
+            valor = _arredondar(valor)
+            dias.append({
+                'dia': dia.isoformat(),
+                'horas': str(_horas(normais + noturnos)),
+                'horas_sobretaxa': str(_horas(noturnos)),
+                'valor': str(valor),
+            })
+            total['minutos'] += normais + noturnos
+            total['minutos_sobretaxa'] += noturnos
+            total['valor'] += valor
+
+        return {
+            'user': user,
+            'mes': f'{ano:04d}-{mes:02d}',
+            'tarifas': {campo: str(valor) for campo, valor in tarifas.items()},
+            'dias': dias,
+            'total': {
+                'avarias': numero_avarias,
+                'horas': str(_horas(total['minutos'])),
+                'horas_sobretaxa': str(_horas(total['minutos_sobretaxa'])),
+                'valor': str(_arredondar(total['valor'])),
+            },
+            # Avarias with a trip missing one end, ending before it starts or longer than a day
+            'ignoradas': sorted(set(ignoradas)),
+        }
+
+    @staticmethod
+    def invalidar():
+        """Descarta todos os cálculos em cache (chamado quando uma avaria ou tarifa muda)."""
+        FaturacaoService.CACHE.invalidar()
+
+    @staticmethod
+    def obter(user, ano, mes):
+        """``calcular`` através da cache, por (utilizador, mês)."""
+        utilizador = hashlib.sha256((user or '').encode()).hexdigest()[:16]
+        return FaturacaoService.CACHE.obter(
+            f'{utilizador}:{ano:04d}-{mes:02d}', lambda: FaturacaoService.calcular(user, ano, mes)
+        )
+
+
+class ContasAReceberService:
+    """Valores por receber (avarias com ``pago='Não'``) por antiguidade, técnico e instalação."""
+
+    # (nome, dias mínimos, dias máximos) contados desde data_da_avaria
+    ESCALOES = (('0-30', None, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None))
+
+    @staticmethod
+    def escalao(dias):
+        for nome, minimo, maximo in ContasAReceberService.ESCALOES:
+            if (minimo is None or dias >= minimo) and (maximo is None or dias <= maximo):
+                return nome
+
+    @staticmethod
+    def por_pagar():
+        """Avarias por pagar; é a condição do índice parcial ``avaria_por_pagar_idx``."""
+        return Avaria.objects.filter(pago='Não')
+
+    @staticmethod
+    def _vazio(**campos):
+        escaloes = {nome: Decimal(0) for nome, *_ in ContasAReceberService.ESCALOES}
+        return {**campos, 'avarias': 0, 'total': Decimal(0), **escaloes}
+
+    @staticmethod
+    def _texto(linha):
+        for campo, valor in linha.items():
+            if isinstance(valor, Decimal):
+                linha[campo] = str(_arredondar(valor))
+        return linha
+
+    @staticmethod
+    def relatorio(user=None, hoje=None):
+        """
+        Valor de cada avaria por pagar (calculado como em ``FaturacaoService``), somado por
+        escalão de antiguidade, por técnico e, dentro de cada técnico, por instalação.
+        Lê as tarifas numa query e as avarias noutra, percorridas uma vez.
+        """
+        hoje = hoje or timezone.localdate()
+        avarias = ContasAReceberService.por_pagar().exclude(data_da_avaria=None)
+        configuracoes = RatesConfiguration.objects.all()
+        if user:
+            avarias = avarias.filter(current_user=user)
+            configuracoes = configuracoes.filter(current_user=user)
+        tarifas_de = FaturacaoService.tarifas_por_utilizador(configuracoes)
+
+        tecnicos = {}
+        total = ContasAReceberService._vazio()
+        linhas = avarias.order_by().values_list(
+            'current_user', 'instalacao', 'data_da_avaria', 'estado_do_elevador',
+            *FaturacaoService.campos_horarios(),
+        )
+        for tecnico, instalacao, data, estado, *horarios in linhas.iterator():
+            deslocacoes, _ = FaturacaoService.deslocacoes(estado, horarios, tarifas_de(tecnico))
+            valor = _arredondar(sum((valor for *_, valor in deslocacoes), Decimal(0)))
+            escalao = ContasAReceberService.escalao((hoje - timezone.localtime(data).date()).days)
+
+            linha_tecnico = tecnicos.get(tecnico)
+            if linha_tecnico is None:
+                linha_tecnico = tecnicos[tecnico] = ContasAReceberService._vazio(user=tecnico, instalacoes={})
+            linha_instalacao = linha_tecnico['instalacoes'].get(instalacao)
+            if linha_instalacao is None:
+                linha_instalacao = linha_tecnico['instalacoes'][instalacao] = ContasAReceberService._vazio(
+                    instalacao=instalacao
+                )
+            for linha in (total, linha_tecnico, linha_instalacao):
+                linha['avarias'] += 1
+                linha['total'] += valor
+                linha[escalao] += valor
+
+        resultado = []
+        for tecnico in sorted(tecnicos, key=lambda nome: (nome is None, nome or '')):
+            linha = tecnicos[tecnico]
+            linha['instalacoes'] = [
+                ContasAReceberService._texto(linha['instalacoes'][instalacao])
+                for instalacao in sorted(linha['instalacoes'])
+            ]
+            resultado.append(ContasAReceberService._texto(linha))
+        return {
+            'data_referencia': hoje.isoformat(),
+            'escaloes': [nome for nome, *_ in ContasAReceberService.ESCALOES],
+            'tecnicos': resultado,
+            'total': ContasAReceberService._texto(total),
+        }
+
+    @staticmethod
+    def marcar_pagas(queryset):
+        """Marca como pagas, num só UPDATE, as avarias por pagar de ``queryset``. Devolve quantas."""
+        return queryset.filter(pago='Não').update(pago='Sim')
@@ -0,0 +1,20 @@
+"""
+Invalida os cálculos de faturação em cache quando uma avaria ou uma tarifa é gravada
+ou removida.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Avaria, RatesConfiguration
+from .services import FaturacaoService
+
+
+def invalidar_faturacao(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(FaturacaoService.invalidar)
+
+
+for modelo in (Avaria, RatesConfiguration):
+    post_save.connect(invalidar_faturacao, sender=modelo, dispatch_uid=f'faturacao_save_{modelo.__name__}')
+    post_delete.connect(invalidar_faturacao, sender=modelo, dispatch_uid=f'faturacao_delete_{modelo.__name__}')
@@ -1,3 +1,236 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .datas import interpretar_avaria, interpretar_data_hora
+from .models import Avaria, RatesConfiguration
+from .services import ContasAReceberService, FaturacaoService
+
+
+def utc(*partes):
+    return datetime(*partes, tzinfo=dt_timezone.utc)
+
+
+class InterpretarDatasTests(TestCase):
+    def test_formatos_aceites(self):
+        esperado = utc(2024, 3, 5, 14, 30)
+        for texto in (
+            '2024-03-05T14:30', '2024-03-05 14:30:00', '2024-03-05T14:30:00Z',
+            '05/03/2024 14:30', '05/03/2024, 14:30:00', '05-03-2024 14h30', '05.03.2024 14:30',
+        ):
+            self.assertEqual(interpretar_data_hora(texto), esperado, texto)
+        self.assertEqual(interpretar_data_hora('05/03/2024'), utc(2024, 3, 5))
+
+    def test_valores_nao_reconhecidos(self):
+        for texto in ('ontem', '2024-13-05T10:00', '14:30', '', None):
+            self.assertIsNone(interpretar_data_hora(texto), texto)
+
+    def test_horas_usam_a_data_da_avaria(self):
+        convertidos, falhas = interpretar_avaria({
+            'data_da_avaria': '05/03/2024 22:00',
+            'inicio_deslocacao1': '23:10',
+            'fim_deslocacao1': '00:40',
+            'fim_da_avaria': '',
+        })
+        self.assertEqual(falhas, {})
+        self.assertEqual(convertidos['inicio_deslocacao1'], utc(2024, 3, 5, 23, 10))
+        # Ends before the start: it crossed midnight
+        self.assertEqual(convertidos['fim_deslocacao1'], utc(2024, 3, 6, 0, 40))
+        self.assertIsNone(convertidos['fim_da_avaria'])
+
+    def test_falhas_guardam_o_texto_original(self):
+        convertidos, falhas = interpretar_avaria({'data_da_avaria': 'ontem', 'inicio_deslocacao1': '10:00'})
+        self.assertEqual(falhas, {'data_da_avaria': 'ontem', 'inicio_deslocacao1': '10:00'})
+        self.assertIsNone(convertidos['data_da_avaria'])
+
+
+class AvariaDatasAPITests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('avarias-list-create')
+
+    def criar(self, **dados):
+        return self.client.post(self.url, {
+            'localizacao': 'Rua A', 'instalacao': 'INS-1', 'estado_do_elevador': 'Parado',
+            'current_user': 'ana', **dados,
+        }, format='json')
+
+    def test_aceita_formatos_antigos(self):
+        response = self.criar(
+            data_da_avaria='05/03/2024 22:00', inicio_deslocacao1='23:10', fim_deslocacao1='00:40',
+            fim_da_avaria='',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        avaria = Avaria.objects.get()
+        self.assertEqual(avaria.data_da_avaria, utc(2024, 3, 5, 22, 0))
+        self.assertEqual(avaria.fim_deslocacao1, utc(2024, 3, 6, 0, 40))
+        self.assertIsNone(avaria.fim_da_avaria)
+
+    def test_datas_invalidas(self):
+        self.assertEqual(self.criar(data_da_avaria='ontem').status_code, 400)
+        self.assertEqual(self.criar(data_da_avaria='22:00').status_code, 400)
+        self.assertEqual(self.criar().status_code, 400)
+        self.assertFalse(Avaria.objects.exists())
+
+    def test_hora_atualizada_usa_a_data_gravada(self):
+        self.criar(data_da_avaria='2024-03-05T09:00')
+        avaria = Avaria.objects.get()
+        response = self.client.patch(
+            reverse('avarias-retrieve-update-destroy', args=[avaria.pk]), {'fim_da_avaria': '11:15'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        avaria.refresh_from_db()
+        self.assertEqual(avaria.fim_da_avaria, utc(2024, 3, 5, 11, 15))
+
+    def test_filtro_por_intervalo(self):
+        for dia in (1, 5, 9):
+            Avaria.objects.create(
+                localizacao='Rua A', instalacao=f'INS-{dia}', estado_do_elevador='Parado',
+                data_da_avaria=utc(2024, 3, dia, 18), current_user='ana' if dia != 9 else 'rui',
+            )
+        response = self.client.get(self.url, {'data_da_avaria_inicio': '2024-03-05', 'data_da_avaria_fim': '2024-03-09'})
+        self.assertEqual([avaria['instalacao'] for avaria in response.data['results']], ['INS-5', 'INS-9'])
+
+        response = self.client.get(self.url, {'user': 'ana', 'data_da_avaria_fim': '05/03/2024 18:00'})
+        self.assertEqual([avaria['instalacao'] for avaria in response.data['results']], ['INS-1', 'INS-5'])
+
+        response = self.client.get(self.url, {'data_da_avaria_inicio': 'amanhã'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('data_da_avaria_inicio', response.data)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FaturacaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('avarias-faturacao')
+
+        def avaria(user, estado, data, *horarios):
+            campos = ('inicio_deslocacao1', 'fim_deslocacao1', 'inicio_deslocacao2', 'fim_deslocacao2')
+            return Avaria.objects.create(
+                localizacao='Rua A', instalacao='INS-1', estado_do_elevador=estado, current_user=user,
+                data_da_avaria=data, **dict(zip(campos, horarios)),
+            )
+
+        avaria('ana', 'A funcionar', utc(2024, 3, 5, 10), utc(2024, 3, 5, 9), utc(2024, 3, 5, 10, 30))
+        self.parado = avaria(
+            'ana', 'Parado', utc(2024, 3, 5, 22), utc(2024, 3, 5, 22, 30), utc(2024, 3, 6, 0, 30), utc(2024, 3, 6, 1)
+        )
+        avaria('ana', 'Parado', utc(2024, 3, 12, 8), utc(2024, 3, 12, 8), utc(2024, 3, 12, 8, 45))
+        avaria('ana', 'Parado', utc(2024, 4, 1, 8), utc(2024, 4, 1, 8), utc(2024, 4, 1, 9))
+        avaria('rui', 'Parado', utc(2024, 3, 5, 8), utc(2024, 3, 5, 8), utc(2024, 3, 5, 9))
+
+    def faturacao(self, **parametros):
+        response = self.client.get(self.url, {'user': 'ana', 'mes': '2024-03', **parametros})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_valores_por_dia_e_total(self):
+        resultado = self.faturacao()
+        # 1.5 h x 12 + (2 h x 11 + 1.5 h after 23:00 x 10), then 0.75 h x 11
+        self.assertEqual(resultado['dias'], [
+            {'dia': '2024-03-05', 'horas': '3.50', 'horas_sobretaxa': '1.50', 'valor': '55.00'},
+            {'dia': '2024-03-12', 'horas': '0.75', 'horas_sobretaxa': '0.00', 'valor': '8.25'},
+        ])
+        self.assertEqual(resultado['total'], {'avarias': 3, 'horas': '4.25', 'horas_sobretaxa': '1.50', 'valor': '63.25'})
+        # Second trip has no end
+        self.assertEqual(resultado['ignoradas'], [self.parado.pk])
+
+    def test_janela_da_sobretaxa(self):
+        self.assertEqual(FaturacaoService.minutos_com_sobretaxa(utc(2024, 3, 5, 22), utc(2024, 3, 6, 8)), 8 * 60)
+        self.assertEqual(FaturacaoService.minutos_com_sobretaxa(utc(2024, 3, 6, 6), utc(2024, 3, 6, 7, 30)), 60)
+        self.assertEqual(FaturacaoService.minutos_com_sobretaxa(utc(2024, 3, 6, 8), utc(2024, 3, 6, 22)), 0)
+
+    def test_tarifas_do_utilizador(self):
+        RatesConfiguration.objects.create(current_user='ana', standard_rate=20, stop_rate=15, after_11pm_surcharge=5)
+        resultado = self.faturacao()
+        # 1.5 x 20 + 2 x 15 + 1.5 x 5 + 0.75 x 15
+        self.assertEqual(resultado['total']['valor'], '78.75')
+        self.assertEqual(resultado['tarifas']['standard_rate'], '20.00')
+
+    def test_cache_por_utilizador_e_mes(self):
+        with self.assertNumQueries(2):
+            self.faturacao()
+        with self.assertNumQueries(0):
+            self.faturacao()
+        self.assertEqual(self.faturacao(mes='2024-04')['total']['valor'], '11.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parado.estado_do_elevador = 'A funcionar'
+            self.parado.save()
+        self.assertEqual(self.faturacao()['total']['valor'], '65.25')
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'mes': '2024-03'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'user': 'ana', 'mes': 'março'}).status_code, 400)
+
+
+class ContasAReceberTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        agora = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0)
+
+        def avaria(user, instalacao, dias, horas, pago='Não'):
+            data = agora - timedelta(days=dias)
+            return Avaria.objects.create(
+                localizacao='Rua A', instalacao=instalacao, estado_do_elevador='A funcionar',
+                current_user=user, pago=pago, data_da_avaria=data,
+                inicio_deslocacao1=data, fim_deslocacao1=data + timedelta(hours=horas),
+            )
+
+        self.recente = avaria('ana', 'INS-1', 3, 1)
+        self.antiga = avaria('ana', 'INS-1', 45, 2)
+        avaria('ana', 'INS-2', 200, 0.5)
+        avaria('ana', 'INS-2', 10, 3, pago='Sim')
+        self.do_rui = avaria('rui', 'INS-1', 70, 1)
+        RatesConfiguration.objects.create(current_user='rui', standard_rate=20)
+
+    def test_escaloes_por_tecnico_e_instalacao(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('avarias-contas-a-receber'))
+        dados = response.data
+        self.assertEqual(dados['escaloes'], ['0-30', '31-60', '61-90', '90+'])
+        ana, rui = dados['tecnicos']
+        self.assertEqual(
+            {campo: ana[campo] for campo in ('user', 'avarias', 'total', '0-30', '31-60', '61-90', '90+')},
+            {'user': 'ana', 'avarias': 3, 'total': '42.00',
+             '0-30': '12.00', '31-60': '24.00', '61-90': '0.00', '90+': '6.00'},
+        )
+        self.assertEqual([linha['instalacao'] for linha in ana['instalacoes']], ['INS-1', 'INS-2'])
+        self.assertEqual(ana['instalacoes'][1]['90+'], '6.00')
+        # Rui's own rate
+        self.assertEqual((rui['61-90'], rui['total']), ('20.00', '20.00'))
+        self.assertEqual(dados['total']['total'], '62.00')
+
+    def test_filtro_por_tecnico(self):
+        dados = self.client.get(reverse('avarias-contas-a-receber'), {'user': 'rui'}).data
+        self.assertEqual([linha['user'] for linha in dados['tecnicos']], ['rui'])
+
+    def test_escalao(self):
+        for dias, nome in ((-1, '0-30'), (0, '0-30'), (30, '0-30'), (31, '31-60'), (90, '61-90'), (91, '90+')):
+            self.assertEqual(ContasAReceberService.escalao(dias), nome)
+
+    def test_marcar_pagas_numa_query(self):
+        url = reverse('avarias-marcar-pagas')
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {'user': 'ana', 'instalacao': 'INS-1'}, format='json')
+        self.assertEqual(response.data, {'atualizadas': 2})
+        self.recente.refresh_from_db()
+        self.assertEqual(self.recente.pago, 'Sim')
+
+        response = self.client.post(url, {'ids': [self.do_rui.pk, self.antiga.pk]}, format='json')
+        self.assertEqual(response.data, {'atualizadas': 1})
+        self.assertEqual(Avaria.objects.filter(pago='Não').count(), 1)
+
+    def test_marcar_pagas_exige_selecao(self):
+        url = reverse('avarias-marcar-pagas')
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, [1, 2], format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'ids': ['x']}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'data_da_avaria_fim': 'ontem'}, format='json').status_code, 400)
+        self.assertEqual(Avaria.objects.filter(pago='Sim').count(), 1)
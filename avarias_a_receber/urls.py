@@ -8,6 +8,9 @@ router.register(r'rates', views.RatesConfigurationViewSet)
 
 urlpatterns = [
     path('', views.AvariaListCreate.as_view(), name='avarias-list-create'),
+    path('faturacao/', views.AvariaFaturacao.as_view(), name='avarias-faturacao'),
+    path('contas-a-receber/', views.AvariaContasAReceber.as_view(), name='avarias-contas-a-receber'),
+    path('marcar-pagas/', views.AvariaMarcarPagas.as_view(), name='avarias-marcar-pagas'),
     path('<int:pk>/', views.AvariaRetrieveUpdateDestroy.as_view(), name='avarias-retrieve-update-destroy'),
     path('materiais/', views.MaterialListCreate.as_view(), name='materiais-list-create'),
     path('materiais/<int:pk>/', views.MaterialRetrieveUpdateDestroy.as_view(), name='materiais-retrieve-update-destroy'),
@@ -1,20 +1,57 @@
+from datetime import datetime, timedelta
+
 from django.shortcuts import render
+from django.utils import timezone
 from rest_framework import generics, viewsets, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.decorators import action
+from .datas import interpretar_data, interpretar_data_hora
 from .models import Avaria, Material, RatesConfiguration
 from .serializers import AvariaSerializer, MaterialSerializer, RatesConfigurationSerializer
+from .services import ContasAReceberService, FaturacaoService
+
+def filtrar_intervalos(queryset, params, campos):
+    """
+    Filtra por ``?<campo>_inicio=&<campo>_fim=`` para cada um dos ``campos`` (limites
+    incluídos; um fim só com a data inclui o dia inteiro). Datas inválidas dão 400.
+    """
+    erros = {}
+    for campo in campos:
+        for sufixo in ('inicio', 'fim'):
+            parametro = f'{campo}_{sufixo}'
+            texto = params.get(parametro)
+            if not texto:
+                continue
+            valor = interpretar_data_hora(texto)
+            if valor is None:
+                erros[parametro] = "Data inválida"
+                continue
+            if sufixo == 'inicio':
+                lookup = 'gte'
+            elif interpretar_data(texto):
+                # A bare date as the end includes that whole day
+                lookup, valor = 'lt', valor + timedelta(days=1)
+            else:
+                lookup = 'lte'
+            queryset = queryset.filter(**{f'{campo}__{lookup}': valor})
+    if erros:
+        raise ValidationError(erros)
+    return queryset
 
 class AvariaListCreate(generics.ListCreateAPIView):
     serializer_class = AvariaSerializer
+    # Intervalos aceites na listagem: ?<campo>_inicio=&<campo>_fim= (datas ou datas/horas)
+    CAMPOS_INTERVALO = ('data_da_avaria', 'fim_da_avaria')
 
     def get_queryset(self):
         queryset = Avaria.objects.all()
         user = self.request.query_params.get('user', None)
         if user is not None:
             queryset = queryset.filter(current_user=user)
-        return queryset
+        queryset = filtrar_intervalos(queryset, self.request.query_params, self.CAMPOS_INTERVALO)
+        # Served by the (current_user, data_da_avaria) and (data_da_avaria) indexes
+        return queryset.order_by('data_da_avaria', 'id')
 
     def create(self, request, *args, **kwargs):
         print("Received data:", request.data)
@@ -50,6 +87,63 @@ class AvariaRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class AvariaFaturacao(generics.GenericAPIView):
+    """
+    Valor a pagar ao técnico pelas deslocações de um mês: ``?user=&mes=AAAA-MM``
+    (por omissão o mês atual), por dia e no total.
+    """
+
+    def get(self, request, *args, **kwargs):
+        user = request.query_params.get('user')
+        if not user:
+            raise ValidationError({'user': "Indique o utilizador"})
+        mes = request.query_params.get('mes')
+        if mes:
+            try:
+                data = datetime.strptime(mes, '%Y-%m')
+            except ValueError:
+                raise ValidationError({'mes': "Use o formato AAAA-MM"})
+        else:
+            data = timezone.localdate()
+        return Response(FaturacaoService.obter(user, data.year, data.month))
+
+class AvariaContasAReceber(generics.GenericAPIView):
+    """
+    Valores por receber por antiguidade (0-30, 31-60, 61-90 e mais de 90 dias), por
+    técnico e por instalação; ``?user=`` limita a um técnico.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return Response(ContasAReceberService.relatorio(request.query_params.get('user') or None))
+
+class AvariaMarcarPagas(generics.GenericAPIView):
+    """
+    Marca como pagas, num só UPDATE, as avarias por pagar selecionadas por ``ids`` e/ou
+    ``user``, ``instalacao``, ``data_da_avaria_inicio`` e ``data_da_avaria_fim``.
+    """
+    CAMPOS_SELECAO = ('ids', 'user', 'instalacao', 'data_da_avaria_inicio', 'data_da_avaria_fim')
+
+    def post(self, request, *args, **kwargs):
+        dados = request.data
+        if not isinstance(dados, dict):
+            raise ValidationError({'detail': "O pedido deve ser um objeto"})
+        if not any(dados.get(campo) for campo in self.CAMPOS_SELECAO):
+            # Refuse to mark every avaria as paid by accident
+            raise ValidationError({'detail': "Indique as avarias: " + ', '.join(self.CAMPOS_SELECAO)})
+
+        queryset = Avaria.objects.all()
+        ids = dados.get('ids')
+        if ids:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                raise ValidationError({'ids': "Deve ser uma lista de inteiros"})
+            queryset = queryset.filter(pk__in=ids)
+        if dados.get('user'):
+            queryset = queryset.filter(current_user=dados['user'])
+        if dados.get('instalacao'):
+            queryset = queryset.filter(instalacao=dados['instalacao'])
+        queryset = filtrar_intervalos(queryset, dados, ('data_da_avaria',))
+        return Response({'atualizadas': ContasAReceberService.marcar_pagas(queryset)})
+
 class MaterialListCreate(generics.ListCreateAPIView):
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
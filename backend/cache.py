@@ -0,0 +1,47 @@
+"""
+Resultados calculados guardados na cache e invalidados por um token de versão: as chaves
+incluem a versão atual, por isso mudá-la faz com que as anteriores deixem de ser lidas
+(e acabem por expirar).
+"""
+import uuid
+
+from django.core.cache import cache
+
+
+class CacheVersionada:
+    """
+    Cache dos resultados de um serviço, com as chaves em ``<prefixo>:<versão>:<chave>``.
+
+    Além da versão global, um ``escopo`` (por exemplo o id de um utilizador) tem uma versão
+    própria, para invalidar só os resultados desse escopo.
+    """
+
+    def __init__(self, prefixo):
+        self.prefixo = prefixo
+
+    def chave_versao(self, escopo=None):
+        return f'{self.prefixo}:versao' if escopo is None else f'{self.prefixo}:versao:{escopo}'
+
+    def versao(self, escopo=None):
+        chave = self.chave_versao(escopo)
+        versao = cache.get(chave)
+        if versao is None:
+            versao = uuid.uuid4().hex
+            # add() keeps a token set meanwhile by another process; the default covers a
+            # backend that did not keep it (e.g. DummyCache or a full cache)
+            cache.add(chave, versao, timeout=None)
+            versao = cache.get(chave, versao)
+        return versao
+
+    def invalidar(self, *escopos):
+        """Muda a versão global e a de cada um dos ``escopos``."""
+        cache.set_many({self.chave_versao(escopo): uuid.uuid4().hex for escopo in (None, *escopos)}, timeout=None)
+
+    def obter(self, chave, calcular, escopo=None):
+        """O resultado de ``calcular()`` para ``chave``, a partir da cache quando existe."""
+        chave = f'{self.prefixo}:{self.versao(escopo)}:{chave}'
+        resultado = cache.get(chave)
+        if resultado is None:
+            resultado = calcular()
+            cache.set(chave, resultado)
+        return resultado
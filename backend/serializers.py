@@ -0,0 +1,151 @@
+"""
+Camada de mapeamento camelCase partilhada pelos serializers da API.
+
+Em vez de correr ``ModelSerializer.to_representation`` e depois copiar o resultado para
+um segundo dicionário com as chaves do frontend, o mapeamento é declarado uma vez
+(``camel_case_fields``) e compilado num plano ``(chave, leitura, conversão)`` por campo.
+Cada linha — instância do modelo ou dicionário de ``values()`` — é convertida
+diretamente para o dicionário final.
+"""
+import copy
+from collections.abc import Mapping
+from operator import attrgetter
+
+from django.http import QueryDict
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+
+def to_camel_case(name):
+    primeira, *resto = name.split('_')
+    return primeira + ''.join(parte.capitalize() for parte in resto)
+
+
+def _texto(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _uuid(value):
+    return None if value is None else str(value)
+
+
+def _data(value):
+    if not value or isinstance(value, str):
+        return value or None
+    return value.isoformat()
+
+
+def _identidade(value):
+    return value
+
+
+class CamelCaseSerializerMixin:
+    """
+    Mixin para ModelSerializers que falam camelCase com o frontend.
+
+    - ``camel_case_fields``: ``{campo: chave}`` com os campos devolvidos, pela ordem da resposta.
+      Por omissão todos os campos de ``Meta.fields``, com a chave em camelCase automático.
+    - ``representar_<campo>(instance)``: se existir, substitui a leitura e conversão do campo.
+
+    Na escrita as chaves camelCase (ou snake_case) são traduzidas e os dados passam pela
+    validação normal dos campos DRF.
+    """
+    camel_case_fields = None
+    # Campos construídos pelo ModelSerializer, por classe (a introspeção do modelo é feita uma vez)
+    _campos_por_classe = {}
+
+    def get_fields(self):
+        """
+        ``ModelSerializer.get_fields`` reconstrói todos os campos a partir do modelo em cada
+        instância; aqui é feito uma vez por classe e cada instância recebe uma cópia.
+        Subclasses cujos campos dependam do contexto não devem usar este mixin.
+        """
+        campos = self._campos_por_classe.get(type(self))
+        if campos is None:
+            campos = self._campos_por_classe[type(self)] = super().get_fields()
+        return copy.deepcopy(campos)
+
+    def get_camel_case_fields(self):
+        if self.camel_case_fields is not None:
+            return self.camel_case_fields
+        return {name: to_camel_case(name) for name in self.fields}
+
+    def _conversor(self, field):
+        """Conversão direta para os tipos simples; os restantes usam ``field.to_representation``."""
+        if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+            return _uuid
+        if isinstance(field, serializers.DateField) and getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601:
+            return _data
+        if isinstance(field, (serializers.BooleanField, serializers.IntegerField)):
+            return _identidade
+        if type(field) in (serializers.CharField, serializers.ChoiceField):
+            return _texto
+        return lambda value: None if value is None else field.to_representation(value)
+
+    def _compilar(self):
+        plano = []
+        for name, key in self.get_camel_case_fields().items():
+            metodo = getattr(self, f'representar_{name}', None)
+            if metodo is not None:
+                plano.append((key, metodo, metodo, None))
+                continue
+            field = self.fields[name]
+            if field.source == '*' or len(field.source_attrs) != 1:
+                # Dotted sources keep DRF's attribute traversal
+                plano.append((key, field.get_attribute, field.get_attribute, self._conversor(field)))
+                continue
+            source = field.source_attrs[0]
+            ler_instancia = attrgetter(source)
+            if isinstance(field, serializers.Serializer):
+                ler_linha = self._leitor_aninhado(source, field.fields)
+            else:
+                ler_linha = lambda row, source=source: row.get(source)
+            plano.append((key, ler_instancia, ler_linha, self._conversor(field)))
+        return plano
+
+    @staticmethod
+    def _leitor_aninhado(source, campos):
+        """Em linhas de ``values()`` o objeto aninhado vem em chaves ``<source>__<campo>``."""
+        chaves = [(f'{source}__{campo}', campo) for campo in campos]
+
+        def ler(row):
+            aninhado = {campo: row.get(chave) for chave, campo in chaves}
+            return aninhado if any(valor is not None for valor in aninhado.values()) else None
+        return ler
+
+    @property
+    def plano_representacao(self):
+        plano = getattr(self, '_plano_representacao', None)
+        if plano is None:
+            plano = self._plano_representacao = self._compilar()
+        return plano
+
+    def to_representation(self, instance):
+        por_linha = isinstance(instance, Mapping)
+        resultado = {}
+        for key, ler_instancia, ler_linha, converter in self.plano_representacao:
+            valor = (ler_linha if por_linha else ler_instancia)(instance)
+            resultado[key] = valor if converter is None else converter(valor)
+        return resultado
+
+    def to_internal_value(self, data):
+        """Traduz as chaves do frontend e valida com os campos DRF."""
+        nomes = {key: name for name, key in self.get_camel_case_fields().items()}
+        if isinstance(data, QueryDict):
+            # Form/multipart input: keep every value of repeated keys; DRF already maps '' to None there
+            convertido = QueryDict(mutable=True)
+            for key, valores in data.lists():
+                convertido.setlist(nomes.get(key, key), valores)
+            data = convertido
+        elif isinstance(data, Mapping):
+            convertido = {}
+            for key, valor in data.items():
+                name = nomes.get(key, key)
+                field = self.fields.get(name)
+                # Older clients send '' for empty optional dates and numbers
+                if (valor == '' and field is not None and field.allow_null
+                        and not isinstance(field, serializers.CharField)):
+                    valor = None
+                convertido[name] = valor
+            data = convertido
+        return super().to_internal_value(data)
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Índices trigram/opclass (pesquisa de códigos)
     'rest_framework',
     'corsheaders',
     'django_filters',  # Add this for using filters in DRF
@@ -75,6 +76,7 @@ INSTALLED_APPS = [
     'authentication',
     'Férias',
     'despesas_carro',
+    'blobstore',
 
 ]
 
@@ -165,6 +167,38 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# Armazenamento de blobs (imagens e assinaturas) endereçados por SHA-256
+BLOB_STORAGE_ROOT = os.environ.get('BLOB_STORAGE_ROOT', os.path.join(BASE_DIR, 'media', 'blobs'))
+BLOB_CACHE_MAX_AGE = 60 * 60 * 24 * 365  # O conteúdo de um blob nunca muda
+# Rendições WebP geradas para cada imagem recebida: nome -> lado máximo em píxeis
+BLOB_RENDITIONS = {
+    'thumb': 320,
+    'medium': 1280,
+}
+BLOB_RENDITION_QUALITY = 80
+# Processos dedicados ao redimensionamento (fora dos workers do gunicorn)
+BLOB_RENDITION_WORKERS = int(os.environ.get('BLOB_RENDITION_WORKERS', 2))
+# Gera as rendições no próprio pedido em vez de no pool de processos (útil em testes)
+BLOB_RENDITIONS_SYNC = os.environ.get('BLOB_RENDITIONS_SYNC', '').lower() in ('1', 'true', 'yes')
+
+# Pacote de dados de referência (nome_do_app/referencia.py), guardado já comprimido
+REFERENCIA_CACHE_DIR = os.environ.get('REFERENCIA_CACHE_DIR', os.path.join(BASE_DIR, 'media', 'referencia'))
+
+# Cache partilhada entre os workers (relatórios agregados); em disco para não depender de outro serviço
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'media', 'cache')),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            # One entry per (technician, month) billing result, per user analysis and per
+            # compliance filter, plus the version tokens: culling at the default 300 entries
+            # would evict tokens and results long before they expire
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 50000)),
+        },
+    }
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,73 @@
+"""
+Utilitários partilhados pelos testes das apps.
+"""
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Mixin para TestCase que garante que um endpoint faz um número fixo de consultas,
+    independentemente do número de linhas devolvidas (deteção de N+1).
+
+    Uso::
+
+        class MinhaAppTests(QueryBudgetMixin, TestCase):
+            def test_lista(self):
+                self.assertQueryBudget('/api/x/', 3, lambda n: criar_linhas(n))
+    """
+    query_budget_sizes = (1, 10)
+
+    def count_queries(self, url, method='get', **kwargs):
+        """Número de consultas feitas por um pedido ao endpoint (e a resposta)."""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        return len(queries), response
+
+    def assertQueryBudget(self, url, budget, create_rows, method='get', expected_status=200, **kwargs):
+        """
+        Cria linhas com ``create_rows(n)`` para cada tamanho em ``query_budget_sizes``
+        (acumulando) e verifica que o pedido faz sempre o mesmo número de consultas,
+        nunca acima de ``budget``.
+        """
+        counts = {}
+        created = 0
+        for size in self.query_budget_sizes:
+            create_rows(size - created)
+            created = size
+            count, response = self.count_queries(url, method, **kwargs)
+            self.assertEqual(
+                response.status_code, expected_status,
+                f"{method.upper()} {url} devolveu {response.status_code} com {size} linhas"
+            )
+            counts[size] = count
+
+        self.assertLessEqual(
+            max(counts.values()), budget,
+            f"{method.upper()} {url} excedeu o orçamento de {budget} consultas: {counts}"
+        )
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{method.upper()} {url} faz consultas proporcionais ao número de linhas (N+1): {counts}"
+        )
+        return counts
+
+
+class TempDirSettingMixin:
+    """
+    Mixin para TestCase que aponta um setting de diretório (por omissão o armazenamento de
+    blobs) para uma pasta temporária em ``self.tmpdir``, apagada no fim de cada teste.
+    """
+    temp_dir_setting = 'BLOB_STORAGE_ROOT'
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        settings_override = override_settings(**{self.temp_dir_setting: self.tmpdir})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
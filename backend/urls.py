@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from nome_do_app.views import home, CodigoListCreateAPIView, CodigoEntradaViewSet
+from nome_do_app.views import home, CodigoListCreateAPIView, CodigoEntradaViewSet, pacote_referencia
 from Guia_de_transporte.views import GuiaDeTransporteViewSet, GuiaDeTransporteListCreateView
 
 
@@ -33,5 +33,7 @@ urlpatterns = [
     path('api/', include('Registros_de_Entregas.urls')),
     path('api/guias/', GuiaDeTransporteListCreateView.as_view(), name='guia-list-create'),
     path('api/vacation/', include('Férias.urls')),
-    path('api/despesas/', include('despesas_carro.urls'))
+    path('api/despesas/', include('despesas_carro.urls')),
+    path('api/blobs/', include('blobstore.urls')),
+    path('api/referencia/', pacote_referencia, name='pacote-referencia'),
 ]
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import Blob, Rendition
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'content_type', 'tamanho', 'criado_em']
+    list_filter = ['content_type']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'tamanho', 'content_type', 'criado_em']
+
+
+@admin.register(Rendition)
+class RenditionAdmin(admin.ModelAdmin):
+    list_display = ['original', 'nome', 'largura', 'altura', 'criado_em']
+    list_filter = ['nome']
+    raw_id_fields = ['original', 'blob']
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from blobstore.models import Blob
+from blobstore.services import RenditionService
+
+
+class Command(BaseCommand):
+    help = "Gera as rendições em falta (thumb, medium, ...) para as imagens já guardadas como blobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Apenas conta as imagens sem rendições completas")
+
+    def handle(self, *args, **kwargs):
+        nomes = list(settings.BLOB_RENDITIONS)
+        # Rendition outputs are blobs too; only originals are processed
+        pendentes = list(
+            Blob.objects.filter(content_type__startswith='image/')
+            .exclude(content_type='image/svg+xml')
+            .exclude(pk__in=RenditionService.blobs_de_rendicao())
+            .annotate(feitas=Count('renditions', filter=Q(renditions__nome__in=nomes)))
+            .filter(feitas__lt=len(nomes))
+            .order_by('pk')
+        )
+        self.stdout.write(f"Imagens com rendições em falta: {len(pendentes)}")
+
+        if kwargs['dry_run']:
+            return
+
+        criadas = 0
+        for i, blob in enumerate(pendentes, 1):
+            criadas += RenditionService.gerar_agora(blob)
+            if i % 100 == 0:
+                self.stdout.write(f"Processadas {i}/{len(pendentes)}")
+
+        self.stdout.write(self.style.SUCCESS(f"{criadas} rendições criadas."))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blobstore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=20, verbose_name='Nome')),
+                ('largura', models.PositiveIntegerField(verbose_name='Largura')),
+                ('altura', models.PositiveIntegerField(verbose_name='Altura')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='blobstore.blob', verbose_name='Rendição')),
+                ('original', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='blobstore.blob', verbose_name='Original')),
+            ],
+            options={
+                'verbose_name': 'Rendição',
+                'verbose_name_plural': 'Rendições',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rendition',
+            constraint=models.UniqueConstraint(fields=('original', 'nome'), name='rendition_original_nome_unico'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """
+    Conteúdo binário imutável (imagem, assinatura, ...) endereçado pelo seu SHA-256.
+    Os bytes vivem no armazenamento de ficheiros; a tabela guarda apenas os metadados.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    tamanho = models.PositiveBigIntegerField(verbose_name="Tamanho (bytes)")
+    content_type = models.CharField(max_length=100, default='application/octet-stream', verbose_name="Tipo MIME")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "Blob"
+        verbose_name_plural = "Blobs"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.content_type}, {self.tamanho} bytes)"
+
+
+class Rendition(models.Model):
+    """
+    Variante redimensionada (WebP, sem EXIF) de uma imagem, ela própria guardada como blob.
+    O nome identifica o tamanho pedido pelos clientes (por exemplo ``thumb`` ou ``medium``).
+    """
+    original = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name='renditions',
+                                 verbose_name="Original")
+    nome = models.CharField(max_length=20, verbose_name="Nome")
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+', verbose_name="Rendição")
+    largura = models.PositiveIntegerField(verbose_name="Largura")
+    altura = models.PositiveIntegerField(verbose_name="Altura")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "Rendição"
+        verbose_name_plural = "Rendições"
+        constraints = [
+            models.UniqueConstraint(fields=['original', 'nome'], name='rendition_original_nome_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.original_id[:12]} {self.nome} ({self.largura}x{self.altura})"
@@ -0,0 +1,59 @@
+"""
+Geração de variantes redimensionadas (rendições) das imagens guardadas como blobs.
+
+As funções deste módulo são puras (bytes -> bytes) e não dependem do Django, para
+poderem correr num processo do ``ProcessPoolExecutor`` sem bloquear o worker web.
+"""
+import io
+import warnings
+
+from PIL import Image, ImageOps
+
+# Imagens maiores do que isto (em píxeis) são recusadas em vez de descomprimidas
+MAX_PIXELS = 60_000_000
+
+
+def gerar_rendicao(imagem, lado_maximo, qualidade):
+    """
+    Redimensiona ``imagem`` (PIL) para caber em ``lado_maximo`` e devolve
+    ``(bytes_webp, largura, altura)``. Nunca aumenta imagens pequenas.
+    """
+    copia = imagem.copy()
+    copia.thumbnail((lado_maximo, lado_maximo), Image.Resampling.LANCZOS)
+    saida = io.BytesIO()
+    # Sem o argumento exif o WebP é gravado sem metadados (GPS, câmara, ...)
+    copia.save(saida, format='WEBP', quality=qualidade, method=4)
+    return saida.getvalue(), copia.width, copia.height
+
+
+def gerar_rendicoes(data, tamanhos, qualidade=80):
+    """
+    Gera todas as rendições de uma imagem de uma só vez (a imagem é descodificada uma vez).
+    ``tamanhos`` é um dicionário ``{nome: lado_maximo}``; devolve ``{nome: (bytes, largura, altura)}``.
+    Lança ``ValueError`` se os bytes não forem uma imagem suportada.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            imagem = Image.open(io.BytesIO(data))
+            if imagem.width * imagem.height > MAX_PIXELS:
+                raise ValueError("Imagem demasiado grande")
+            imagem.load()
+        except (OSError, SyntaxError, Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+            raise ValueError(f"Imagem inválida: {e}")
+
+    # Aplica a rotação indicada pela câmara antes de descartar o EXIF
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() or 'transparency' in imagem.info else 'RGB')
+
+    return {
+        nome: gerar_rendicao(imagem, lado_maximo, qualidade)
+        for nome, lado_maximo in tamanhos.items()
+    }
+
+
+def gerar_rendicoes_de_ficheiro(caminho, tamanhos, qualidade=80):
+    """Variante de ``gerar_rendicoes`` que lê o original do disco, para não copiar os bytes entre processos."""
+    with open(caminho, 'rb') as f:
+        return gerar_rendicoes(f.read(), tamanhos, qualidade)
@@ -0,0 +1,108 @@
+from rest_framework.serializers import ListSerializer
+
+from .models import Blob
+from .services import BlobService, RenditionService
+
+
+class BlobImageSerializerMixin:
+    """
+    Mixin para ModelSerializers cujos campos de imagem recebem base64 ou URLs de blobs.
+
+    - ``blob_fields``: campos de texto com uma imagem, acompanhados de uma FK ``<campo>_blob``.
+      O conteúdo é guardado no armazenamento de blobs e o campo de texto fica vazio.
+    - ``blob_list_fields``: listas de imagens; cada entrada passa a ser a URL do blob.
+
+    Na resposta as imagens são URLs (ou data URIs com ``?formato_imagem=base64``) e
+    ``<campo>_rendicoes`` indica as URLs das variantes redimensionadas.
+    """
+    blob_fields = ()
+    blob_list_fields = ()
+
+    def externalize_images(self, validated_data):
+        for campo in self.blob_fields:
+            if campo not in validated_data:
+                continue
+            valor = validated_data[campo]
+            blob = BlobService.resolve_reference(valor) if valor else None
+            validated_data[f'{campo}_blob'] = blob
+            if blob is not None or not valor:
+                validated_data[campo] = None
+
+        for campo in self.blob_list_fields:
+            if campo not in validated_data:
+                continue
+            referencias = []
+            for valor in validated_data[campo] or []:
+                blob = BlobService.resolve_reference(valor)
+                # Values that are not images (or already external URLs) are kept as sent
+                referencias.append(BlobService.url_for(blob.sha256) if blob is not None else valor)
+            validated_data[campo] = referencias
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self.externalize_images(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self.externalize_images(validated_data))
+
+    def _base64_requested(self):
+        request = self.context.get('request')
+        return request is not None and request.GET.get('formato_imagem') == 'base64'
+
+    def _referencias(self, instance):
+        """SHA-256 dos blobs referenciados pelos campos de imagem de ``instance``."""
+        shas = [getattr(instance, f'{campo}_blob_id') for campo in self.blob_fields]
+        for campo in self.blob_list_fields:
+            valores = getattr(instance, campo, None)
+            if isinstance(valores, (list, tuple)):
+                shas += [BlobService.sha256_from_reference(valor) for valor in valores]
+        return {sha256 for sha256 in shas if sha256}
+
+    def _carregar_blobs(self, instance):
+        """
+        Lê de uma vez os blobs de todas as instâncias a serializar (as da listagem, quando
+        o serializer é o ``child`` de uma ListSerializer), e não um por imagem.
+        """
+        if not hasattr(self, '_blobs'):
+            self._blobs, self._blobs_lidos = {}, set()
+        pendentes = self._referencias(instance) - self._blobs_lidos
+        if not pendentes:
+            return
+        if isinstance(self.parent, ListSerializer) and self.parent.instance is not None:
+            for outra in self.parent.instance:
+                pendentes |= self._referencias(outra)
+            pendentes -= self._blobs_lidos
+        self._blobs.update(Blob.objects.in_bulk(pendentes))
+        self._blobs_lidos |= pendentes
+
+    def _represent(self, sha256, valor=None):
+        """URL do blob, ou data URI com ``?formato_imagem=base64`` (``valor`` se o blob não existe)."""
+        if self._base64_requested():
+            blob = self._blobs.get(sha256)
+            if blob is None:
+                return valor if valor is not None else BlobService.url_for(sha256, self.context.get('request'))
+            return BlobService.as_data_uri(blob)
+        return BlobService.url_for(sha256, self.context.get('request'))
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        request = self.context.get('request')
+        if self._base64_requested():
+            self._carregar_blobs(instance)
+
+        for campo in self.blob_fields:
+            sha256 = getattr(instance, f'{campo}_blob_id')
+            if sha256:
+                representation[campo] = self._represent(sha256)
+            representation[f'{campo}_rendicoes'] = RenditionService.urls(sha256, request) if sha256 else None
+
+        for campo in self.blob_list_fields:
+            valores = representation.get(campo) or []
+            shas = [BlobService.sha256_from_reference(valor) for valor in valores]
+            representation[campo] = [
+                self._represent(sha256, valor) if sha256 else valor for sha256, valor in zip(shas, valores)
+            ]
+            representation[f'{campo}_rendicoes'] = [
+                RenditionService.urls(sha256, request) if sha256 else None for sha256 in shas
+            ]
+        return representation
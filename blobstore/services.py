@@ -0,0 +1,246 @@
+import base64
+import binascii
+import logging
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.urls import reverse
+
+from .models import Blob, Rendition
+from .renditions import gerar_rendicoes, gerar_rendicoes_de_ficheiro
+from .storage import SHA256_RE, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+DATA_URI_RE = re.compile(r'^data:(?P<content_type>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?;base64,', re.IGNORECASE)
+BLOB_URL_RE = re.compile(r'/api/blobs/(?P<sha256>[0-9a-f]{64})/?(?:\?.*)?$')
+
+# Assinaturas dos formatos aceites. O tipo MIME guardado vem sempre do conteúdo: o tipo
+# indicado pelo cliente (data URI, multipart) é ignorado, e o resto fica application/octet-stream
+MAGIC_NUMBERS = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF', 'application/pdf'),
+]
+
+
+TIPO_DESCONHECIDO = 'application/octet-stream'
+# Tipos que podem ser servidos inline a partir da origem da aplicação
+TIPOS_PERMITIDOS = frozenset([content_type for _, content_type in MAGIC_NUMBERS] + ['image/webp'])
+
+
+def sniff_content_type(data):
+    for magic, content_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return TIPO_DESCONHECIDO
+
+
+class BlobService:
+    @staticmethod
+    def store_bytes(data, rendicoes=True):
+        """
+        Grava os bytes no armazenamento e garante o registo de metadados.
+        O tipo MIME é detetado pelo conteúdo (``sniff_content_type``).
+        Para imagens novas agenda também a geração das rendições (``rendicoes=False`` evita-o).
+        """
+        sha256 = get_blob_store().save(data)
+        blob, created = Blob.objects.get_or_create(
+            sha256=sha256,
+            defaults={
+                'tamanho': len(data),
+                'content_type': sniff_content_type(data),
+            }
+        )
+        if created and rendicoes:
+            RenditionService.agendar(blob)
+        return blob
+
+    @staticmethod
+    def decode_base64(value):
+        """
+        Converte uma string base64 (com ou sem prefixo ``data:``) em bytes; o tipo do
+        prefixo não é usado. Lança ``ValueError`` se a string não for base64 válido.
+        """
+        match = DATA_URI_RE.match(value)
+        if match:
+            value = value[match.end():]
+
+        payload = ''.join(value.split())
+        try:
+            data = base64.b64decode(payload, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Conteúdo não está em base64")
+        if not data:
+            raise ValueError("Conteúdo base64 vazio")
+        return data
+
+    @staticmethod
+    def store_base64(value):
+        return BlobService.store_bytes(BlobService.decode_base64(value))
+
+    @staticmethod
+    def sha256_from_reference(value):
+        """Devolve o SHA-256 se ``value`` for uma referência a um blob (URL da API ou hash)."""
+        if not isinstance(value, str):
+            return None
+        if SHA256_RE.match(value):
+            return value
+        match = BLOB_URL_RE.search(value)
+        return match.group('sha256') if match else None
+
+    @staticmethod
+    def resolve_reference(value):
+        """
+        Converte um valor enviado pelo cliente (base64, data URI ou URL de um blob já
+        existente) num Blob. Devolve None se o valor não for nenhum destes formatos.
+        """
+        sha256 = BlobService.sha256_from_reference(value)
+        if sha256:
+            return Blob.objects.filter(pk=sha256).first()
+        try:
+            return BlobService.store_base64(value)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def url_for(sha256, request=None, rendition=None):
+        url = reverse('blob-detail', kwargs={'sha256': sha256})
+        if rendition:
+            url = f"{url}?{urlencode({'rendition': rendition})}"
+        return request.build_absolute_uri(url) if request is not None else url
+
+    @staticmethod
+    def as_data_uri(blob):
+        """Representação base64 de compatibilidade para clientes antigos."""
+        data = get_blob_store().read(blob.sha256)
+        return f"data:{blob.content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Originais com rendições a ser geradas neste processo, para não repetir o trabalho
+_pendentes = set()
+
+
+def get_executor():
+    """Pool de processos partilhado pelo processo web, criado no primeiro uso."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.BLOB_RENDITION_WORKERS,
+                # spawn: os processos não herdam ligações à base de dados nem threads do worker
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+class RenditionService:
+    @staticmethod
+    def e_imagem(blob):
+        return blob.content_type.startswith('image/') and blob.content_type != 'image/svg+xml'
+
+    @staticmethod
+    def em_falta(sha256):
+        """Nomes das rendições configuradas que ainda não existem para o original."""
+        existentes = set(Rendition.objects.filter(original_id=sha256).values_list('nome', flat=True))
+        return {nome: lado for nome, lado in settings.BLOB_RENDITIONS.items() if nome not in existentes}
+
+    @staticmethod
+    def agendar(blob):
+        """
+        Gera as rendições em falta de uma imagem. Por omissão o trabalho é enviado para o
+        pool de processos depois do commit, sem esperar pelo resultado; com
+        ``BLOB_RENDITIONS_SYNC`` é feito no próprio pedido.
+        """
+        if not RenditionService.e_imagem(blob):
+            return
+        if settings.BLOB_RENDITIONS_SYNC:
+            RenditionService.gerar_agora(blob)
+        else:
+            transaction.on_commit(partial(RenditionService.submeter, blob.sha256))
+
+    @staticmethod
+    def submeter(sha256):
+        tamanhos = RenditionService.em_falta(sha256)
+        if not tamanhos or sha256 in _pendentes:
+            return
+        _pendentes.add(sha256)
+        try:
+            future = get_executor().submit(
+                gerar_rendicoes_de_ficheiro,
+                get_blob_store().path(sha256),
+                tamanhos,
+                settings.BLOB_RENDITION_QUALITY
+            )
+        except Exception:
+            _pendentes.discard(sha256)
+            logger.exception(f"Não foi possível agendar as rendições de {sha256}")
+            return
+        future.add_done_callback(partial(RenditionService._concluir, sha256))
+
+    @staticmethod
+    def _concluir(sha256, future):
+        """Corre numa thread do executor quando o processo termina; grava o resultado."""
+        try:
+            RenditionService.guardar(sha256, future.result())
+        except ValueError as e:
+            logger.warning(f"Rendições de {sha256} não geradas: {e}")
+        except Exception:
+            logger.exception(f"Erro ao gerar as rendições de {sha256}")
+        finally:
+            _pendentes.discard(sha256)
+            connections.close_all()
+
+    @staticmethod
+    def gerar_agora(blob):
+        """Gera as rendições em falta no processo atual. Devolve o número de rendições criadas."""
+        tamanhos = RenditionService.em_falta(blob.sha256)
+        if not tamanhos:
+            return 0
+        try:
+            resultados = gerar_rendicoes(
+                get_blob_store().read(blob.sha256), tamanhos, settings.BLOB_RENDITION_QUALITY
+            )
+        except (ValueError, FileNotFoundError) as e:
+            logger.warning(f"Rendições de {blob.sha256} não geradas: {e}")
+            return 0
+        RenditionService.guardar(blob.sha256, resultados)
+        return len(resultados)
+
+    @staticmethod
+    def guardar(sha256, resultados):
+        for nome, (data, largura, altura) in resultados.items():
+            rendicao = BlobService.store_bytes(data, rendicoes=False)
+            Rendition.objects.update_or_create(
+                original_id=sha256,
+                nome=nome,
+                defaults={'blob': rendicao, 'largura': largura, 'altura': altura}
+            )
+
+    @staticmethod
+    def blobs_de_rendicao():
+        return Rendition.objects.values('blob_id')
+
+    @staticmethod
+    def obter(sha256, nome):
+        return Rendition.objects.select_related('blob').filter(original_id=sha256, nome=nome).first()
+
+    @staticmethod
+    def urls(sha256, request=None):
+        """URLs de cada rendição configurada para um original (``{nome: url}``)."""
+        return {
+            nome: BlobService.url_for(sha256, request, rendition=nome)
+            for nome in settings.BLOB_RENDITIONS
+        }
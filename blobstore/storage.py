@@ -0,0 +1,71 @@
+"""
+Armazenamento de blobs em sistema de ficheiros, endereçado por conteúdo (SHA-256).
+
+Cada blob é gravado uma única vez em ``<raiz>/<aa>/<bb>/<sha256>``; gravar o mesmo
+conteúdo duas vezes não duplica nada. A escrita é feita num ficheiro temporário
+seguido de ``os.replace`` para que um leitor nunca veja um ficheiro incompleto.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class FileSystemBlobStore:
+    """Backend de blobs sobre um diretório local."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, sha256):
+        if not SHA256_RE.match(sha256 or ''):
+            raise ValueError(f"Identificador de blob inválido: {sha256!r}")
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def exists(self, sha256):
+        return self.path(sha256).exists()
+
+    def size(self, sha256):
+        return self.path(sha256).stat().st_size
+
+    def save(self, data):
+        """Grava os bytes (se ainda não existirem) e devolve o respetivo SHA-256."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        destino = self.path(sha256)
+        if destino.exists():
+            return sha256
+
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=destino.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, destino)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return sha256
+
+    def open(self, sha256):
+        return open(self.path(sha256), 'rb')
+
+    def read(self, sha256):
+        with self.open(sha256) as f:
+            return f.read()
+
+    def delete(self, sha256):
+        try:
+            self.path(sha256).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def get_blob_store():
+    """Devolve o backend configurado em ``settings.BLOB_STORAGE_ROOT``."""
+    return FileSystemBlobStore(settings.BLOB_STORAGE_ROOT)
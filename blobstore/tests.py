@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import io
+
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from backend.testing import TempDirSettingMixin
+
+from .models import Blob, Rendition
+from .renditions import gerar_rendicoes_de_ficheiro
+from .services import BlobService, RenditionService, get_executor
+from .storage import get_blob_store
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'0123456789' * 10
+
+
+def jpeg_com_orientacao(largura=40, altura=20, orientacao=6):
+    """JPEG com EXIF: orientação (rodar 90°) e um campo de câmara que não deve sobreviver."""
+    imagem = Image.new('RGB', (largura, altura), 'red')
+    exif = Image.Exif()
+    exif[0x0112] = orientacao
+    exif[0x010F] = 'Camara de teste'
+    saida = io.BytesIO()
+    imagem.save(saida, format='JPEG', exif=exif)
+    return saida.getvalue()
+
+
+class BlobStoreTests(TempDirSettingMixin, TestCase):
+    def test_store_is_content_addressed(self):
+        blob = BlobService.store_bytes(PNG_BYTES)
+        again = BlobService.store_bytes(PNG_BYTES)
+        self.assertEqual(blob.sha256, hashlib.sha256(PNG_BYTES).hexdigest())
+        self.assertEqual(blob.pk, again.pk)
+        self.assertEqual(blob.content_type, 'image/png')
+        self.assertEqual(get_blob_store().read(blob.sha256), PNG_BYTES)
+
+    def test_decode_data_uri(self):
+        blob = BlobService.store_base64('data:image/jpeg;base64,/9j/4AAQ')
+        self.assertEqual(blob.content_type, 'image/jpeg')
+        with self.assertRaises(ValueError):
+            BlobService.decode_base64('not-base64!')
+
+    def test_declared_type_is_ignored(self):
+        html = base64.b64encode(b'<script>alert(1)</script>').decode('ascii')
+        blob = BlobService.store_base64(f'data:text/html;base64,{html}')
+        self.assertEqual(blob.content_type, 'application/octet-stream')
+        png = BlobService.store_base64('data:text/html;base64,' + base64.b64encode(PNG_BYTES).decode('ascii'))
+        self.assertEqual(png.content_type, 'image/png')
+
+        response = self.client.get(f'/api/blobs/{blob.sha256}/')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        response = self.client.get(f'/api/blobs/{png.sha256}/')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+
+    def test_legacy_unsafe_type_is_downloaded(self):
+        # Stored before sniffing was enforced, with the type the client sent
+        data = b'<html><script>alert(1)</script></html>'
+        sha256 = get_blob_store().save(data)
+        Blob.objects.create(sha256=sha256, tamanho=len(data), content_type='text/html')
+        for metodo in (self.client.get, self.client.head):
+            response = metodo(f'/api/blobs/{sha256}/')
+            self.assertEqual(response['Content-Type'], 'application/octet-stream')
+            self.assertEqual(response['Content-Disposition'], 'attachment')
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_serve_full_and_conditional(self):
+        blob = BlobService.store_bytes(PNG_BYTES)
+        url = f'/api/blobs/{blob.sha256}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), PNG_BYTES)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{blob.sha256}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_serve_range(self):
+        blob = BlobService.store_bytes(PNG_BYTES)
+        url = f'/api/blobs/{blob.sha256}/'
+        response = self.client.get(url, HTTP_RANGE='bytes=8-17')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), PNG_BYTES[8:18])
+        self.assertEqual(response['Content-Range'], f'bytes 8-17/{len(PNG_BYTES)}')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), PNG_BYTES[-5:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(PNG_BYTES)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_unknown_blob(self):
+        response = self.client.get('/api/blobs/' + '0' * 64 + '/')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(BLOB_RENDITIONS={'thumb': 10, 'medium': 100}, BLOB_RENDITIONS_SYNC=True)
+class RenditionTests(TempDirSettingMixin, TestCase):
+    def test_generated_at_ingest(self):
+        blob = BlobService.store_bytes(jpeg_com_orientacao())
+        thumb = Rendition.objects.get(original=blob, nome='thumb')
+        # Rotated by the EXIF orientation before resizing
+        self.assertEqual((thumb.largura, thumb.altura), (5, 10))
+        self.assertEqual(thumb.blob.content_type, 'image/webp')
+
+        imagem = Image.open(io.BytesIO(get_blob_store().read(thumb.blob_id)))
+        self.assertEqual(imagem.format, 'WEBP')
+        self.assertEqual(len(imagem.getexif()), 0)
+
+        # Small images are never enlarged
+        medium = Rendition.objects.get(original=blob, nome='medium')
+        self.assertEqual((medium.largura, medium.altura), (20, 40))
+        # Renditions do not get renditions of their own
+        self.assertFalse(Rendition.objects.filter(original=thumb.blob).exists())
+
+    def test_non_images_are_skipped(self):
+        blob = BlobService.store_bytes(b'%PDF-1.4 documento')
+        self.assertFalse(blob.renditions.exists())
+        invalida = BlobService.store_bytes(PNG_BYTES)
+        self.assertFalse(invalida.renditions.exists())
+
+    def test_serve_rendition(self):
+        blob = BlobService.store_bytes(jpeg_com_orientacao())
+        thumb = Rendition.objects.get(original=blob, nome='thumb')
+        response = self.client.get(BlobService.url_for(blob.sha256, rendition='thumb'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['ETag'], f'"{thumb.blob_id}"')
+
+        response = self.client.get(f'/api/blobs/{blob.sha256}/?rendition=enorme')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(BLOB_RENDITIONS_SYNC=False)
+    def test_missing_rendition_redirects_to_original(self):
+        blob = BlobService.store_bytes(jpeg_com_orientacao(), rendicoes=False)
+        response = self.client.get(f'/api/blobs/{blob.sha256}/?rendition=thumb')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/api/blobs/{blob.sha256}/')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_process_pool(self):
+        blob = BlobService.store_bytes(jpeg_com_orientacao(), rendicoes=False)
+        future = get_executor().submit(
+            gerar_rendicoes_de_ficheiro, get_blob_store().path(blob.sha256), {'thumb': 10}
+        )
+        resultados = future.result(timeout=60)
+        RenditionService.guardar(blob.sha256, resultados)
+        self.assertEqual(list(blob.renditions.values_list('nome', flat=True)), ['thumb'])
+
+    def test_backfill_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        blob = BlobService.store_bytes(jpeg_com_orientacao(), rendicoes=False)
+        out = StringIO()
+        call_command('gerar_rendicoes', stdout=out)
+        self.assertIn('2 rendições criadas', out.getvalue())
+        self.assertEqual(blob.renditions.count(), 2)
@@ -0,0 +1,6 @@
+from django.urls import re_path
+from .views import servir_blob
+
+urlpatterns = [
+    re_path(r'^(?P<sha256>[0-9a-f]{64})/$', servir_blob, name='blob-detail'),
+]
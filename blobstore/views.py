@@ -0,0 +1,135 @@
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse, Http404
+from django.views.decorators.http import require_http_methods
+
+from .models import Blob
+from .services import TIPO_DESCONHECIDO, TIPOS_PERMITIDOS, BlobService, RenditionService
+from .storage import get_blob_store
+
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _parse_range(header, size):
+    """
+    Interpreta um cabeçalho ``Range`` de intervalo único.
+    Devolve ``(inicio, fim)`` inclusivos, ``None`` se o cabeçalho deve ser ignorado,
+    ou ``False`` se o intervalo não for satisfazível.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Intervalos múltiplos ou sintaxe desconhecida: servir o conteúdo completo
+        return None
+
+    start, end = match.group('start'), match.group('end')
+    if not start and not end:
+        return None
+    if not start:
+        # Sufixo: os últimos N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_file(f, start, length):
+    with f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _content_type(blob):
+    """Tipo com que o blob é servido: só imagens e PDF mantêm o tipo guardado."""
+    return blob.content_type if blob.content_type in TIPOS_PERMITIDOS else TIPO_DESCONHECIDO
+
+
+def _cache_headers(response, blob):
+    response['ETag'] = f'"{blob.sha256}"'
+    response['Cache-Control'] = f'public, max-age={settings.BLOB_CACHE_MAX_AGE}, immutable'
+    response['Accept-Ranges'] = 'bytes'
+    # Blobs stored before types were sniffed may carry a client-chosen type (e.g. text/html):
+    # never let the browser render those from the application's origin
+    response['X-Content-Type-Options'] = 'nosniff'
+    if blob.content_type not in TIPOS_PERMITIDOS:
+        response['Content-Disposition'] = 'attachment'
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def servir_blob(request, sha256):
+    """
+    Serve os bytes de um blob. O conteúdo nunca muda para o mesmo hash, por isso
+    a resposta pode ser guardada em cache indefinidamente pelos clientes.
+    Suporta pedidos condicionais (If-None-Match) e parciais (Range).
+
+    ``?rendition=<nome>`` serve uma variante redimensionada (ver ``BLOB_RENDITIONS``).
+    Enquanto a rendição não existir o cliente é redirecionado para o original.
+    """
+    try:
+        blob = Blob.objects.get(pk=sha256)
+    except Blob.DoesNotExist:
+        raise Http404("Blob não encontrado")
+
+    nome_rendicao = request.GET.get('rendition')
+    if nome_rendicao:
+        if nome_rendicao not in settings.BLOB_RENDITIONS:
+            raise Http404("Rendição desconhecida")
+        rendicao = RenditionService.obter(sha256, nome_rendicao)
+        if rendicao is None:
+            RenditionService.agendar(blob)
+            response = HttpResponseRedirect(BlobService.url_for(sha256))
+            response['Cache-Control'] = 'no-cache'
+            return response
+        blob = rendicao.blob
+        sha256 = blob.sha256
+
+    if request.headers.get('If-None-Match', '').strip() in (f'"{sha256}"', f'W/"{sha256}"', '*'):
+        return _cache_headers(HttpResponse(status=304), blob)
+
+    store = get_blob_store()
+    try:
+        size = store.size(sha256)
+    except FileNotFoundError:
+        raise Http404("Conteúdo do blob não encontrado")
+
+    byte_range = _parse_range(request.headers.get('Range', ''), size) if 'Range' in request.headers else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _cache_headers(response, blob)
+
+    if byte_range is None:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=_content_type(blob))
+        else:
+            response = FileResponse(store.open(sha256), content_type=_content_type(blob))
+        response['Content-Length'] = str(size)
+        return _cache_headers(response, blob)
+
+    start, end = byte_range
+    length = end - start + 1
+    if request.method == 'HEAD':
+        response = HttpResponse(status=206, content_type=_content_type(blob))
+    else:
+        response = StreamingHttpResponse(
+            _iter_file(store.open(sha256), start, length),
+            status=206,
+            content_type=_content_type(blob)
+        )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return _cache_headers(response, blob)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DespesasCarroConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'despesas_carro'
+
+    def ready(self):
+        from . import signals  # noqa: F401
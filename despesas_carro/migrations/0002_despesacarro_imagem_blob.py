@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blobstore', '0002_rendition'),
+        ('despesas_carro', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despesacarro',
+            name='imagem_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='blobstore.blob'),
+        ),
+    ]
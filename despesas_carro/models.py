@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 from django.contrib.postgres.fields import ArrayField
+from blobstore.models import Blob
 
 class DespesaCarro(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -18,7 +19,8 @@ class DespesaCarro(models.Model):
     
     # Campos para imagens
     imagem = models.TextField(null=True, blank=True)  # Para compatibilidade
-    imagens = ArrayField(models.TextField(), default=list, blank=True)
+    imagens = ArrayField(models.TextField(), default=list, blank=True)  # URLs dos blobs (ou base64 antigo)
+    imagem_blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
     
     # Metadados
     data_criacao = models.DateTimeField(auto_now_add=True)
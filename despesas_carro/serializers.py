@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from blobstore.serializers import BlobImageSerializerMixin
 from .models import DespesaCarro
 from django.contrib.auth.models import User
 
@@ -7,7 +8,9 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'first_name', 'last_name']
 
-class DespesaCarroSerializer(serializers.ModelSerializer):
+class DespesaCarroSerializer(BlobImageSerializerMixin, serializers.ModelSerializer):
+    blob_fields = ('imagem',)
+    blob_list_fields = ('imagens',)
     criadoPor = UserSerializer(source='usuario', read_only=True)
     
     class Meta:
@@ -0,0 +1,139 @@
+"""
+Análise das despesas de carro: distância entre abastecimentos, custo por km e totais
+mensais, calculados no PostgreSQL com ``LAG`` sobre a quilometragem.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection
+
+from backend.cache import CacheVersionada
+from .models import DespesaCarro
+
+# Distância desde a despesa anterior do mesmo utilizador. Leituras que não avançam
+# (conta-quilómetros errado ou trocado) ficam sem distância em vez de negativas.
+LEITURAS = """
+    SELECT d.id, d.usuario_id, d.data_despesa, d.valor_despesa, d.quilometragem,
+           NULLIF(GREATEST(d.quilometragem - LAG(d.quilometragem) OVER (
+               PARTITION BY d.usuario_id
+               ORDER BY d.data_despesa, d.quilometragem, d.data_criacao, d.id
+           ), 0), 0) AS distancia
+    FROM {tabela} d
+    {filtro}
+"""
+
+DESPESAS = """
+    SELECT l.id, l.data_despesa, l.valor_despesa, l.quilometragem, l.distancia,
+           l.valor_despesa / l.distancia AS custo_km
+    FROM ({leituras}) l
+    ORDER BY l.data_despesa, l.quilometragem, l.id
+"""
+
+# Uma linha por (utilizador, mês) e outra por utilizador com mes NULL (os totais).
+# O custo por km só conta as despesas com distância conhecida.
+MESES = """
+    SELECT u.username, date_trunc('month', l.data_despesa)::date AS mes,
+           COUNT(*) AS despesas, SUM(l.valor_despesa) AS valor, SUM(l.distancia) AS distancia,
+           SUM(l.valor_despesa) FILTER (WHERE l.distancia IS NOT NULL) / SUM(l.distancia) AS custo_km
+    FROM ({leituras}) l
+    JOIN auth_user u ON u.id = l.usuario_id
+    GROUP BY GROUPING SETS ((u.username, date_trunc('month', l.data_despesa)), (u.username))
+    ORDER BY u.username, mes NULLS FIRST
+"""
+
+
+def _dinheiro(valor):
+    return str(valor.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)) if valor is not None else None
+
+
+def _custo(valor):
+    return str(valor.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)) if valor is not None else None
+
+
+class AnaliseDespesasService:
+    CACHE = CacheVersionada('despesas_carro:analise')
+
+    @staticmethod
+    def _leituras(usuario_id=None):
+        filtro, params = ('WHERE d.usuario_id = %s', [usuario_id]) if usuario_id is not None else ('', [])
+        return LEITURAS.format(tabela=DespesaCarro._meta.db_table, filtro=filtro), params
+
+    @staticmethod
+    def _executar(sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            colunas = [coluna[0] for coluna in cursor.description]
+            return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+
+    @staticmethod
+    def _totais(linha):
+        return {
+            'despesas': linha['despesas'],
+            'valor': _dinheiro(linha['valor']),
+            'distancia': linha['distancia'] or 0,
+            'custo_km': _custo(linha['custo_km']),
+        }
+
+    @staticmethod
+    def _por_utilizador(usuario_id=None):
+        """``{username: {'meses': [...], 'totais': {...}}}`` a partir de uma só consulta agrupada."""
+        leituras, params = AnaliseDespesasService._leituras(usuario_id)
+        utilizadores = {}
+        for linha in AnaliseDespesasService._executar(MESES.format(leituras=leituras), params):
+            dados = utilizadores.setdefault(linha['username'], {'meses': [], 'totais': None})
+            if linha['mes'] is None:
+                dados['totais'] = AnaliseDespesasService._totais(linha)
+            else:
+                dados['meses'].append({'mes': linha['mes'].strftime('%Y-%m'),
+                                       **AnaliseDespesasService._totais(linha)})
+        return utilizadores
+
+    @staticmethod
+    def calcular(user):
+        """Despesas do utilizador com distância e custo/km, totais por mês e totais gerais."""
+        leituras, params = AnaliseDespesasService._leituras(user.pk)
+        despesas = [
+            {
+                'id': str(linha['id']),
+                'data_despesa': linha['data_despesa'].isoformat(),
+                'valor_despesa': _dinheiro(linha['valor_despesa']),
+                'quilometragem': linha['quilometragem'],
+                'distancia': linha['distancia'],
+                'custo_km': _custo(linha['custo_km']),
+            }
+            for linha in AnaliseDespesasService._executar(DESPESAS.format(leituras=leituras), params)
+        ]
+        resumo = AnaliseDespesasService._por_utilizador(user.pk).get(user.username)
+        vazio = {'despesas': 0, 'valor': '0.00', 'distancia': 0, 'custo_km': None}
+        return {
+            'user': user.username,
+            'despesas': despesas,
+            'meses': resumo['meses'] if resumo else [],
+            'totais': resumo['totais'] if resumo else vazio,
+        }
+
+    @staticmethod
+    def calcular_todos():
+        """Totais por mês e gerais de todos os utilizadores (para administradores)."""
+        return {
+            'utilizadores': [
+                {'user': username, **dados}
+                for username, dados in AnaliseDespesasService._por_utilizador().items()
+            ],
+        }
+
+    @staticmethod
+    def invalidar(usuario_id):
+        """Descarta a análise do utilizador e a de todos os utilizadores."""
+        AnaliseDespesasService.CACHE.invalidar(usuario_id)
+
+    @staticmethod
+    def obter(user):
+        """``calcular`` através da cache, por utilizador."""
+        return AnaliseDespesasService.CACHE.obter(
+            user.pk, lambda: AnaliseDespesasService.calcular(user), escopo=user.pk
+        )
+
+    @staticmethod
+    def obter_todos():
+        """``calcular_todos`` através da cache."""
+        return AnaliseDespesasService.CACHE.obter('todos', AnaliseDespesasService.calcular_todos)
@@ -0,0 +1,19 @@
+"""
+Invalida a análise em cache do utilizador quando uma despesa é gravada ou removida.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import DespesaCarro
+from .services import AnaliseDespesasService
+
+
+def invalidar_analise(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    usuario_id = instance.usuario_id
+    transaction.on_commit(lambda: AnaliseDespesasService.invalidar(usuario_id))
+
+
+post_save.connect(invalidar_analise, sender=DespesaCarro, dispatch_uid='analise_despesas_save')
+post_delete.connect(invalidar_analise, sender=DespesaCarro, dispatch_uid='analise_despesas_delete')
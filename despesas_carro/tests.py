@@ -1,3 +1,169 @@
-from django.test import TestCase
+import base64
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from backend.testing import QueryBudgetMixin, TempDirSettingMixin
+from blobstore.services import BlobService
+from blobstore.tests import jpeg_com_orientacao
+from .models import DespesaCarro
+
+
+class DespesaCarroQueryTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='condutor', password='pass')
+        self.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+
+    def criar_despesas(self, n):
+        DespesaCarro.objects.bulk_create([
+            DespesaCarro(
+                usuario=self.user,
+                tipo_combustivel='Gasóleo',
+                valor_despesa=Decimal('50.00'),
+                data_despesa=date(2024, 1, 1 + i % 28),
+                quilometragem=1000 + i,
+            )
+            for i in range(n)
+        ])
+
+    def test_list_budget(self):
+        # Page query plus the paginator's COUNT
+        self.assertQueryBudget('/api/despesas/', 2, self.criar_despesas)
+
+    def test_search_budget(self):
+        self.assertQueryBudget('/api/despesas/search/?search=Gas', 1, self.criar_despesas)
+
+    def test_admin_filter_by_username_budget(self):
+        self.client.force_authenticate(user=self.admin)
+        self.assertQueryBudget('/api/despesas/?username=condutor', 2, self.criar_despesas)
+        _, response = self.count_queries('/api/despesas/?username=condutor')
+        self.assertEqual(response.data['count'], max(self.query_budget_sizes))
+        self.assertEqual(response.data['results'][0]['criadoPor']['username'], 'condutor')
+
+
+@override_settings(BLOB_RENDITIONS={'thumb': 10}, BLOB_RENDITIONS_SYNC=True)
+class DespesaCarroImagemTests(TempDirSettingMixin, QueryBudgetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='condutor', password='pass')
+        self.client.force_authenticate(user=self.user)
+
+    def test_imagens_are_stored_as_blob_references(self):
+        foto = 'data:image/jpeg;base64,' + base64.b64encode(jpeg_com_orientacao()).decode('ascii')
+        response = self.client.post('/api/despesas/', {
+            'tipo_combustivel': 'Gasóleo',
+            'valor_despesa': '40.00',
+            'data_despesa': '2024-05-01',
+            'quilometragem': 1200,
+            'imagem': foto,
+            'imagens': [foto, 'https://exemplo.pt/recibo.jpg'],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        despesa = DespesaCarro.objects.get()
+        self.assertIsNone(despesa.imagem)
+        self.assertEqual(despesa.imagens[0], f'/api/blobs/{despesa.imagem_blob_id}/')
+        self.assertEqual(despesa.imagens[1], 'https://exemplo.pt/recibo.jpg')
+        self.assertTrue(response.data['imagens'][0].startswith('http'))
+        self.assertIsNotNone(response.data['imagens_rendicoes'][0])
+        self.assertIsNone(response.data['imagens_rendicoes'][1])
+
+    def test_base64_list_reads_blobs_once(self):
+        blob = BlobService.store_bytes(jpeg_com_orientacao())
+        em_falta = '0' * 64  # Looks like a blob reference but is not stored
+
+        def criar_despesas(n):
+            DespesaCarro.objects.bulk_create([
+                DespesaCarro(
+                    usuario=self.user, tipo_combustivel='Gasóleo', valor_despesa=Decimal('50.00'),
+                    data_despesa=date(2024, 1, 1), quilometragem=1000 + i, imagem_blob=blob,
+                    imagens=[f'/api/blobs/{blob.sha256}/', 'https://exemplo.pt/recibo.jpg', em_falta],
+                )
+                for i in range(n)
+            ])
+
+        # Page query, the paginator's COUNT and one query for every referenced blob
+        self.assertQueryBudget('/api/despesas/?formato_imagem=base64', 3, criar_despesas)
+        _, response = self.count_queries('/api/despesas/?formato_imagem=base64')
+        despesa = response.data['results'][0]
+        self.assertTrue(despesa['imagem'].startswith('data:image/jpeg;base64,'))
+        self.assertEqual(despesa['imagens'][0], despesa['imagem'])
+        self.assertEqual(despesa['imagens'][1:], ['https://exemplo.pt/recibo.jpg', em_falta])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AnaliseDespesasTests(TestCase):
+    URL = '/api/despesas/analise/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='condutor', password='pass')
+        self.outro = User.objects.create_user(username='outro', password='pass')
+        self.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        self.despesa(self.user, '2024-01-05', '60.00', 10000)
+        self.despesa(self.user, '2024-01-20', '50.00', 10500)
+        self.despesa(self.user, '2024-02-03', '45.00', 11000)
+        self.despesa(self.user, '2024-02-18', '30.00', 10900)  # Odometer typo: no distance
+        self.despesa(self.outro, '2024-01-10', '80.00', 50000)
+        self.despesa(self.outro, '2024-01-25', '40.00', 50200)
+
+    def despesa(self, usuario, data, valor, km):
+        return DespesaCarro.objects.create(usuario=usuario, tipo_combustivel='Gasóleo',
+                                           valor_despesa=Decimal(valor), data_despesa=data, quilometragem=km)
+
+    def test_distancia_custo_e_meses(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(d['distancia'], d['custo_km']) for d in response.data['despesas']],
+            [(None, None), (500, '0.1000'), (500, '0.0900'), (None, None)],
+        )
+        self.assertEqual(response.data['meses'], [
+            {'mes': '2024-01', 'despesas': 2, 'valor': '110.00', 'distancia': 500, 'custo_km': '0.1000'},
+            {'mes': '2024-02', 'despesas': 2, 'valor': '75.00', 'distancia': 500, 'custo_km': '0.0900'},
+        ])
+        self.assertEqual(response.data['totais'],
+                         {'despesas': 4, 'valor': '185.00', 'distancia': 1000, 'custo_km': '0.0950'})
+
+    def test_cache_invalidada_ao_gravar(self):
+        self.client.get(self.URL)
+        with self.assertNumQueries(0):
+            self.client.get(self.URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.despesa(self.user, '2024-03-01', '20.00', 11200)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.data['totais']['despesas'], 5)
+        self.assertEqual(response.data['despesas'][-1]['distancia'], 300)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DespesaCarro.objects.filter(usuario=self.user).first().delete()
+        self.assertEqual(self.client.get(self.URL).data['totais']['despesas'], 4)
+
+    def test_administrador_todos_numa_consulta(self):
+        self.assertEqual(self.client.get(self.URL, {'todos': 1}).data['user'], 'condutor')
+
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL, {'todos': 1})
+        utilizadores = {u['user']: u for u in response.data['utilizadores']}
+        self.assertEqual(set(utilizadores), {'condutor', 'outro'})
+        self.assertEqual(utilizadores['outro']['totais']['custo_km'], '0.2000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.despesa(self.outro, '2024-02-01', '10.00', 50300)
+        response = self.client.get(self.URL, {'todos': 1})
+        self.assertEqual({u['user']: u for u in response.data['utilizadores']}['outro']['totais']['despesas'], 3)
+
+        response = self.client.get(self.URL, {'username': 'outro'})
+        self.assertEqual(response.data['user'], 'outro')
+        self.assertEqual(self.client.get(self.URL, {'username': 'ninguem'}).status_code, 404)
@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from django.contrib.auth.models import User
 from .models import DespesaCarro
 from .serializers import DespesaCarroSerializer
+from .services import AnaliseDespesasService
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q
 
@@ -14,12 +15,13 @@ class DespesaCarroViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        queryset = DespesaCarro.objects.filter(usuario=user)
+        # criadoPor is serialized for every row, so the user is joined up front
+        queryset = DespesaCarro.objects.select_related('usuario').filter(usuario=user)
         
         # Filtrar por nome de utilizador se especificado
         username = self.request.query_params.get('username', None)
         if username and user.is_staff:  # Apenas administradores podem filtrar por outros utilizadores
-            queryset = DespesaCarro.objects.filter(usuario__username=username)
+            queryset = DespesaCarro.objects.select_related('usuario').filter(usuario__username=username)
             
         return queryset
     
@@ -43,5 +45,22 @@ class DespesaCarroViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def analise(self, request):
+        """
+        Distância entre despesas, custo por km e totais mensais do utilizador.
+        Administradores podem pedir ``?username=`` ou ``?todos=1`` (todos, só totais).
+        """
+        user = request.user
+        if user.is_staff and request.query_params.get('todos'):
+            return Response(AnaliseDespesasService.obter_todos())
+
+        username = request.query_params.get('username', None)
+        if username and user.is_staff:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                return Response({"error": "Utilizador não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(AnaliseDespesasService.obter(user))
+
     def perform_create(self, serializer):
         serializer.save(usuario=self.request.user, usuario_criacao=self.request.user.username)
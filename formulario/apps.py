@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FormularioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'formulario'
+
+    def ready(self):
+        from . import signals  # noqa: F401
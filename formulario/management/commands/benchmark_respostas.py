@@ -0,0 +1,109 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+
+from formulario.models import Resposta
+from formulario.services import RespostaService
+from formulario.views import obter_todas_respostas
+
+
+class Rollback(Exception):
+    """Usada para desfazer os dados de teste no fim do benchmark."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo e o pico de memória Python da listagem de respostas do formulário: a "
+        "lista plana por omissão (tudo numa JsonResponse), uma página agrupada por instalação e o dump "
+        "completo em NDJSON. Os dados de teste são criados numa transação desfeita no fim."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--respostas', type=int, default=1_000_000,
+                            help="Número de respostas de teste a criar (0 usa apenas as existentes)")
+        parser.add_argument('--perguntas', type=int, default=60,
+                            help="Perguntas por instalação nas respostas de teste")
+        parser.add_argument('--limite', type=int, default=RespostaService.LIMITE_INSTALACOES,
+                            help="Instalações por página")
+        parser.add_argument('--lista-plana', action='store_true',
+                            help="Mede também a lista plana por omissão (carrega tudo em memória)")
+
+    def handle(self, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                self.criar_respostas(kwargs['respostas'], kwargs['perguntas'])
+                self.medir_tudo(kwargs['limite'], kwargs['lista_plana'])
+                raise Rollback()
+        except Rollback:
+            self.stdout.write("Respostas de teste removidas.")
+
+    def criar_respostas(self, quantidade, perguntas):
+        if quantidade <= 0:
+            return
+        tabela = Resposta._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {tabela} (numero_instalacao, pergunta_id, resposta, comentario, tecnico, "
+                f"data, ultima_atualizacao) "
+                f"SELECT 'BENCH-' || lpad((i / %s)::text, 7, '0'), i %% %s, "
+                f"CASE WHEN i %% 7 = 0 THEN 'Não' ELSE 'Sim' END, "
+                f"CASE WHEN i %% 11 = 0 THEN 'Comentário de teste' ELSE '' END, "
+                f"'Técnico ' || (i %% 20), now(), now() "
+                f"FROM generate_series(0, %s - 1) AS i",
+                [perguntas, perguntas, quantidade],
+            )
+            # Fresh statistics so the planner sees the seeded volume
+            cursor.execute(f'ANALYZE {tabela}')
+        self.stdout.write(f"Criadas {quantidade:,} respostas de teste.")
+
+    def medir(self, rotulo, funcao):
+        """Tempo de uma execução normal e pico de memória de outra com o tracemalloc (que a torna lenta)."""
+        inicio = time.perf_counter()
+        tamanho = funcao()
+        duracao = time.perf_counter() - inicio
+        tracemalloc.start()
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{rotulo:<16} tempo={duracao * 1000:>10.1f} ms  pico={pico / 2 ** 20:>9.1f} MiB  "
+            f"resposta={tamanho / 2 ** 20:>9.1f} MiB"
+        )
+
+    def medir_tudo(self, limite, lista_plana):
+        factory = RequestFactory()
+        total = Resposta.objects.count()
+        self.stdout.write(f"{total:,} respostas na tabela:")
+
+        if lista_plana:
+            def listagem():
+                return len(obter_todas_respostas(factory.get('/formulario/obter_todas/')).content)
+            self.medir('lista plana', listagem)
+
+        def pagina(apos=None):
+            parametros = {'limite': limite}
+            if apos:
+                parametros['apos'] = apos
+            return lambda: len(obter_todas_respostas(factory.get('/formulario/obter_todas/', parametros)).content)
+
+        self.medir('primeira página', pagina())
+        meio = (
+            Resposta.objects.order_by('numero_instalacao').values_list('numero_instalacao', flat=True)
+            [total // 2 if total else 0:][:1]
+        )
+        self.medir('página do meio', pagina(next(iter(meio), None)))
+
+        def ndjson():
+            response = obter_todas_respostas(factory.get('/formulario/obter_todas/', {'formato': 'ndjson'}))
+            tamanho = linhas = 0
+            for bloco in response.streaming_content:
+                tamanho += len(bloco)
+                linhas += 1
+            if linhas:
+                json.loads(bloco)  # The last line is a complete JSON object
+            return tamanho
+        self.medir('ndjson completo', ndjson)
@@ -0,0 +1,265 @@
+import hashlib
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Lower, Trim
+
+from backend.cache import CacheVersionada
+from .models import Resposta
+
+# Limites de uma coluna integer do PostgreSQL
+PERGUNTA_MINIMA, PERGUNTA_MAXIMA = -2 ** 31, 2 ** 31 - 1
+# Primeira chave do pg_advisory_xact_lock(int, int) usado por instalação
+LOCK_RESPOSTAS = 72_617_002
+
+# Campos de cada resposta nas listagens (o primeiro é a chave de agrupamento)
+CAMPOS_LISTAGEM = ('numero_instalacao', 'pergunta_id', 'resposta', 'comentario', 'tecnico', 'data')
+
+
+class RespostaService:
+    """Gravação das respostas do checklist de uma instalação."""
+
+    @staticmethod
+    def salvar(numero_instalacao, tecnico, respostas, comentarios):
+        """
+        Grava ``respostas`` ({pergunta_id: resposta}) e ``comentarios`` de uma instalação
+        numa transação e num único INSERT ... ON CONFLICT (numero_instalacao, pergunta_id).
+        Só são reescritas as respostas cuja resposta ou comentário mudou; as perguntas
+        que não vêm no pedido ficam como estão.
+
+        Gravações concorrentes da mesma instalação são serializadas com um advisory lock.
+        Retorna ``{'criadas', 'atualizadas', 'inalteradas'}``; levanta ``ValueError`` se
+        algum identificador de pergunta não for um inteiro ou se repetir (por exemplo ``"1"`` e
+        ``"01"``), antes de escrever o que quer que seja.
+        """
+        perguntas, valores, notas, vistas = [], [], [], set()
+        for pergunta_id, resposta in respostas.items():
+            try:
+                numero = int(pergunta_id)
+            except (TypeError, ValueError):
+                numero = None
+            if numero is None or not PERGUNTA_MINIMA <= numero <= PERGUNTA_MAXIMA:
+                raise ValueError(f'Identificador de pergunta inválido: {pergunta_id}')
+            if numero in vistas:
+                # "1" and "01" are the same question; ON CONFLICT cannot touch a row twice
+                raise ValueError(f'Pergunta repetida: {numero}')
+            vistas.add(numero)
+            perguntas.append(numero)
+            valores.append('' if resposta is None else str(resposta))
+            comentario = comentarios.get(str(pergunta_id), comentarios.get(pergunta_id, ''))
+            notas.append(None if comentario is None else str(comentario))
+
+        tabela = Resposta._meta.db_table
+        sql = (
+            f'INSERT INTO {tabela} (numero_instalacao, pergunta_id, resposta, comentario, tecnico, '
+            f'data, ultima_atualizacao) '
+            f'SELECT %s, u.pergunta_id, u.resposta, u.comentario, %s, now(), now() '
+            f'FROM unnest(%s::integer[], %s::text[], %s::text[]) AS u(pergunta_id, resposta, comentario) '
+            f'ON CONFLICT (numero_instalacao, pergunta_id) DO UPDATE SET '
+            f'resposta = EXCLUDED.resposta, comentario = EXCLUDED.comentario, '
+            f'tecnico = EXCLUDED.tecnico, ultima_atualizacao = EXCLUDED.ultima_atualizacao '
+            f'WHERE ({tabela}.resposta, {tabela}.comentario) '
+            f'IS DISTINCT FROM (EXCLUDED.resposta, EXCLUDED.comentario) '
+            # xmax = 0 only for freshly inserted rows
+            f'RETURNING (xmax = 0)'
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', [LOCK_RESPOSTAS, numero_instalacao])
+                cursor.execute(sql, [numero_instalacao, tecnico, perguntas, valores, notas])
+                gravadas = [inserida for inserida, in cursor.fetchall()]
+            if gravadas:
+                transaction.on_commit(ConformidadeService.invalidar)
+
+        criadas = sum(gravadas)
+        return {
+            'criadas': criadas,
+            'atualizadas': len(gravadas) - criadas,
+            'inalteradas': len(perguntas) - len(gravadas),
+        }
+
+    # Listagem agrupada por instalação
+    LIMITE_INSTALACOES = 50
+    LIMITE_INSTALACOES_MAXIMO = 500
+    CHUNK_SIZE = 2000
+
+    @staticmethod
+    def _linhas_ordenadas(queryset):
+        return queryset.order_by('numero_instalacao', 'pergunta_id').values_list(*CAMPOS_LISTAGEM)
+
+    @staticmethod
+    def agrupar(linhas):
+        """
+        Junta as linhas (tuplos de ``CAMPOS_LISTAGEM`` ordenados por instalação) num
+        dicionário por instalação, à medida que são lidas.
+        """
+        for numero_instalacao, grupo in groupby(linhas, key=itemgetter(0)):
+            yield {
+                'numero_instalacao': numero_instalacao,
+                'respostas': [dict(zip(CAMPOS_LISTAGEM[1:], linha[1:])) for linha in grupo],
+            }
+
+    @staticmethod
+    def pagina(apos=None, limite=LIMITE_INSTALACOES):
+        """
+        As ``limite`` instalações seguintes a ``apos`` (por número de instalação), com as
+        respostas, numa só query. Retorna ``(grupos, proximo)``; ``proximo`` é o cursor da
+        página seguinte ou ``None`` na última.
+        """
+        instalacoes = Resposta.objects.order_by('numero_instalacao').values('numero_instalacao').distinct()
+        if apos is not None:
+            instalacoes = instalacoes.filter(numero_instalacao__gt=apos)
+        linhas = RespostaService._linhas_ordenadas(
+            Resposta.objects.filter(numero_instalacao__in=instalacoes[:limite])
+        )
+        grupos = list(RespostaService.agrupar(linhas))
+        proximo = grupos[-1]['numero_instalacao'] if len(grupos) == limite else None
+        return grupos, proximo
+
+    @staticmethod
+    def listagem():
+        """Todas as respostas numa lista plana, um dicionário por resposta (formato original da listagem)."""
+        return list(Resposta.objects.values(*CAMPOS_LISTAGEM))
+
+    @staticmethod
+    def todas():
+        """Todas as instalações, uma a uma, lidas por um cursor do lado do servidor."""
+        linhas = RespostaService._linhas_ordenadas(Resposta.objects.all())
+        return RespostaService.agrupar(linhas.iterator(chunk_size=RespostaService.CHUNK_SIZE))
+
+    @staticmethod
+    def da_instalacao(numero_instalacao):
+        """Respostas de uma instalação no formato de ``obter_respostas`` (uma query), ou ``None``."""
+        linhas = list(
+            Resposta.objects.filter(numero_instalacao=numero_instalacao)
+            .order_by('pergunta_id')
+            .values_list('pergunta_id', 'resposta', 'comentario', 'tecnico', 'data')
+        )
+        if not linhas:
+            return None
+        return {
+            'respostas': {pergunta_id: resposta for pergunta_id, resposta, *_ in linhas},
+            'comentarios': {pergunta_id: comentario for pergunta_id, _, comentario, *_ in linhas},
+            'tecnico': linhas[0][3],
+            'data_ultima_atualizacao': max(linha[4] for linha in linhas),
+        }
+
+
+class ConformidadeService:
+    """
+    Matriz de conformidade do checklist: por instalação e por técnico, quantas perguntas
+    estão por responder, falharam ou têm comentário. Calculada com agregações no
+    PostgreSQL e guardada na cache até à próxima gravação de respostas.
+    """
+
+    # Respostas contadas como falha (comparadas em minúsculas e sem espaços nas pontas)
+    RESPOSTAS_FALHA = ('não', 'nao', 'no', 'nok', 'falha')
+    # Registo inicial criado por criar_instalacao; não é uma pergunta
+    PERGUNTA_INICIAL = 0
+    CACHE = CacheVersionada('formulario:conformidade')
+    CONTADORES = ('perguntas', 'respondidas', 'falhas', 'comentadas')
+
+    @staticmethod
+    def _contagens():
+        """Contagens de cada grupo de respostas (a pergunta inicial não conta)."""
+        pergunta = ~Q(pergunta_id=ConformidadeService.PERGUNTA_INICIAL)
+        return {
+            'perguntas': Count('id', filter=pergunta),
+            'respondidas': Count('id', filter=pergunta & ~Q(texto='')),
+            'falhas': Count('id', filter=pergunta & Q(valor__in=ConformidadeService.RESPOSTAS_FALHA)),
+            'comentadas': Count('id', filter=pergunta & Q(nota__isnull=False) & ~Q(nota='')),
+            'ultima_atualizacao': Max('ultima_atualizacao'),
+        }
+
+    @staticmethod
+    def _completar(linha):
+        linha['por_responder'] = linha['perguntas'] - linha['respondidas']
+        linha['conclusao'] = (
+            round(100 * linha['respondidas'] / linha['perguntas'], 1) if linha['perguntas'] else None
+        )
+        return linha
+
+    @staticmethod
+    def _somar(destino, linha):
+        for campo in ConformidadeService.CONTADORES:
+            destino[campo] += linha[campo]
+        if linha['ultima_atualizacao'] and (
+            destino['ultima_atualizacao'] is None or linha['ultima_atualizacao'] > destino['ultima_atualizacao']
+        ):
+            destino['ultima_atualizacao'] = linha['ultima_atualizacao']
+
+    @staticmethod
+    def _vazia(**campos):
+        return {**campos, **dict.fromkeys(ConformidadeService.CONTADORES, 0), 'ultima_atualizacao': None}
+
+    @staticmethod
+    def calcular(tecnico=None, pendentes=False):
+        """
+        Matriz para as respostas de ``tecnico`` (ou de todos). Com ``pendentes`` só entram
+        as instalações com perguntas por responder, falhas ou comentários.
+        Retorna ``{'instalacoes', 'tecnicos', 'totais'}``.
+
+        A base de dados devolve uma linha por (instalação, técnico), numa só passagem pela
+        tabela; as vistas por instalação e por técnico são somas dessas linhas.
+        """
+        # Equality on the trimmed text is cheaper than a collation-aware '> ' comparison
+        respostas = Resposta.objects.alias(
+            texto=Trim('resposta'), valor=Lower(Trim('resposta')), nota=Trim('comentario')
+        )
+        if tecnico:
+            respostas = respostas.filter(tecnico=tecnico)
+        grupos = respostas.values('numero_instalacao', 'tecnico').annotate(
+            **ConformidadeService._contagens()
+        ).order_by()
+
+        por_instalacao = {}
+        for grupo in grupos:
+            numero = grupo['numero_instalacao']
+            instalacao = por_instalacao.get(numero)
+            if instalacao is None:
+                instalacao = por_instalacao[numero] = ConformidadeService._vazia(
+                    numero_instalacao=numero, tecnicos=[], grupos=[]
+                )
+            ConformidadeService._somar(instalacao, grupo)
+            instalacao['grupos'].append(grupo)
+            if grupo['tecnico'] is not None:
+                instalacao['tecnicos'].append(grupo['tecnico'])
+
+        instalacoes = []
+        por_tecnico = {}
+        totais = ConformidadeService._vazia(instalacoes=0)
+        for numero in sorted(por_instalacao):
+            instalacao = ConformidadeService._completar(por_instalacao[numero])
+            if pendentes and not (instalacao['por_responder'] or instalacao['falhas'] or instalacao['comentadas']):
+                continue
+            for grupo in instalacao.pop('grupos'):
+                linha = por_tecnico.get(grupo['tecnico'])
+                if linha is None:
+                    linha = por_tecnico[grupo['tecnico']] = ConformidadeService._vazia(
+                        tecnico=grupo['tecnico'], instalacoes=0
+                    )
+                linha['instalacoes'] += 1
+                ConformidadeService._somar(linha, grupo)
+            instalacao['tecnicos'].sort()
+            instalacoes.append(instalacao)
+            totais['instalacoes'] += 1
+            ConformidadeService._somar(totais, instalacao)
+
+        tecnicos = [
+            ConformidadeService._completar(por_tecnico[nome])
+            for nome in sorted(por_tecnico, key=lambda nome: (nome is None, nome or ''))
+        ]
+        return {'instalacoes': instalacoes, 'tecnicos': tecnicos, 'totais': ConformidadeService._completar(totais)}
+
+    @staticmethod
+    def invalidar():
+        """Muda a versão, de modo que as matrizes em cache deixam de ser usadas."""
+        ConformidadeService.CACHE.invalidar()
+
+    @staticmethod
+    def obter(tecnico=None, pendentes=False):
+        """``calcular`` através da cache, por versão e por filtros."""
+        filtros = hashlib.sha256(f'{tecnico or ""}|{int(bool(pendentes))}'.encode()).hexdigest()[:16]
+        return ConformidadeService.CACHE.obter(filtros, lambda: ConformidadeService.calcular(tecnico, pendentes))
@@ -0,0 +1,19 @@
+"""
+Invalida a matriz de conformidade em cache quando uma resposta é gravada ou removida pelo ORM.
+A gravação em massa (``RespostaService.salvar``) não dispara sinais e invalida explicitamente.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Resposta
+from .services import ConformidadeService
+
+
+def invalidar_conformidade(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(ConformidadeService.invalidar)
+
+
+post_save.connect(invalidar_conformidade, sender=Resposta, dispatch_uid='conformidade_save_resposta')
+post_delete.connect(invalidar_conformidade, sender=Resposta, dispatch_uid='conformidade_delete_resposta')
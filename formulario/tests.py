@@ -1,3 +1,230 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Resposta
+from .services import RespostaService
+
+
+class SalvarRespostasTests(TestCase):
+    def setUp(self):
+        self.url = reverse('salvar_respostas')
+
+    def salvar(self, respostas, comentarios=None, tecnico='Ana', numero='INST-1'):
+        return self.client.post(
+            self.url,
+            data=json.dumps({
+                'numeroInstalacao': numero,
+                'respostas': respostas,
+                'comentarios': comentarios or {},
+                'tecnico': tecnico,
+            }),
+            content_type='application/json',
+        )
+
+    def test_cria_respostas(self):
+        response = self.salvar({'1': 'Sim', '2': 'Não'}, {'2': 'Porta partida'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['criadas'], 2)
+        self.assertEqual(
+            list(Resposta.objects.values_list('pergunta_id', 'resposta', 'comentario', 'tecnico')),
+            [(1, 'Sim', '', 'Ana'), (2, 'Não', 'Porta partida', 'Ana')],
+        )
+
+    def test_checklist_inteiro_com_numero_fixo_de_queries(self):
+        respostas = {str(pergunta): 'Sim' for pergunta in range(1, 61)}
+        with CaptureQueriesContext(connection) as queries:
+            self.salvar(respostas)
+        self.assertEqual(Resposta.objects.count(), 60)
+        # Lock + upsert (+ savepoint/release inside the test transaction)
+        self.assertLessEqual(len(queries), 4)
+        self.assertTrue(any('pg_advisory_xact_lock' in query['sql'] for query in queries))
+
+    def test_so_altera_linhas_modificadas(self):
+        self.salvar({'1': 'Sim', '2': 'Não', '3': 'Sim'}, {'2': 'Porta partida'})
+        antes = dict(Resposta.objects.values_list('pergunta_id', 'ultima_atualizacao'))
+
+        response = self.salvar({'1': 'Sim', '2': 'Não', '3': 'Não'}, {'2': 'Porta partida'}, tecnico='Rui')
+        self.assertEqual(
+            {chave: response.json()[chave] for chave in ('criadas', 'atualizadas', 'inalteradas')},
+            {'criadas': 0, 'atualizadas': 1, 'inalteradas': 2},
+        )
+        depois = {
+            resposta.pergunta_id: resposta for resposta in Resposta.objects.all()
+        }
+        self.assertEqual(depois[1].ultima_atualizacao, antes[1])
+        self.assertEqual(depois[1].tecnico, 'Ana')
+        self.assertEqual((depois[3].resposta, depois[3].tecnico), ('Não', 'Rui'))
+
+    def test_mudanca_de_comentario_conta_como_alteracao(self):
+        self.salvar({'1': 'Sim'}, {'1': 'ok'})
+        resumo = RespostaService.salvar('INST-1', 'Ana', {'1': 'Sim'}, {'1': 'revisto'})
+        self.assertEqual(resumo, {'criadas': 0, 'atualizadas': 1, 'inalteradas': 0})
+        self.assertEqual(Resposta.objects.get().comentario, 'revisto')
+
+    def test_perguntas_ausentes_e_outras_instalacoes_ficam(self):
+        self.salvar({'1': 'Sim', '2': 'Sim'})
+        self.salvar({'1': 'Não'}, numero='INST-2')
+        self.salvar({'1': 'Não'})
+        self.assertEqual(
+            sorted(Resposta.objects.values_list('numero_instalacao', 'pergunta_id', 'resposta')),
+            [('INST-1', 1, 'Não'), ('INST-1', 2, 'Sim'), ('INST-2', 1, 'Não')],
+        )
+
+    def test_pergunta_invalida_nao_grava_nada(self):
+        response = self.salvar({'1': 'Sim', 'abc': 'Não'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+        response = self.salvar({'1': 'Sim', str(2 ** 31): 'Não'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Resposta.objects.exists())
+
+    def test_pergunta_repetida_nao_grava_nada(self):
+        response = self.salvar({'1': 'Sim', '01': 'Não'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'Pergunta repetida: 1')
+        self.assertFalse(Resposta.objects.exists())
+
+    def test_numero_de_instalacao_numerico(self):
+        response = self.salvar({'1': 'Sim'}, numero=123)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Resposta.objects.values_list('numero_instalacao', flat=True)), ['123'])
+        for numero in ([123], {'n': 1}, True):
+            self.assertEqual(self.salvar({'1': 'Sim'}, numero=numero).status_code, 400)
+
+    def test_respostas_que_nao_sao_objeto(self):
+        response = self.salvar(['Sim', 'Não'])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Resposta.objects.exists())
+
+
+class ListagemRespostasTests(TestCase):
+    def setUp(self):
+        for numero in ('INST-A', 'INST-B', 'INST-C'):
+            RespostaService.salvar(numero, 'Ana', {'2': 'Não', '1': 'Sim'}, {'2': 'nota'})
+        self.url = reverse('obter_todas_respostas')
+
+    def test_lista_plana_por_omissao(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        corpo = response.json()
+        self.assertEqual(set(corpo), {'status', 'data'})
+        self.assertEqual(len(corpo['data']), 6)
+        self.assertEqual(
+            [(r['numero_instalacao'], r['pergunta_id']) for r in corpo['data'][:3]],
+            [('INST-A', 1), ('INST-A', 2), ('INST-B', 1)],
+        )
+        self.assertEqual(
+            set(corpo['data'][1]),
+            {'numero_instalacao', 'pergunta_id', 'resposta', 'comentario', 'tecnico', 'data'},
+        )
+        self.assertEqual((corpo['data'][1]['resposta'], corpo['data'][1]['comentario']), ('Não', 'nota'))
+
+    def test_pagina_agrupada_por_instalacao(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'limite': 2})
+        corpo = response.json()
+        self.assertEqual([grupo['numero_instalacao'] for grupo in corpo['data']], ['INST-A', 'INST-B'])
+        self.assertEqual(
+            [(r['pergunta_id'], r['resposta'], r['comentario']) for r in corpo['data'][0]['respostas']],
+            [(1, 'Sim', ''), (2, 'Não', 'nota')],
+        )
+        self.assertEqual(corpo['proximo'], 'INST-B')
+
+        corpo = self.client.get(self.url, {'limite': 2, 'apos': corpo['proximo']}).json()
+        self.assertEqual([grupo['numero_instalacao'] for grupo in corpo['data']], ['INST-C'])
+        self.assertIsNone(corpo['proximo'])
+
+    def test_limite_invalido(self):
+        for limite in ('0', 'abc', '501'):
+            self.assertEqual(self.client.get(self.url, {'limite': limite}).status_code, 400)
+
+    def test_sem_respostas(self):
+        Resposta.objects.all().delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'limite': 2}).status_code, 404)
+
+    def test_ndjson(self):
+        response = self.client.get(self.url, {'formato': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        grupos = [json.loads(linha) for linha in linhas]
+        self.assertEqual([grupo['numero_instalacao'] for grupo in grupos], ['INST-A', 'INST-B', 'INST-C'])
+        self.assertEqual(len(grupos[2]['respostas']), 2)
+
+    def test_obter_respostas_numa_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('obter_respostas', args=['INST-B']))
+        data = response.json()['data']
+        self.assertEqual(data['respostas'], {'1': 'Sim', '2': 'Não'})
+        self.assertEqual(data['comentarios'], {'1': '', '2': 'nota'})
+        self.assertEqual(data['tecnico'], 'Ana')
+        self.assertEqual(self.client.get(reverse('obter_respostas', args=['X'])).status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MatrizConformidadeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('matriz_conformidade')
+        Resposta.objects.create(numero_instalacao='INST-A', pergunta_id=0, resposta='', tecnico='Técnico padrão')
+        RespostaService.salvar('INST-A', 'Ana', {'1': 'Sim', '2': ' NÃO ', '3': ''}, {'1': '  ', '2': 'Fuga'})
+        RespostaService.salvar('INST-B', 'Rui', {'1': 'Sim', '2': 'Sim'}, {})
+
+    def matriz(self, **parametros):
+        response = self.client.get(self.url, parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_contagens_por_instalacao(self):
+        instalacoes = {linha['numero_instalacao']: linha for linha in self.matriz()['instalacoes']}
+        a = instalacoes['INST-A']
+        self.assertEqual(
+            {campo: a[campo] for campo in ('perguntas', 'respondidas', 'por_responder', 'falhas', 'comentadas')},
+            {'perguntas': 3, 'respondidas': 2, 'por_responder': 1, 'falhas': 1, 'comentadas': 1},
+        )
+        self.assertEqual(a['conclusao'], 66.7)
+        self.assertEqual(sorted(a['tecnicos']), ['Ana', 'Técnico padrão'])
+        self.assertEqual(instalacoes['INST-B']['conclusao'], 100.0)
+
+    def test_por_tecnico_e_totais(self):
+        matriz = self.matriz()
+        tecnicos = {linha['tecnico']: linha for linha in matriz['tecnicos']}
+        self.assertEqual((tecnicos['Ana']['instalacoes'], tecnicos['Ana']['falhas']), (1, 1))
+        self.assertEqual((tecnicos['Rui']['respondidas'], tecnicos['Rui']['por_responder']), (2, 0))
+        self.assertEqual(matriz['totais']['instalacoes'], 2)
+        self.assertEqual(matriz['totais']['perguntas'], 5)
+
+    def test_filtros(self):
+        pendentes = self.matriz(pendentes='1')
+        self.assertEqual([linha['numero_instalacao'] for linha in pendentes['instalacoes']], ['INST-A'])
+        self.assertEqual({linha['tecnico'] for linha in pendentes['tecnicos']}, {'Ana', 'Técnico padrão'})
+        do_rui = self.matriz(tecnico='Rui')
+        self.assertEqual([linha['numero_instalacao'] for linha in do_rui['instalacoes']], ['INST-B'])
+
+    def test_cache_invalidada_pela_gravacao(self):
+        self.matriz()
+        with self.assertNumQueries(0):
+            self.matriz()
+
+        # Saving identical answers writes nothing and keeps the cached matrix
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            RespostaService.salvar('INST-B', 'Rui', {'1': 'Sim', '2': 'Sim'}, {})
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RespostaService.salvar('INST-B', 'Rui', {'2': 'Não'}, {})
+        instalacoes = {linha['numero_instalacao']: linha for linha in self.matriz()['instalacoes']}
+        self.assertEqual(instalacoes['INST-B']['falhas'], 1)
+
+    def test_cache_invalidada_pelo_orm(self):
+        self.matriz()
+        with self.captureOnCommitCallbacks(execute=True):
+            Resposta.objects.filter(numero_instalacao='INST-B').delete()
+        numeros = [linha['numero_instalacao'] for linha in self.matriz()['instalacoes']]
+        self.assertEqual(numeros, ['INST-A'])
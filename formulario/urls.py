@@ -1,10 +1,11 @@
 from django.urls import path
-from .views import salvar_respostas, obter_respostas, obter_todas_respostas, criar_instalacao, deletar_respostas
+from .views import salvar_respostas, obter_respostas, obter_todas_respostas, criar_instalacao, deletar_respostas, matriz_conformidade
 
 urlpatterns = [
     path('salvar/', salvar_respostas, name='salvar_respostas'),
     path('obter/<str:numero_instalacao>/', obter_respostas, name='obter_respostas'),
     path('obter_todas/', obter_todas_respostas, name='obter_todas_respostas'),
+    path('conformidade/', matriz_conformidade, name='matriz_conformidade'),
     path('criar/', criar_instalacao, name='criar_instalacao'),
     path('deletar/<str:numero_instalacao>/', deletar_respostas, name='deletar_respostas'),  # Nova rota para DELETE
 ]
@@ -1,7 +1,9 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponseNotAllowed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import Resposta
+from .services import ConformidadeService, RespostaService
 import json
 import logging
 
@@ -29,27 +31,30 @@ def salvar_respostas(request):
                 logger.warning("Dados obrigatórios ausentes.")
                 return JsonResponse({'status': 'error', 'message': 'Dados obrigatórios ausentes'}, status=400)
 
-            # Deletar dados existentes antes de salvar novos (Chama a função diretamente)
-            deletar_respostas(request, numero_instalacao)
-
-            # Salvar ou atualizar cada resposta no banco de dados
-            for pergunta_id, resposta in respostas.items():
-                comentario = comentarios.get(pergunta_id, "")
-                Resposta.objects.update_or_create(
-                    numero_instalacao=numero_instalacao,
-                    pergunta_id=pergunta_id,
-                    defaults={
-                        "resposta": resposta,
-                        "comentario": comentario,
-                        "tecnico": tecnico
-                    }
-                )
-            logger.info(f"Respostas salvas ou atualizadas para a instalação {numero_instalacao}.")
-            return JsonResponse({'status': 'success', 'message': 'Respostas salvas ou atualizadas com sucesso!'})
+            if isinstance(numero_instalacao, bool) or not isinstance(numero_instalacao, (str, int)):
+                logger.warning("Número de instalação em formato inválido.")
+                return JsonResponse({'status': 'error', 'message': 'O número de instalação deve ser um texto ou um número'}, status=400)
+            numero_instalacao = str(numero_instalacao)
+
+            if not isinstance(respostas, dict) or not isinstance(comentarios, dict):
+                logger.warning("Respostas ou comentários em formato inválido.")
+                return JsonResponse({'status': 'error', 'message': 'Respostas e comentários devem ser objetos'}, status=400)
+
+            # Todas as respostas numa só transação; só mudam as que foram alteradas
+            resumo = RespostaService.salvar(numero_instalacao, tecnico, respostas, comentarios)
+            logger.info(f"Respostas salvas ou atualizadas para a instalação {numero_instalacao}: {resumo}.")
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Respostas salvas ou atualizadas com sucesso!',
+                **resumo,
+            })
 
         except json.JSONDecodeError:
             logger.error("Erro no formato JSON recebido.")
             return JsonResponse({'status': 'error', 'message': 'Formato JSON inválido'}, status=400)
+        except ValueError as e:
+            logger.warning(str(e))
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
         except Exception as e:
             logger.error(f"Erro interno ao salvar respostas: {str(e)}")
             return JsonResponse({'status': 'error', 'message': f'Erro interno: {str(e)}'}, status=500)
@@ -66,19 +71,12 @@ def obter_respostas(request, numero_instalacao):
     if request.method == 'GET':
         try:
             logger.info(f"Requisição para obter respostas da instalação {numero_instalacao}.")
-            respostas = Resposta.objects.filter(numero_instalacao=numero_instalacao)
+            data = RespostaService.da_instalacao(numero_instalacao)
 
-            if not respostas.exists():
+            if data is None:
                 logger.warning(f"Nenhuma resposta encontrada para a instalação {numero_instalacao}.")
                 return JsonResponse({'status': 'error', 'message': 'Nenhuma resposta encontrada'}, status=404)
 
-            # Construir resposta JSON
-            data = {
-                'respostas': {resposta.pergunta_id: resposta.resposta for resposta in respostas},
-                'comentarios': {resposta.pergunta_id: resposta.comentario for resposta in respostas},
-                'tecnico': respostas.first().tecnico,
-                'data_ultima_atualizacao': respostas.latest('data').data
-            }
             logger.info(f"Respostas obtidas com sucesso para a instalação {numero_instalacao}.")
             return JsonResponse({'status': 'success', 'data': data})
 
@@ -89,34 +87,57 @@ def obter_respostas(request, numero_instalacao):
     logger.warning("Método HTTP não permitido.")
     return HttpResponseNotAllowed(['GET'])
 
+def _linhas_ndjson(grupos):
+    for grupo in grupos:
+        yield json.dumps(grupo, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
 @csrf_exempt
 def obter_todas_respostas(request):
     """
     Endpoint para obter todas as respostas.
+
+    Por omissão devolve todas as respostas numa lista plana (``{'status', 'data': [...]}``).
+    Com ``?limite=`` ou ``?apos=`` devolve uma página de instalações, cada uma com as suas
+    respostas (``limite`` até 500), e o cursor ``proximo`` para pedir a seguinte com ``?apos=``.
+    Com ``?formato=ndjson`` envia todas as instalações em streaming, uma por linha.
     """
     if request.method == 'GET':
         try:
             logger.info("Requisição para obter todas as respostas.")
-            respostas = Resposta.objects.all()
 
-            if not respostas.exists():
+            if request.GET.get('formato') == 'ndjson':
+                return StreamingHttpResponse(
+                    _linhas_ndjson(RespostaService.todas()), content_type='application/x-ndjson; charset=utf-8'
+                )
+
+            if 'limite' not in request.GET and 'apos' not in request.GET:
+                data = RespostaService.listagem()
+                if not data:
+                    logger.warning("Nenhuma resposta encontrada.")
+                    return JsonResponse({'status': 'error', 'message': 'Nenhuma resposta encontrada'}, status=404)
+                logger.info("Todas as respostas foram obtidas com sucesso.")
+                return JsonResponse({'status': 'success', 'data': data})
+
+            apos = request.GET.get('apos')
+            try:
+                limite = int(request.GET.get('limite', RespostaService.LIMITE_INSTALACOES))
+            except ValueError:
+                limite = 0
+            if not 1 <= limite <= RespostaService.LIMITE_INSTALACOES_MAXIMO:
+                logger.warning("Limite de instalações inválido.")
+                return JsonResponse({
+                    'status': 'error',
+                    'message': f'O limite deve ser um inteiro entre 1 e {RespostaService.LIMITE_INSTALACOES_MAXIMO}'
+                }, status=400)
+
+            grupos, proximo = RespostaService.pagina(apos, limite)
+
+            if not grupos and apos is None:
                 logger.warning("Nenhuma resposta encontrada.")
                 return JsonResponse({'status': 'error', 'message': 'Nenhuma resposta encontrada'}, status=404)
 
-            # Construir resposta JSON
-            data = [
-                {
-                    'numero_instalacao': resposta.numero_instalacao,
-                    'pergunta_id': resposta.pergunta_id,
-                    'resposta': resposta.resposta,
-                    'comentario': resposta.comentario,
-                    'tecnico': resposta.tecnico,
-                    'data': resposta.data
-                }
-                for resposta in respostas
-            ]
-            logger.info("Todas as respostas foram obtidas com sucesso.")
-            return JsonResponse({'status': 'success', 'data': data})
+            logger.info("Página de respostas obtida com sucesso.")
+            return JsonResponse({'status': 'success', 'data': grupos, 'proximo': proximo})
 
         except Exception as e:
             logger.error(f"Erro interno ao obter todas as respostas: {str(e)}")
@@ -126,6 +147,29 @@ def obter_todas_respostas(request):
     return HttpResponseNotAllowed(['GET'])
 
 
+@csrf_exempt
+def matriz_conformidade(request):
+    """
+    Endpoint com a matriz de conformidade do checklist (contagens por instalação e por
+    técnico), calculada na base de dados e guardada em cache até à próxima gravação.
+    Filtros opcionais: ``?tecnico=`` e ``?pendentes=1``.
+    """
+    if request.method == 'GET':
+        try:
+            logger.info("Requisição para obter a matriz de conformidade.")
+            tecnico = request.GET.get('tecnico') or None
+            pendentes = request.GET.get('pendentes', '').lower() in ('1', 'true', 'sim')
+            data = ConformidadeService.obter(tecnico, pendentes)
+            return JsonResponse({'status': 'success', 'data': data})
+
+        except Exception as e:
+            logger.error(f"Erro interno ao obter a matriz de conformidade: {str(e)}")
+            return JsonResponse({'status': 'error', 'message': f'Erro interno: {str(e)}'}, status=500)
+
+    logger.warning("Método HTTP não permitido.")
+    return HttpResponseNotAllowed(['GET'])
+
+
 @csrf_exempt
 def criar_instalacao(request):
     """
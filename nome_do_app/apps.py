@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class NomeDoAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nome_do_app'
+
+    def ready(self):
+        # Versions the reference-data bundle (see referencia.py)
+        from . import signals  # noqa: F401
@@ -1,6 +1,34 @@
+import csv
+import time
+import unicodedata
+from itertools import islice
+
 import pandas as pd
-from django.core.management.base import BaseCommand
-from nome_do_app.models import CodigoEntrada  # Substitua pelo nome correto do modelo
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from openpyxl import load_workbook
+
+from nome_do_app import referencia
+from nome_do_app.models import AlteracaoReferencia, CodigoEntrada
+
+
+def _normalizar_cabecalho(nome):
+    """'Códigos da Porta ' -> 'codigos da porta' (sem acentos nem maiúsculas)."""
+    texto = unicodedata.normalize('NFKD', str(nome or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.lower().split())
+
+
+# Colunas do Excel -> campos do modelo
+COLUNAS = {
+    'localizacao': 'localizacao',
+    'instalacao': 'instalacao',
+    'codigos da porta': 'codigos_da_porta',
+    'codigo caves': 'codigo_caves',
+    'local de chaves': 'local_de_chaves',
+    'administracao': 'administracao',
+    'tipo de contrato': 'tipo_de_contrato',
+}
+OBRIGATORIOS = ('instalacao', 'localizacao')
 
 
 class Command(BaseCommand):
@@ -8,38 +36,173 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('excel_path', type=str, help="Path to the Excel file")
+        parser.add_argument('--sheet', help="Worksheet name (default: the active sheet)")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read and upserted per batch")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Run the whole import and roll it back at the end")
+        parser.add_argument('--error-report', help="Write every rejected row to this CSV file")
 
     def handle(self, *args, **kwargs):
         excel_path = kwargs['excel_path']
-        
         self.stdout.write(f"Starting the import process for: {excel_path}")
 
         try:
-            # Ler dados do arquivo Excel
-            self.stdout.write("Reading Excel file...")
-            data = pd.read_excel(excel_path)
-
-            self.stdout.write(f"Excel file read successfully! Total rows: {len(data)}")
-
-            for index, row in data.iterrows():
-                self.stdout.write(f"Processing row {index + 1}...")
-
-                # Mapear os campos do Excel para os campos do banco de dados
-                try:
-                    CodigoEntrada.objects.update_or_create(
-                        instalacao=row['Instalação'],  # Nome da coluna no Excel
-                        defaults={
-                            'localizacao': row['Localização'],
-                            'codigos_da_porta': row['Códigos da Porta'],
-                            'codigo_caves': row['Código Caves'],
-                        }
-                    )
-                    self.stdout.write(f"Row {index + 1} imported successfully!")
-                except Exception as e:
-                    self.stderr.write(f"Error importing row {index + 1}: {e}")
-
-            self.stdout.write(self.style.SUCCESS("Excel data imported successfully!"))
+            workbook = load_workbook(excel_path, read_only=True, data_only=True)
         except FileNotFoundError:
-            self.stderr.write(f"File not found: {excel_path}")
+            raise CommandError(f"File not found: {excel_path}")
         except Exception as e:
-            self.stderr.write(f"Error importing Excel data: {e}")
+            raise CommandError(f"Error reading Excel file: {e}")
+
+        try:
+            sheet = workbook[kwargs['sheet']] if kwargs['sheet'] else workbook.active
+            linhas = sheet.iter_rows(values_only=True)
+            colunas = self.mapear_colunas(next(linhas, ()))
+
+            self.vistas = set()
+            self.erros = []
+            resumo = {'created': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+            inicio = time.perf_counter()
+            processadas = 0
+
+            with transaction.atomic():
+                # Row 1 is the header, so the first data row is row 2 in Excel
+                primeira_linha = 2
+                while True:
+                    bloco = list(islice(linhas, kwargs['chunk_size']))
+                    if not bloco:
+                        break
+                    dados = self.normalizar(bloco, colunas, primeira_linha)
+                    dados = self.validar(dados)
+                    criados, atualizados, inalterados = self.gravar(dados, colunas)
+                    resumo['created'] += criados
+                    resumo['updated'] += atualizados
+                    resumo['unchanged'] += inalterados
+                    primeira_linha += len(bloco)
+                    processadas += len(bloco)
+                    decorrido = time.perf_counter() - inicio
+                    self.stdout.write(
+                        f"{processadas:,} rows processed ({processadas / decorrido:,.0f} rows/s)"
+                    )
+                if kwargs['dry_run']:
+                    transaction.set_rollback(True)
+        finally:
+            workbook.close()
+
+        resumo['rejected'] = len(self.erros)
+        self.relatorio(resumo, kwargs['error_report'], time.perf_counter() - inicio, kwargs['dry_run'])
+
+    def mapear_colunas(self, cabecalho):
+        """Índice de cada campo no cabeçalho; as colunas desconhecidas são ignoradas."""
+        colunas = {}
+        for indice, nome in enumerate(cabecalho):
+            campo = COLUNAS.get(_normalizar_cabecalho(nome))
+            if campo and campo not in colunas:
+                colunas[campo] = indice
+        faltam = [campo for campo in OBRIGATORIOS if campo not in colunas]
+        if faltam:
+            raise CommandError(f"Missing required columns: {', '.join(faltam)}")
+        ignoradas = [nome for nome in cabecalho if nome and not COLUNAS.get(_normalizar_cabecalho(nome))]
+        if ignoradas:
+            self.stdout.write(f"Ignoring unknown columns: {', '.join(map(str, ignoradas))}")
+        return colunas
+
+    def normalizar(self, bloco, colunas, primeira_linha):
+        """DataFrame com os campos do modelo em texto limpo (``None`` para células vazias)."""
+        bruto = pd.DataFrame.from_records(bloco)
+        dados = pd.DataFrame(index=bruto.index)
+        for campo, indice in colunas.items():
+            serie = bruto[indice] if indice in bruto else pd.Series(None, index=bruto.index, dtype=object)
+            # openpyxl gives ints for whole numbers, so codes like 1234 do not become '1234.0'
+            texto = serie.astype('string').str.strip()
+            dados[campo] = texto.mask(texto == '')
+        dados['linha'] = range(primeira_linha, primeira_linha + len(dados))
+        return dados.dropna(how='all', subset=list(colunas))
+
+    def validar(self, dados):
+        """Separa as linhas inválidas para o relatório e devolve as restantes."""
+        problemas = pd.Series('', index=dados.index)
+        for campo in OBRIGATORIOS:
+            problemas = problemas.mask(dados[campo].isna() & (problemas == ''), f"{campo} is empty")
+        for campo in COLUNAS.values():
+            if campo not in dados:
+                continue
+            max_length = CodigoEntrada._meta.get_field(campo).max_length
+            if max_length:
+                longo = dados[campo].str.len().gt(max_length).fillna(False)
+                problemas = problemas.mask(longo & (problemas == ''), f"{campo} longer than {max_length} characters")
+
+        # Repeated installations: the first occurrence in the file wins
+        repetida = dados['instalacao'].notna() & (
+            dados['instalacao'].duplicated() | dados['instalacao'].isin(self.vistas)
+        )
+        problemas = problemas.mask(repetida & (problemas == ''), "instalacao repeated in the file")
+
+        rejeitadas = dados[problemas != '']
+        for linha, instalacao, erro in zip(rejeitadas['linha'], rejeitadas['instalacao'], problemas[problemas != '']):
+            self.erros.append((linha, None if pd.isna(instalacao) else instalacao, erro))
+        validas = dados[problemas == '']
+        self.vistas.update(validas['instalacao'])
+        return validas
+
+    def gravar(self, dados, colunas):
+        """
+        Um único INSERT ... ON CONFLICT (instalacao) DO UPDATE por bloco, com as colunas
+        enviadas como arrays (unnest); só as colunas presentes no ficheiro são atualizadas.
+        Devolve (criados, atualizados, inalterados).
+        """
+        if dados.empty:
+            return 0, 0, 0
+        tabela = CodigoEntrada._meta.db_table
+        campos = list(colunas)
+        # Columns missing from the workbook get the model default on insert and are left alone on update
+        ausentes = {
+            campo: CodigoEntrada._meta.get_field(campo).get_default()
+            for campo in [*COLUNAS.values(), 'is_deleted'] if campo not in colunas
+        }
+        atualizar = [campo for campo in campos if campo != 'instalacao']
+        sql = (
+            f'INSERT INTO {tabela} ({", ".join([*campos, *ausentes])}) '
+            f'SELECT {", ".join(f"u.{campo}" for campo in campos)}'
+            f'{"".join(", %s" for _ in ausentes)} '
+            f'FROM unnest({", ".join("%s::text[]" for _ in campos)}) AS u({", ".join(campos)}) '
+            f'ON CONFLICT (instalacao) DO UPDATE SET '
+            f'{", ".join(f"{campo} = EXCLUDED.{campo}" for campo in atualizar)} '
+            # Identical rows are neither rewritten nor returned
+            f'WHERE ({", ".join(f"{tabela}.{campo}" for campo in atualizar)}) IS DISTINCT FROM '
+            f'({", ".join(f"EXCLUDED.{campo}" for campo in atualizar)}) '
+            # xmax = 0 only for freshly inserted rows
+            f'RETURNING id, (xmax = 0)'
+        )
+        arrays = [
+            dados[campo].astype(object).where(dados[campo].notna(), None).tolist()
+            for campo in campos
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*ausentes.values(), *arrays])
+            gravados = cursor.fetchall()
+        referencia.registar(AlteracaoReferencia.CODIGOS, [pk for pk, _ in gravados])
+        criados = sum(inserido for _, inserido in gravados)
+        return criados, len(gravados) - criados, len(dados) - len(gravados)
+
+    def relatorio(self, resumo, caminho, duracao, dry_run):
+        if self.erros:
+            self.stderr.write(f"{len(self.erros):,} rows rejected:")
+            for linha, instalacao, erro in self.erros[:20]:
+                self.stderr.write(f"  row {linha}: {erro}" + (f" ({instalacao})" if instalacao else ''))
+            if len(self.erros) > 20:
+                self.stderr.write(f"  ... and {len(self.erros) - 20:,} more")
+            if caminho:
+                with open(caminho, 'w', newline='', encoding='utf-8') as ficheiro:
+                    writer = csv.writer(ficheiro)
+                    writer.writerow(['row', 'instalacao', 'error'])
+                    writer.writerows(self.erros)
+                self.stderr.write(f"Error report written to {caminho}")
+
+        mensagem = (
+            f"{resumo['created']:,} created, {resumo['updated']:,} updated, "
+            f"{resumo['unchanged']:,} unchanged, {resumo['rejected']:,} rejected in {duracao:.1f}s"
+        )
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"Dry run, nothing was saved: {mensagem}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Excel data imported successfully! {mensagem}"))
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:43
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+import nome_do_app.models
+
+
+# unaccent() is only STABLE (its dictionary can change), so it cannot appear in an index.
+# The wrapper pins the dictionary and is declared IMMUTABLE.
+F_UNACCENT = """
+CREATE OR REPLACE FUNCTION public.f_unaccent(text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nome_do_app', '0004_codigoentrada_is_deleted'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunSQL(F_UNACCENT, reverse_sql='DROP FUNCTION IF EXISTS public.f_unaccent(text);'),
+        migrations.AddIndex(
+            model_name='codigoentrada',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(nome_do_app.models.FUnaccent('localizacao')), name='gin_trgm_ops'), condition=models.Q(('is_deleted', False)), name='codigo_localizacao_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codigoentrada',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(nome_do_app.models.FUnaccent('instalacao')), name='gin_trgm_ops'), condition=models.Q(('is_deleted', False)), name='codigo_instalacao_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codigoentrada',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(nome_do_app.models.FUnaccent('localizacao')), name='text_pattern_ops'), condition=models.Q(('is_deleted', False)), name='codigo_localizacao_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codigoentrada',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(nome_do_app.models.FUnaccent('instalacao')), name='text_pattern_ops'), condition=models.Q(('is_deleted', False)), name='codigo_instalacao_prefix_idx'),
+        ),
+    ]
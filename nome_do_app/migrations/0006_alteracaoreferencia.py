@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nome_do_app', '0005_codigoentrada_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoReferencia',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tabela', models.CharField(choices=[('codigos', 'Códigos de entrada'), ('materiais', 'Materiais'), ('tarifas', 'Tarifas')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -6,9 +6,28 @@ Descrição:
     - instalacao: campo textual, mas com unique=True.
     - codigos_da_porta: texto (separado por vírgula).
     - codigo_caves: campo textual adicional.
+    - Pesquisa: índices trigram/prefixo sobre lower(f_unaccent(...)) das linhas não excluídas.
+Modelo 'AlteracaoReferencia': registo de alterações que versiona o pacote de dados de
+referência (ver referencia.py).
 """
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Lower
+
+
+class FUnaccent(models.Func):
+    """
+    ``f_unaccent(texto)``: wrapper IMMUTABLE de ``unaccent`` criado na migração 0005,
+    para poder ser usado em índices ('Conceição' -> 'Conceicao').
+    """
+    function = 'f_unaccent'
+    output_field = models.TextField()
+
+
+def chave_pesquisa(expressao):
+    """Forma normalizada usada na pesquisa e nos índices: minúsculas e sem acentos."""
+    return Lower(FUnaccent(expressao))
 
 
 class CodigoEntrada(models.Model):
@@ -66,3 +85,39 @@ class CodigoEntrada(models.Model):
 
     class Meta:
         ordering = ['localizacao']  # Ordena listagens pelo campo 'localizacao'
+        indexes = [
+            # Typeahead: substring/fuzzy matches (trigram) and short prefixes (pattern ops),
+            # only over the rows that are listed
+            GinIndex(OpClass(chave_pesquisa('localizacao'), name='gin_trgm_ops'),
+                     name='codigo_localizacao_trgm_idx', condition=models.Q(is_deleted=False)),
+            GinIndex(OpClass(chave_pesquisa('instalacao'), name='gin_trgm_ops'),
+                     name='codigo_instalacao_trgm_idx', condition=models.Q(is_deleted=False)),
+            models.Index(OpClass(chave_pesquisa('localizacao'), name='text_pattern_ops'),
+                         name='codigo_localizacao_prefix_idx', condition=models.Q(is_deleted=False)),
+            models.Index(OpClass(chave_pesquisa('instalacao'), name='text_pattern_ops'),
+                         name='codigo_instalacao_prefix_idx', condition=models.Q(is_deleted=False)),
+        ]
+
+
+class AlteracaoReferencia(models.Model):
+    """
+    Uma linha por objeto de referência criado, alterado ou removido. O maior ``id`` é a
+    versão atual do pacote de referência; um cliente na versão N recebe os objetos com
+    alterações de id > N.
+    """
+    CODIGOS = 'codigos'
+    MATERIAIS = 'materiais'
+    TARIFAS = 'tarifas'
+    TABELAS = [
+        (CODIGOS, 'Códigos de entrada'),
+        (MATERIAIS, 'Materiais'),
+        (TARIFAS, 'Tarifas'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tabela = models.CharField(max_length=20, choices=TABELAS)
+    objeto_id = models.BigIntegerField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"v{self.id}: {self.tabela} {self.objeto_id}"
@@ -0,0 +1,214 @@
+"""
+Pacote de dados de referência para os clientes offline (telemóveis no terreno).
+
+Junta numa só resposta os códigos de entrada ativos, os materiais, as tarifas e os tipos
+de documento dos Registros de Entrega. A versão do pacote é o maior id de
+``AlteracaoReferencia``; cada gravação/remoção nessas tabelas acrescenta uma linha
+(sinais em ``signals.py`` e chamadas explícitas nas operações em massa).
+
+- O pacote completo de cada versão é gerado uma vez e guardado em disco já comprimido
+  (gzip e, se o módulo ``brotli`` estiver instalado, br) em ``REFERENCIA_CACHE_DIR``.
+- ``?desde=<versao>`` devolve só os objetos alterados depois dessa versão e os ids removidos.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from avarias_a_receber.models import Material, RatesConfiguration
+from Registros_de_Entregas.models import RegistroEntrega
+
+from .models import AlteracaoReferencia, CodigoEntrada
+
+# Incrementar quando a estrutura do pacote mudar (invalida ETags e ficheiros em cache)
+FORMATO = 1
+# Chave do pg_advisory_xact_lock que ordena as escritas no registo de alterações
+LOCK_ALTERACOES = 72_617_001
+# Acima disto um delta deixa de compensar e é enviado o pacote completo
+MAXIMO_DELTA = 5000
+
+# tabela -> (queryset das linhas incluídas, campos enviados)
+TABELAS = {
+    AlteracaoReferencia.CODIGOS: (
+        lambda: CodigoEntrada.objects.filter(is_deleted=False),
+        ('id', 'localizacao', 'instalacao', 'codigos_da_porta', 'codigo_caves',
+         'local_de_chaves', 'administracao', 'tipo_de_contrato'),
+    ),
+    AlteracaoReferencia.MATERIAIS: (
+        lambda: Material.objects.all(),
+        ('id', 'codigo', 'descricao'),
+    ),
+    AlteracaoReferencia.TARIFAS: (
+        lambda: RatesConfiguration.objects.all(),
+        ('id', 'standard_rate', 'stop_rate', 'after_11pm_surcharge', 'current_user'),
+    ),
+}
+
+CODIFICACOES = {
+    'br': lambda dados: brotli.compress(dados, quality=11),
+    'gzip': lambda dados: gzip.compress(dados, compresslevel=9, mtime=0),
+}
+EXTENSOES = {None: '', 'gzip': '.gz', 'br': '.br'}
+
+
+def registar(tabela, ids):
+    """Acrescenta ao registo de alterações os objetos ``ids`` de ``tabela``."""
+    ids = list(ids)
+    if not ids:
+        return
+    with transaction.atomic(savepoint=False):
+        with connection.cursor() as cursor:
+            # Ids are handed out and committed in order, so a client at version N never
+            # misses a change numbered below N that was still uncommitted when it synced
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK_ALTERACOES])
+        AlteracaoReferencia.objects.bulk_create(
+            [AlteracaoReferencia(tabela=tabela, objeto_id=objeto_id) for objeto_id in ids]
+        )
+
+
+def versao_atual():
+    return AlteracaoReferencia.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def tipos_documento():
+    return [{'valor': valor, 'rotulo': rotulo} for valor, rotulo in RegistroEntrega.TIPO_DOCUMENTO_CHOICES]
+
+
+def _esquema():
+    """Muda com o formato do pacote ou com os tipos de documento (que só mudam com o código)."""
+    texto = json.dumps([FORMATO, tipos_documento()], sort_keys=True)
+    return hashlib.sha256(texto.encode()).hexdigest()[:12]
+
+
+def etag(versao):
+    return f'"{_esquema()}-{versao}"'
+
+
+def _linhas(tabela, ids=None):
+    queryset, campos = TABELAS[tabela]
+    queryset = queryset()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    return list(queryset.order_by('id').values(*campos))
+
+
+def serializar(dados):
+    return json.dumps(dados, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def pacote_completo(versao):
+    dados = {'formato': FORMATO, 'tipo': 'completo', 'versao': versao, 'tipos_documento': tipos_documento()}
+    for tabela in TABELAS:
+        dados[tabela] = _linhas(tabela)
+    return dados
+
+
+def delta(desde, versao):
+    """
+    Objetos alterados nas versões ``desde`` < v <= ``versao`` e ids removidos, ou ``None``
+    quando há demasiadas alterações e o pacote completo sai mais barato.
+    """
+    alteracoes = (
+        AlteracaoReferencia.objects.filter(id__gt=desde, id__lte=versao)
+        .order_by().values_list('tabela', 'objeto_id').distinct()
+    )
+    por_tabela = defaultdict(set)
+    for numero, (tabela, objeto_id) in enumerate(alteracoes.iterator(), start=1):
+        if numero > MAXIMO_DELTA:
+            return None
+        por_tabela[tabela].add(objeto_id)
+
+    dados = {
+        'formato': FORMATO, 'tipo': 'delta', 'versao': versao, 'desde': desde,
+        'tipos_documento': tipos_documento(), 'removidos': {},
+    }
+    for tabela in TABELAS:
+        ids = por_tabela.get(tabela, set())
+        linhas = _linhas(tabela, ids) if ids else []
+        dados[tabela] = linhas
+        # Deleted, or no longer part of the bundle (soft-deleted installations)
+        dados['removidos'][tabela] = sorted(ids - {linha['id'] for linha in linhas})
+    return dados
+
+
+def codificacao_aceite(accept_encoding):
+    """'br' ou 'gzip' conforme o cabeçalho Accept-Encoding (preferindo br), ou ``None``."""
+    pesos = {}
+    for parte in accept_encoding.split(','):
+        nome, _, parametros = parte.partition(';')
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                peso = 0.0
+        pesos[nome.strip().lower()] = peso
+    for codificacao in ('br', 'gzip'):
+        if codificacao == 'br' and brotli is None:
+            continue
+        if pesos.get(codificacao, pesos.get('*', 0)) > 0:
+            return codificacao
+    return None
+
+
+def comprimir(dados, codificacao):
+    return CODIFICACOES[codificacao](dados) if codificacao else dados
+
+
+def _gravar(caminho, conteudo):
+    """Escrita atómica: outros workers nunca leem um ficheiro a meio."""
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix='.tmp-')
+    with os.fdopen(descritor, 'wb') as ficheiro:
+        ficheiro.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def _gerar_completo(versao, base):
+    """Gera o JSON da ``versao`` e todas as versões comprimidas; apaga os pacotes anteriores."""
+    diretorio = os.path.dirname(base)
+    os.makedirs(diretorio, exist_ok=True)
+    conteudo = serializar(pacote_completo(versao))
+    for codificacao, extensao in EXTENSOES.items():
+        if codificacao == 'br' and brotli is None:
+            continue
+        _gravar(base + extensao, comprimir(conteudo, codificacao))
+
+    atuais = {os.path.basename(base) + extensao for extensao in EXTENSOES.values()}
+    for nome in os.listdir(diretorio):
+        if nome.startswith('pacote-') and nome not in atuais:
+            try:
+                os.remove(os.path.join(diretorio, nome))
+            except FileNotFoundError:
+                pass  # Removed by another worker
+
+
+def abrir_completo(versao, codificacao):
+    """
+    Ficheiro (aberto em binário) com o pacote completo da ``versao`` na ``codificacao``
+    pedida, gerado na primeira vez que é pedido.
+    """
+    base = os.path.join(settings.REFERENCIA_CACHE_DIR, f'pacote-{_esquema()}-{versao}.json')
+    caminho = base + EXTENSOES[codificacao]
+    try:
+        return open(caminho, 'rb')
+    except FileNotFoundError:
+        pass
+    _gerar_completo(versao, base)
+    try:
+        return open(caminho, 'rb')
+    except FileNotFoundError:
+        # Another worker on a newer version cleaned it up in between: serve it from memory
+        return io.BytesIO(comprimir(serializar(pacote_completo(versao)), codificacao))
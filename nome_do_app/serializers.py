@@ -1,3 +1,5 @@
+from collections import Counter
+
 from rest_framework import serializers
 from .models import CodigoEntrada
 
@@ -5,3 +7,23 @@ class CodigoEntradaSerializer(serializers.ModelSerializer):
     class Meta:
         model = CodigoEntrada
         fields = '__all__'
+
+
+class CodigoEntradaSyncListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        repetidas = sorted(instalacao for instalacao, n in Counter(item['instalacao'] for item in attrs).items() if n > 1)
+        if repetidas:
+            raise serializers.ValidationError({'instalacao': [f"Instalações repetidas: {', '.join(repetidas)}"]})
+        return attrs
+
+
+class CodigoEntradaSyncSerializer(serializers.ModelSerializer):
+    """
+    Valida as linhas enviadas para /sync. A unicidade de 'instalacao' não é verificada por
+    linha: uma instalação já existente é atualizada (ou reativada) em vez de rejeitada.
+    """
+    class Meta:
+        model = CodigoEntrada
+        exclude = ['id', 'is_deleted']
+        extra_kwargs = {'instalacao': {'validators': []}}
+        list_serializer_class = CodigoEntradaSyncListSerializer
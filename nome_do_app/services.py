@@ -0,0 +1,169 @@
+"""
+Arquivo: services.py
+Descrição:
+    Lógica de sincronização da tabela 'CodigoEntrada' com a lista enviada pelo frontend
+    e pesquisa rápida (typeahead) por localização/instalação.
+"""
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Greatest
+
+from . import referencia
+from .models import AlteracaoReferencia, CodigoEntrada, chave_pesquisa
+
+
+class CodigoEntradaService:
+    """Operações em bloco sobre CodigoEntrada."""
+
+    # Campos comparados e gravados na sincronização (a chave é 'instalacao')
+    CAMPOS = (
+        'localizacao', 'codigos_da_porta', 'codigo_caves', 'local_de_chaves',
+        'administracao', 'tipo_de_contrato',
+    )
+    LOTE = 1000
+
+    @staticmethod
+    def valores_desejados(item):
+        """Valores finais de uma linha enviada; campos ausentes ficam com o default do modelo."""
+        return tuple(
+            item[campo] if campo in item else CodigoEntrada._meta.get_field(campo).get_default()
+            for campo in CodigoEntradaService.CAMPOS
+        )
+
+    @staticmethod
+    def sincronizar(itens):
+        """
+        Deixa ativas exatamente as instalações de ``itens`` (dados já validados).
+
+        Compara com o estado atual e só escreve as diferenças: um INSERT ... ON CONFLICT
+        (instalacao) para as linhas novas, alteradas ou reativadas, e um UPDATE para marcar
+        como excluídas as que deixaram de vir. Tudo numa transação, com a tabela bloqueada
+        contra sincronizações concorrentes.
+
+        Retorna ``{'inserted', 'updated', 'revived', 'deleted', 'unchanged'}``.
+        """
+        desejados = {item['instalacao']: CodigoEntradaService.valores_desejados(item) for item in itens}
+        resumo = {'inserted': 0, 'updated': 0, 'revived': 0, 'deleted': 0, 'unchanged': 0}
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Bloqueia outras escritas (e outra sincronização) até ao fim da transação
+                cursor.execute(f'LOCK TABLE {CodigoEntrada._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+
+            atuais = {
+                instalacao: (pk, tuple(valores), is_deleted)
+                for pk, instalacao, is_deleted, *valores in CodigoEntrada.objects.order_by().values_list(
+                    'pk', 'instalacao', 'is_deleted', *CodigoEntradaService.CAMPOS
+                )
+            }
+
+            escrever = []
+            for instalacao, valores in desejados.items():
+                atual = atuais.get(instalacao)
+                if atual is None:
+                    resumo['inserted'] += 1
+                elif atual[2]:
+                    resumo['revived'] += 1
+                elif atual[1] != valores:
+                    resumo['updated'] += 1
+                else:
+                    resumo['unchanged'] += 1
+                    continue
+                escrever.append(CodigoEntrada(
+                    instalacao=instalacao,
+                    is_deleted=False,
+                    **dict(zip(CodigoEntradaService.CAMPOS, valores)),
+                ))
+
+            if escrever:
+                CodigoEntrada.objects.bulk_create(
+                    escrever,
+                    batch_size=CodigoEntradaService.LOTE,
+                    update_conflicts=True,
+                    unique_fields=['instalacao'],
+                    update_fields=[*CodigoEntradaService.CAMPOS, 'is_deleted'],
+                )
+
+            eliminar = [
+                pk for instalacao, (pk, _, is_deleted) in atuais.items()
+                if not is_deleted and instalacao not in desejados
+            ]
+            if eliminar:
+                resumo['deleted'] = CodigoEntrada.objects.filter(pk__in=eliminar).update(is_deleted=True)
+
+            # Neither bulk_create nor update() send signals (and bulk_create returns no ids on conflict)
+            alterados = list(eliminar)
+            if escrever:
+                alterados += CodigoEntrada.objects.filter(
+                    instalacao__in=[codigo.instalacao for codigo in escrever]
+                ).values_list('pk', flat=True)
+            referencia.registar(AlteracaoReferencia.CODIGOS, alterados)
+
+        return resumo
+
+    # Pesquisa (typeahead)
+    CAMPOS_PESQUISA = (
+        'id', 'instalacao', 'localizacao', 'codigos_da_porta', 'codigo_caves', 'local_de_chaves',
+    )
+    LIMITE_PESQUISA = 10
+    LIMITE_PESQUISA_MAXIMO = 50
+    # Abaixo de 3 caracteres não há trigramas: só se procura por prefixo
+    MINIMO_TRIGRAMA = 3
+    # Linhas com a palavra algures que entram na ordenação (termos genéricos como 'rua' apanham quase tudo)
+    CANDIDATOS_PESQUISA = 200
+
+    @staticmethod
+    def pesquisar(termo, limite=LIMITE_PESQUISA):
+        """
+        Melhores ``limite`` instalações ativas para ``termo``, sem distinguir acentos nem maiúsculas.
+
+        Cada palavra tem de aparecer na localização ou na instalação. Ordenação: instalação
+        igual ao termo, instalação que começa pelo termo, localização que começa pelo termo e
+        depois as restantes por semelhança (trigramas). Devolve dicionários com ``CAMPOS_PESQUISA``.
+
+        Só são ordenados os candidatos lidos pelos índices: ``limite`` por prefixo de instalação,
+        ``limite`` por prefixo de localização e até ``CANDIDATOS_PESQUISA`` com as palavras algures.
+        """
+        palavras = termo.split()
+        if not palavras:
+            return []
+        curto = all(len(palavra) < CodigoEntradaService.MINIMO_TRIGRAMA for palavra in palavras)
+
+        ativos = CodigoEntrada.objects.filter(is_deleted=False).alias(
+            loc=chave_pesquisa('localizacao'),
+            inst=chave_pesquisa('instalacao'),
+        )
+        frase = chave_pesquisa(Value(' '.join(palavras)))
+        # Without order_by() the default ordering would sort every match before the LIMIT
+        partes = [
+            ativos.filter(inst=frase).order_by().values('pk'),
+            ativos.filter(inst__startswith=frase).order_by().values('pk')[:limite],
+            ativos.filter(loc__startswith=frase).order_by().values('pk')[:limite],
+        ]
+        if not curto:
+            # Substring matches on the trigram indexes; short words only narrow the result
+            com_palavras = ativos
+            for palavra in palavras:
+                valor = chave_pesquisa(Value(palavra))
+                com_palavras = com_palavras.filter(Q(loc__contains=valor) | Q(inst__contains=valor))
+            partes.append(com_palavras.order_by().values('pk')[:CodigoEntradaService.CANDIDATOS_PESQUISA])
+        # Fetched first so the ranking query reads only these rows, by primary key
+        candidatos = list(partes[0].union(*partes[1:]).values_list('pk', flat=True))
+        if not candidatos:
+            return []
+
+        return list(
+            ativos.filter(pk__in=candidatos).alias(
+                prioridade=Case(
+                    When(inst=frase, then=Value(0)),
+                    When(inst__startswith=frase, then=Value(1)),
+                    When(loc__startswith=frase, then=Value(2)),
+                    default=Value(3),
+                ),
+                semelhanca=Greatest(TrigramSimilarity('loc', frase), TrigramSimilarity('inst', frase)),
+            )
+            .order_by('prioridade', '-semelhanca', 'localizacao', 'instalacao')
+            .values(*CodigoEntradaService.CAMPOS_PESQUISA)[:limite]
+        )
@@ -0,0 +1,28 @@
+"""
+Sinais que registam em AlteracaoReferencia cada gravação/remoção dos dados de referência.
+Operações em massa (``bulk_create``, ``update()``, SQL direto) não disparam sinais e
+chamam ``referencia.registar`` explicitamente.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from avarias_a_receber.models import Material, RatesConfiguration
+
+from . import referencia
+from .models import AlteracaoReferencia, CodigoEntrada
+
+TABELA_POR_MODELO = {
+    CodigoEntrada: AlteracaoReferencia.CODIGOS,
+    Material: AlteracaoReferencia.MATERIAIS,
+    RatesConfiguration: AlteracaoReferencia.TARIFAS,
+}
+
+
+def registar_alteracao(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    referencia.registar(TABELA_POR_MODELO[sender], [instance.pk])
+
+
+for modelo in TABELA_POR_MODELO:
+    post_save.connect(registar_alteracao, sender=modelo, dispatch_uid=f'referencia_save_{modelo.__name__}')
+    post_delete.connect(registar_alteracao, sender=modelo, dispatch_uid=f'referencia_delete_{modelo.__name__}')
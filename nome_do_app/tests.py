@@ -1,5 +1,25 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from openpyxl import Workbook
+from rest_framework.test import APIClient
+
+from backend.testing import TempDirSettingMixin
+from avarias_a_receber.models import Material, RatesConfiguration
+from Registros_de_Entregas.models import RegistroEntrega
+
+from . import referencia
+from .models import AlteracaoReferencia, CodigoEntrada
 
 # Create your tests here.
 
@@ -7,3 +27,238 @@ class HomeViewTests(TestCase):
     def test_home_view_status_code(self):
         response = self.client.get(reverse('home'))
         self.assertEqual(response.status_code, 200)
+
+
+class CodigoEntradaSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('nome_do_app:codigoentrada-sync')
+        CodigoEntrada.objects.create(localizacao='Rua A', instalacao='I1', codigos_da_porta='1234')
+        CodigoEntrada.objects.create(localizacao='Rua B', instalacao='I2', codigos_da_porta='5678')
+        CodigoEntrada.objects.create(localizacao='Rua C', instalacao='I3', is_deleted=True)
+        CodigoEntrada.objects.create(localizacao='Rua D', instalacao='I4')
+
+    def test_sync_applies_diff(self):
+        payload = [
+            {'localizacao': 'Rua A', 'instalacao': 'I1', 'codigos_da_porta': '1234'},
+            {'localizacao': 'Rua B', 'instalacao': 'I2', 'codigos_da_porta': '0000'},
+            {'localizacao': 'Rua C', 'instalacao': 'I3'},
+            {'localizacao': 'Rua E', 'instalacao': 'I5', 'codigo_caves': '99'},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'inserted': 1, 'updated': 1, 'revived': 1, 'deleted': 1, 'unchanged': 1})
+
+        ativos = dict(CodigoEntrada.objects.filter(is_deleted=False).values_list('instalacao', 'codigos_da_porta'))
+        self.assertEqual(ativos, {'I1': '1234', 'I2': '0000', 'I3': None, 'I5': None})
+        self.assertTrue(CodigoEntrada.objects.get(instalacao='I4').is_deleted)
+        self.assertEqual(CodigoEntrada.objects.count(), 5)
+
+        # A second identical sync writes nothing
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.data['unchanged'], 4)
+        self.assertFalse(any(q['sql'].startswith(('INSERT', 'UPDATE')) for q in queries.captured_queries))
+
+    def test_sync_statement_count_does_not_grow_with_rows(self):
+        payload = [{'localizacao': f'Rua {i}', 'instalacao': f'N{i}'} for i in range(300)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.data['inserted'], 300)
+        self.assertEqual(response.data['deleted'], 3)
+        # savepoint, lock, read, upsert, soft-delete, ids + lock + insert for the change log, release
+        self.assertLessEqual(len(queries.captured_queries), 10)
+
+    def test_sync_rejects_invalid_payload_without_changes(self):
+        payload = [
+            {'localizacao': 'Rua A', 'instalacao': 'I9'},
+            {'localizacao': 'Rua B', 'instalacao': 'I9'},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, [{'instalacao': 'I9'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CodigoEntrada.objects.filter(is_deleted=False).count(), 3)
+
+
+class ImportExcelCommandTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.tmpdir, 'codigos.xlsx')
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Localização', 'Instalação ', 'Códigos da Porta', 'Código Caves', 'Administração', 'Observações'])
+        sheet.append(['Rua A', 'I1', 1234, None, 'Adm 1', 'x'])
+        sheet.append(['Rua B', 'I2', '0042', 'C2', None, None])
+        sheet.append([None, None, None, None, None, None])
+        sheet.append([None, 'I3', 1, None, None, None])
+        sheet.append(['Rua A bis', 'I1', 9, None, None, None])
+        sheet.append(['Rua D', 'I4', None, None, None, None])
+        workbook.save(self.caminho)
+        CodigoEntrada.objects.create(localizacao='Antiga', instalacao='I2', local_de_chaves='Portaria', is_deleted=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def importar(self, **kwargs):
+        out, err = StringIO(), StringIO()
+        call_command('import_excel', self.caminho, chunk_size=2, stdout=out, stderr=err, **kwargs)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_upserts_in_chunks_and_reports_errors(self):
+        relatorio = os.path.join(self.tmpdir, 'erros.csv')
+        out, err = self.importar(error_report=relatorio)
+        self.assertIn('2 created, 1 updated, 0 unchanged, 2 rejected', out)
+        self.assertIn('Ignoring unknown columns: Observações', out)
+        self.assertIn('row 5: localizacao is empty (I3)', err)
+        self.assertIn('row 6: instalacao repeated in the file (I1)', err)
+        with open(relatorio, newline='', encoding='utf-8') as ficheiro:
+            self.assertEqual(len(list(csv.reader(ficheiro))), 3)
+
+        i1 = CodigoEntrada.objects.get(instalacao='I1')
+        self.assertEqual((i1.localizacao, i1.codigos_da_porta, i1.administracao), ('Rua A', '1234', 'Adm 1'))
+        self.assertIsNone(i1.local_de_chaves)
+        self.assertFalse(i1.is_deleted)
+        # Columns absent from the workbook keep their current value
+        i2 = CodigoEntrada.objects.get(instalacao='I2')
+        self.assertEqual((i2.codigos_da_porta, i2.codigo_caves, i2.local_de_chaves), ('0042', 'C2', 'Portaria'))
+        self.assertIsNone(i2.administracao)
+        self.assertEqual(CodigoEntrada.objects.get(instalacao='I4').tipo_de_contrato, '')
+        self.assertFalse(CodigoEntrada.objects.filter(instalacao='I3').exists())
+
+        out, _ = self.importar()
+        self.assertIn('0 created, 0 updated, 3 unchanged', out)
+
+    def test_dry_run_saves_nothing(self):
+        out, _ = self.importar(dry_run=True)
+        self.assertIn('Dry run, nothing was saved: 2 created, 1 updated', out)
+        self.assertEqual(list(CodigoEntrada.objects.values_list('instalacao', 'localizacao')), [('I2', 'Antiga')])
+
+
+class CodigoEntradaSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('nome_do_app:codigoentrada-search')
+        CodigoEntrada.objects.create(localizacao='Rua da Conceição 21', instalacao='L-100', codigos_da_porta='1234')
+        CodigoEntrada.objects.create(localizacao='Avenida João XXI 5', instalacao='L-1001')
+        CodigoEntrada.objects.create(localizacao='Praça do Comércio', instalacao='CONC-7')
+        CodigoEntrada.objects.create(localizacao='Rua da Conceição 40', instalacao='X-9', is_deleted=True)
+
+    def pesquisar(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['instalacao'] for item in response.data]
+
+    def test_search_is_accent_and_case_insensitive(self):
+        self.assertEqual(self.pesquisar('CONCEICAO'), ['L-100'])
+        self.assertEqual(self.pesquisar('joão xxi'), ['L-1001'])
+        self.assertEqual(self.pesquisar('comercio'), ['CONC-7'])
+
+    def test_search_ranks_installation_matches_first(self):
+        self.assertEqual(self.pesquisar('l-100'), ['L-100', 'L-1001'])
+        # Prefix of the installation beats a match inside the location
+        self.assertEqual(self.pesquisar('conc'), ['CONC-7', 'L-100'])
+
+    def test_short_terms_match_prefixes_only(self):
+        self.assertEqual(self.pesquisar('ru'), ['L-100'])
+        self.assertEqual(self.pesquisar('21'), [])
+
+    def test_search_response_is_small_and_limited(self):
+        response = self.client.get(self.url, {'q': 'l-', 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(
+            set(response.data[0]),
+            {'id', 'instalacao', 'localizacao', 'codigos_da_porta', 'codigo_caves', 'local_de_chaves'},
+        )
+        self.assertEqual(self.pesquisar(''), [])
+        self.assertEqual(self.client.get(self.url, {'q': 'x', 'limit': 'abc'}).status_code, 400)
+
+    def test_search_uses_partial_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.pesquisar('conceicao')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + queries.captured_queries[0]['sql'])
+            plano = '\n'.join(linha for linha, in cursor.fetchall())
+        # The tables are tiny here, so only check that every branch can be served by the search indexes
+        self.assertNotIn('Seq Scan', plano)
+        self.assertIn('codigo_instalacao_prefix_idx', plano)
+
+
+class PacoteReferenciaTests(TempDirSettingMixin, TestCase):
+    temp_dir_setting = 'REFERENCIA_CACHE_DIR'
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('pacote-referencia')
+        self.codigo = CodigoEntrada.objects.create(localizacao='Rua A', instalacao='I1', codigos_da_porta='1234')
+        CodigoEntrada.objects.create(localizacao='Rua B', instalacao='I2', is_deleted=True)
+        self.material = Material.objects.create(codigo='M1', descricao='Cabo')
+        RatesConfiguration.objects.create(current_user='tecnico')
+
+    def obter(self, **kwargs):
+        response = self.client.get(self.url, kwargs.pop('params', {}), **kwargs)
+        if response.status_code != 200:
+            return response, None
+        conteudo = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.get('Content-Encoding') == 'gzip':
+            conteudo = gzip.decompress(conteudo)
+        return response, json.loads(conteudo)
+
+    def test_full_bundle(self):
+        response, dados = self.obter()
+        self.assertEqual(dados['tipo'], 'completo')
+        self.assertEqual(dados['versao'], referencia.versao_atual())
+        self.assertEqual([codigo['instalacao'] for codigo in dados['codigos']], ['I1'])
+        self.assertEqual(dados['materiais'], [{'id': self.material.pk, 'codigo': 'M1', 'descricao': 'Cabo'}])
+        self.assertEqual(dados['tarifas'][0]['standard_rate'], '12.00')
+        self.assertEqual(len(dados['tipos_documento']), len(RegistroEntrega.TIPO_DOCUMENTO_CHOICES))
+        self.assertEqual(response['ETag'], referencia.etag(dados['versao']))
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_gzip_bundle_is_cached_on_disk(self):
+        _, simples = self.obter()
+        response, dados = self.obter(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(dados, simples)
+        ficheiros = sorted(os.listdir(self.tmpdir))
+        self.assertTrue(any(nome.endswith('.json.gz') for nome in ficheiros))
+
+        # A new version replaces the cached files
+        Material.objects.create(codigo='M2', descricao='Botão')
+        self.obter(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(set(os.listdir(self.tmpdir)).isdisjoint(ficheiros))
+
+    def test_current_version_gets_304(self):
+        response, dados = self.obter()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'desde': dados['versao']}).status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'desde': 'x'}).status_code, 400)
+
+    def test_stale_version_gets_delta(self):
+        _, dados = self.obter()
+        versao = dados['versao']
+        self.material.descricao = 'Cabo 2m'
+        self.material.save()
+        self.codigo.is_deleted = True
+        self.codigo.save()
+
+        response, delta = self.obter(params={'desde': versao})
+        self.assertEqual(delta['tipo'], 'delta')
+        self.assertEqual(delta['desde'], versao)
+        self.assertEqual(delta['materiais'][0]['descricao'], 'Cabo 2m')
+        self.assertEqual(delta['codigos'], [])
+        self.assertEqual(delta['removidos'], {'codigos': [self.codigo.pk], 'materiais': [], 'tarifas': []})
+        self.assertEqual(response['ETag'], referencia.etag(delta['versao']))
+
+    def test_bulk_writes_are_versioned(self):
+        versao = referencia.versao_atual()
+        client = APIClient()
+        response = client.post(reverse('nome_do_app:codigoentrada-sync'), [
+            {'localizacao': 'Rua A', 'instalacao': 'I1', 'codigos_da_porta': '1234'},
+            {'localizacao': 'Rua C', 'instalacao': 'I3'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        _, delta = self.obter(params={'desde': versao})
+        self.assertEqual([codigo['instalacao'] for codigo in delta['codigos']], ['I3'])
+        self.assertEqual(AlteracaoReferencia.objects.filter(id__gt=versao).count(), 1)
@@ -1,12 +1,17 @@
-from django.http import HttpResponse
+import os
+
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_http_methods
 from rest_framework import viewsets, status, generics
 from rest_framework.response import Response
 from django.db import IntegrityError
 from rest_framework.decorators import action
 
 from .models import CodigoEntrada
-from .serializers import CodigoEntradaSerializer
+from . import referencia
+from .serializers import CodigoEntradaSerializer, CodigoEntradaSyncSerializer
+from .services import CodigoEntradaService
 
 
 def home(request):
@@ -16,6 +21,60 @@ def home(request):
     return render(request, 'home.html')
 
 
+def _cabecalhos_referencia(response, versao, codificacao=None):
+    response['ETag'] = referencia.etag(versao)
+    # Always revalidated: the same URL changes content with each version
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    if codificacao:
+        response['Content-Encoding'] = codificacao
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def pacote_referencia(request):
+    """
+    Pacote de dados de referência para os clientes offline: códigos de entrada, materiais,
+    tarifas e tipos de documento numa só resposta, com ETag da versão.
+
+    - If-None-Match com a ETag atual, ou ``?desde=<versao atual>``: 304.
+    - ``?desde=<versao>`` mais antiga: só as alterações (``"tipo": "delta"``).
+    - Caso contrário o pacote completo, servido do disco já comprimido (gzip/br).
+    """
+    versao = referencia.versao_atual()
+    etag = referencia.etag(versao)
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [valor.strip().replace('W/', '', 1) for valor in if_none_match.split(',')]:
+        return _cabecalhos_referencia(HttpResponse(status=304), versao)
+
+    codificacao = referencia.codificacao_aceite(request.headers.get('Accept-Encoding', ''))
+    desde = request.GET.get('desde')
+    if desde is not None:
+        try:
+            desde = int(desde)
+        except ValueError:
+            return JsonResponse({"error": "Parâmetro 'desde' inválido"}, status=400)
+        if desde == versao:
+            return _cabecalhos_referencia(HttpResponse(status=304), versao)
+        # A version ahead of ours (e.g. a restored database) gets the full bundle
+        dados = referencia.delta(desde, versao) if 0 <= desde < versao else None
+        if dados is not None:
+            conteudo = referencia.comprimir(referencia.serializar(dados), codificacao)
+            response = HttpResponse(conteudo, content_type='application/json')
+            return _cabecalhos_referencia(response, versao, codificacao)
+
+    ficheiro = referencia.abrir_completo(versao, codificacao)
+    tamanho = ficheiro.seek(0, os.SEEK_END)
+    ficheiro.seek(0)
+    if request.method == 'HEAD':
+        ficheiro.close()
+        response = HttpResponse(content_type='application/json')
+    else:
+        response = FileResponse(ficheiro, content_type='application/json')
+    response['Content-Length'] = str(tamanho)
+    return _cabecalhos_referencia(response, versao, codificacao)
+
+
 class CodigoEntradaViewSet(viewsets.ModelViewSet):
     """
     ViewSet para o modelo CodigoEntrada. Provê operações de CRUD completas:
@@ -110,17 +169,30 @@ class CodigoEntradaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def sync(self, request):
         """
-        Limpa todos os registros e insere novos. 
-        Neste exemplo, mantém o comportamento 'tudo ou nada'.
-        Se quiser partial success aqui também, basta usar lógica semelhante a 'create'.
+        Sincroniza a tabela com a lista enviada ('tudo ou nada'), pela chave 'instalacao':
+          - instalações novas são inseridas e as alteradas são atualizadas;
+          - instalações excluídas logicamente que voltam a vir são reativadas;
+          - as que deixaram de vir são marcadas como excluídas.
+        Responde com o número de linhas de cada tipo.
         """
-        # Atualizado para excluir logicamente em vez de apagar fisicamente
-        CodigoEntrada.objects.all().update(is_deleted=True)
-
-        serializer = self.get_serializer(data=request.data, many=True)
+        serializer = CodigoEntradaSyncSerializer(data=request.data, many=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        resumo = CodigoEntradaService.sincronizar(serializer.validated_data)
+        return Response(resumo, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Pesquisa para typeahead: ?q=<texto>&limit=<n> (por omissão 10, máximo 50).
+        Devolve só os campos necessários no terreno, ordenados por relevância.
+        """
+        try:
+            limite = int(request.query_params.get('limit', CodigoEntradaService.LIMITE_PESQUISA))
+        except ValueError:
+            return Response({"error": "Parâmetro 'limit' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, CodigoEntradaService.LIMITE_PESQUISA_MAXIMO))
+        resultados = CodigoEntradaService.pesquisar(request.query_params.get('q', ''), limite)
+        return Response(resultados)
 
 class CodigoListCreateAPIView(generics.ListCreateAPIView):
     serializer_class = CodigoEntradaSerializer